@@ -1,25 +1,18 @@
-import pandas as pd
 import glob
-import json
+import os
+import sys
 
-# Path to all CSV files
-csv_files = glob.glob('data/*.csv')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
 
-# List to hold DataFrames
-dfs = []
+import export
 
-for file in csv_files:
-    # Read each line as JSON
-    with open(file, 'r') as f:
-        data = [json.loads(line) for line in f]
-    
-    df = pd.DataFrame(data)
-    dfs.append(df)
+# Streams data/*.csv (one JSON reading per line) into one CSV without loading
+# it all; re-running only appends lines added since the previous run.
+# See export.py for DB/archive sources, filters and Parquet output.
+exported, state = export.export_jsonl(
+    sorted(p for p in glob.glob('data/*.csv')
+           if not p.endswith('combined_sensors.csv')),
+    'data/combined_sensors.csv'
+)
 
-# Combine all DataFrames
-combined_df = pd.concat(dfs, ignore_index=True)
-
-# Save to a single CSV
-combined_df.to_csv('data/combined_sensors.csv', index=False)
-
-print("✅ Combined CSV saved as data/combined_sensors.csv")
+print(f"✅ Combined CSV saved as data/combined_sensors.csv (+{exported} rows, {state['rows']} total)")
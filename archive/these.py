@@ -1,12 +1,22 @@
+import os
+import sys
 import sqlite3
 import time
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import storage
+from upload_cursor import init_cursor, advance_cursor
+
 DB_PATH = "C:/SQL_db/project.db"
+SINK = "app"
 
-conn = sqlite3.connect(DB_PATH)
+conn = storage.connect(DB_PATH, "pressure")
 conn.row_factory = sqlite3.Row
 cur = conn.cursor()
 
+last_uploaded_id = init_cursor(conn, SINK)
+
 def upload_to_app(row):
     print(f"Uploading -> ID:{row['id']} Time:{row['created_at']}")
     time.sleep(1)
@@ -15,21 +25,18 @@ def upload_to_app(row):
 while True:
     cur.execute("""
         SELECT * FROM brake_pressure_log
-        WHERE uploaded = 0
-        ORDER BY created_at ASC
+        WHERE id > ?
+        ORDER BY id ASC
         LIMIT 1
-    """)
+    """, (last_uploaded_id,))
     row = cur.fetchone()
 
     if  row:
         if upload_to_app(row):
-            cur.execute(
-                "UPDATE brake_pressure_log SET uploaded = 1 WHERE id = ?",
-                (row['id'],)
-            )
-            conn.commit()
-            print(f"Row {row['id']} marked uploaded (0)")
+            last_uploaded_id = row['id']
+            advance_cursor(conn, SINK, last_uploaded_id)
+            print(f"Row {row['id']} marked uploaded (cursor)")
     else:
         print("No data to upload")
 
-    time.sleep(2)
\ No newline at end of file
+    time.sleep(2)
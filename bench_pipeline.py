@@ -0,0 +1,466 @@
+"""End-to-end benchmark: synthetic capture -> SQLite -> QoS1 upload -> Lambda.
+
+Every stage is the production code path, run on its own thread:
+
+- capture: synthetic readings at --rate through GroupCommitWriter (with
+  the rollup hook) into a throwaway SQLite file
+- upload: the system_upload.py loop (cursor, BatchTimer, build_batch /
+  build_compact_batch, WindowedPublisher)
+- broker: an in-process MQTT stand-in with a configurable one-way delay
+  and PUBACK loss, delivering each message to lambda_handler
+- sink: lambda_function.lambda_handler with its Postgres connection
+  replaced by an in-memory fake
+
+    python3 bench_pipeline.py --rate 200 --duration 30 --out bench/$(git rev-parse --short HEAD).json
+    python3 bench_pipeline.py --rate 0 --format compact --compare bench/<previous>.json
+
+Latency is measured per reading, from generation to the sink commit.
+Write amplification is SQLite bytes written (write syscalls, per thread)
+divided by the logical size of the stored readings. CPU is per stage
+thread; RSS is for the whole process, since the stages share it.
+"""
+import argparse
+import heapq
+import itertools
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import storage
+from group_writer import GroupCommitWriter
+from payload_codec import timestamp_to_ms
+from publisher import WindowedPublisher
+from rollups import RollupHook
+from upload_batch import build_batch, build_compact_batch, BatchTimer
+from upload_cursor import init_cursor, advance_cursor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "lambda"))
+
+import lambda_function as lf
+
+LAYOUT = "pressure"
+CHANNELS = storage.LAYOUTS[LAYOUT]["columns"]
+SINK = "bench"
+ROW_BYTES = 8 * len(CHANNELS) + len("YYYY-MM-DD HH:MM:SS")   # logical size of one reading
+
+
+# ---------------- MEASUREMENT HELPERS ----------------
+def thread_io():
+    """Bytes written by the calling thread's syscalls (Linux only)."""
+    try:
+        with open("/proc/thread-self/io") as f:
+            for line in f:
+                if line.startswith("wchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except OSError:
+        return None
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Stage(threading.Thread):
+    """Thread that records its own CPU time and write bytes."""
+
+    def __init__(self, name, target):
+        super().__init__(name=name, daemon=True)
+        self._target_fn = target
+        self.cpu_s = 0.0
+        self.write_bytes = None
+        self.error = None
+
+    def run(self):
+        io_start = thread_io()
+        cpu_start = time.thread_time()
+        try:
+            self._target_fn()
+        except Exception as e:
+            self.error = repr(e)
+        finally:
+            self.cpu_s = time.thread_time() - cpu_start
+            io_end = thread_io()
+            if io_start is not None and io_end is not None:
+                self.write_bytes = io_end - io_start
+
+
+# ---------------- FAKE SINK ----------------
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, sql, params=None):
+        if sql.startswith("INSERT"):
+            self.conn.pending += len(params) // len(lf.COLUMNS)
+
+    def fetchall(self):
+        return [(1,)]
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    """In-memory stand-in for the pg8000 connection lambda_handler reuses."""
+
+    def __init__(self):
+        self.pending = 0
+        self.committed = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.committed += self.pending
+        self.pending = 0
+
+    def rollback(self):
+        self.pending = 0
+
+    def close(self):
+        pass
+
+
+# ---------------- BROKER STAND-IN ----------------
+class Broker(threading.Thread):
+    """Delivers each publish to the sink after ``delay`` and PUBACKs after 2x."""
+
+    def __init__(self, deliver, delay, ack_loss, seed=0):
+        super().__init__(name="broker", daemon=True)
+        self.deliver = deliver
+        self.delay = delay
+        self.ack_loss = ack_loss
+        self.on_ack = None
+        self.random = random.Random(seed)
+        self._events = []
+        self._seq = itertools.count()
+        self._mids = itertools.count(1)
+        self._cond = threading.Condition()
+        self._stop_event = threading.Event()
+        self.cpu_s = 0.0
+        self.published = 0
+        self.acks_lost = 0
+
+    def publish(self, payload):
+        mid = next(self._mids)
+        now = time.monotonic()
+        with self._cond:
+            heapq.heappush(self._events, (now + self.delay, next(self._seq), "deliver", mid, payload))
+            self.published += 1
+            self._cond.notify()
+        return mid
+
+    def stop(self):
+        self._stop_event.set()
+        with self._cond:
+            self._cond.notify()
+
+    def run(self):
+        cpu_start = time.thread_time()
+        while not self._stop_event.is_set():
+            with self._cond:
+                while not self._events and not self._stop_event.is_set():
+                    self._cond.wait(0.1)
+                if self._stop_event.is_set():
+                    break
+                due, _, kind, mid, payload = self._events[0]
+                wait = due - time.monotonic()
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+                heapq.heappop(self._events)
+
+            if kind == "deliver":
+                self.deliver(payload)
+                if self.random.random() < self.ack_loss:
+                    self.acks_lost += 1
+                    continue
+                with self._cond:
+                    heapq.heappush(self._events, (time.monotonic() + self.delay, next(self._seq), "ack", mid, None))
+            else:
+                self.on_ack(mid)
+        self.cpu_s = time.thread_time() - cpu_start
+
+
+# ---------------- BENCHMARK ----------------
+def run(args):
+    workdir = tempfile.mkdtemp(prefix="bench_pipeline_")
+    db_path = os.path.join(workdir, "bench.db")
+
+    gen_times = []                 # generation time of row id i at index i - 1
+    batch_ranges = {}              # payload -> (first_id, last_id)
+    delivered = bytearray()        # 1 once a row id reached the sink
+    latencies = []
+    done = threading.Event()
+    capture_done = threading.Event()
+    lock = threading.Lock()
+    last_delivery = [None]
+
+    # ---- sink ----
+    fake = FakeConnection()
+    lf.get_connection = lambda: fake
+
+    def deliver(payload):
+        response = lf.lambda_handler(payload, None)
+        now = time.monotonic()
+        if response["statusCode"] != 200:
+            return
+        first_id, last_id = batch_ranges[payload]
+        with lock:
+            for row_id in range(first_id, last_id + 1):
+                if not delivered[row_id - 1]:
+                    delivered[row_id - 1] = 1
+                    latencies.append(now - gen_times[row_id - 1])
+            last_delivery[0] = now
+
+    broker = Broker(deliver, args.delay_ms / 1000 / 2, args.ack_loss)
+
+    # ---- capture ----
+    def capture():
+        conn = storage.connect(db_path, LAYOUT)
+        writer = GroupCommitWriter(
+            conn, storage.TABLE, storage.reading_columns(LAYOUT),
+            max_rows=args.write_rows, max_delay=args.write_delay, hooks=[RollupHook(LAYOUT)]
+        )
+        values = [5.0] * len(CHANNELS)
+        rng = random.Random(1)
+        interval = 1 / args.rate if args.rate else 0
+        start = time.monotonic()
+        deadline = start
+        while time.monotonic() - start < args.duration:
+            if interval:
+                deadline += interval
+                delay = deadline - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            values = [max(0.0, v + rng.uniform(-0.05, 0.05)) for v in values]
+            now = time.monotonic()
+            with lock:
+                gen_times.append(now)
+                delivered.append(0)
+            writer.add((*values, storage.utc_timestamp()))
+        writer.close()
+        stages["capture"].commits = writer.commits
+        conn.close()
+        capture_done.set()
+
+    # ---- upload ----
+    def to_dict(row):
+        id_, bp, fp, cr, bc, created_at = row
+        return {"id": id_, "bp_pressure": bp, "fp_pressure": fp, "cr_pressure": cr,
+                "bc_pressure": bc, "created_at": str(created_at)}
+
+    def to_reading(row):
+        return row[0], timestamp_to_ms(row[-1]), row[1:-1]
+
+    def upload():
+        conn = storage.connect(db_path, LAYOUT)
+        last_uploaded_id = init_cursor(conn, SINK)
+        publisher = WindowedPublisher(broker.publish, window=args.window, ack_timeout=args.ack_timeout)
+        broker.on_ack = publisher.on_ack
+        timer = BatchTimer(args.batch_size, args.batch_wait)
+
+        while True:
+            publisher.resend_unacked(only_expired=True)
+            acked_id = publisher.collect_acked()
+            if acked_id is not None:
+                last_uploaded_id = acked_id
+                advance_cursor(conn, SINK, last_uploaded_id)
+
+            if capture_done.is_set() and last_uploaded_id >= len(gen_times):
+                break
+
+            if publisher.full():
+                time.sleep(0.001)
+                continue
+
+            next_id = publisher.last_sent_id if publisher.last_sent_id is not None else last_uploaded_id
+            rows = storage.fetch_pending(conn, LAYOUT, next_id, args.batch_size)
+            if capture_done.is_set() and rows:
+                timer.reset()
+                ready = True    # drain the tail without waiting for batch_wait
+            else:
+                ready = timer.ready(len(rows), time.monotonic())
+            if ready:
+                if args.format == "compact":
+                    payload, batch = build_compact_batch(rows, to_reading, CHANNELS, args.batch_size)
+                else:
+                    payload, batch = build_batch(rows, to_dict, args.batch_size)
+                batch_ranges[payload] = (batch[0][0], batch[-1][0])
+                publisher.send(payload, batch[-1][0])
+                timer.reset()
+                stages["upload"].payload_bytes += len(payload)
+                if len(batch) == args.batch_size:
+                    continue
+            time.sleep(0.001 if len(publisher) else 0.01)
+
+        stages["upload"].resent = publisher.resent
+        stages["upload"].mean_rtt = publisher.mean_rtt()
+        conn.close()
+        done.set()
+
+    stages = {"capture": Stage("capture", capture), "upload": Stage("upload", upload)}
+    stages["upload"].payload_bytes = 0
+
+    rss_samples = []
+    started = time.monotonic()
+    broker.start()
+    for stage in stages.values():
+        stage.start()
+
+    timeout = started + args.duration + args.drain_timeout
+    while not done.is_set() and time.monotonic() < timeout:
+        if any(stage.error for stage in stages.values()):
+            break
+        rss_samples.append(rss_mb())
+        done.wait(0.5)
+    for stage in stages.values():
+        stage.join(timeout=5)
+    broker.stop()
+    broker.join(timeout=5)
+
+    errors = {name: stage.error for name, stage in stages.items() if stage.error}
+    generated = len(gen_times)
+    latencies.sort()
+    elapsed = (last_delivery[0] or time.monotonic()) - started
+    capture = stages["capture"]
+    upload = stages["upload"]
+    logical = generated * ROW_BYTES
+    db_size = sum(
+        os.path.getsize(db_path + suffix) for suffix in ("", "-wal")
+        if os.path.exists(db_path + suffix)
+    )
+
+    result = {
+        "commit": git_commit(),
+        "timestamp": storage.utc_timestamp(),
+        "config": vars(args),
+        "errors": errors,
+        "generated": generated,
+        "delivered": len(latencies),
+        "throughput_rows_s": round(len(latencies) / elapsed, 1) if elapsed > 0 else None,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50) * 1000, 2) if latencies else None,
+            "p99": round(percentile(latencies, 99) * 1000, 2) if latencies else None,
+            "max": round(latencies[-1] * 1000, 2) if latencies else None,
+        },
+        "sqlite": {
+            "commits": getattr(capture, "commits", None),
+            "capture_write_bytes": capture.write_bytes,
+            "write_amplification": round(capture.write_bytes / logical, 2)
+            if capture.write_bytes and logical else None,
+            "upload_write_bytes": upload.write_bytes,
+            "db_bytes": db_size,
+        },
+        "upload": {
+            "messages": broker.published,
+            "payload_bytes_per_row": round(upload.payload_bytes / generated, 1) if generated else None,
+            "resent": getattr(upload, "resent", None),
+            "acks_lost": broker.acks_lost,
+            "mean_rtt_ms": round(getattr(upload, "mean_rtt", 0) * 1000, 2),
+            "sink_rows": fake.committed,
+        },
+        "cpu_s": {
+            "capture": round(capture.cpu_s, 3),
+            "upload": round(upload.cpu_s, 3),
+            "broker_and_sink": round(broker.cpu_s, 3),
+        },
+        "rss_mb": {
+            "peak": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            "end": round(rss_samples[-1], 1) if rss_samples and rss_samples[-1] else None,
+        },
+    }
+
+    if not args.keep:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+        os.rmdir(workdir)
+    return result
+
+
+# ---------------- REPORT ----------------
+def _flatten(d, prefix=""):
+    for key, value in d.items():
+        if isinstance(value, dict):
+            yield from _flatten(value, f"{prefix}{key}.")
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield f"{prefix}{key}", value
+
+
+def compare(previous, current):
+    old = dict(_flatten({k: v for k, v in previous.items() if k != "config"}))
+    print(f"\nvs {previous.get('commit')} ({previous.get('timestamp')}):")
+    for key, value in _flatten({k: v for k, v in current.items() if k != "config"}):
+        before = old.get(key)
+        if before:
+            print(f"  {key:<36} {before:>12} -> {value:<12} ({(value - before) / before:+.1%})")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rate", type=float, default=100, help="readings/s (0 = as fast as possible)")
+    parser.add_argument("--duration", type=float, default=20, help="capture seconds")
+    parser.add_argument("--drain-timeout", type=float, default=30)
+    parser.add_argument("--write-rows", type=int, default=50)
+    parser.add_argument("--write-delay", type=float, default=5.0)
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--batch-wait", type=float, default=1.0)
+    parser.add_argument("--format", default="json", choices=("json", "compact"))
+    parser.add_argument("--window", type=int, default=8)
+    parser.add_argument("--ack-timeout", type=float, default=5.0)
+    parser.add_argument("--delay-ms", type=float, default=40, help="broker round trip")
+    parser.add_argument("--ack-loss", type=float, default=0.0, help="fraction of PUBACKs dropped")
+    parser.add_argument("--out", help="write the result JSON here")
+    parser.add_argument("--compare", help="previous result JSON to diff against")
+    parser.add_argument("--keep", action="store_true", help="keep the benchmark database")
+    args = parser.parse_args(argv)
+
+    result = run(args)
+    print(json.dumps(result, indent=2))
+
+    if args.out:
+        folder = os.path.dirname(args.out)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        with open(args.out, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"✅ Saved {args.out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), result)
+
+    return 1 if result["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
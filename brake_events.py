@@ -0,0 +1,247 @@
+import json
+import math
+import os
+from collections import deque
+
+import storage
+
+# ---------------- STATES (brake_status) ----------------
+IDLE = "idle"              # released, BP charged
+APPLYING = "applying"      # BP dropped, waiting for BC to settle
+APPLIED = "applied"
+RELEASING = "releasing"    # BP recharging, waiting for BC to exhaust
+
+# ---------------- EVENTS (event_trigger / brake_fault) ----------------
+APPLICATION = "application"
+RELEASE = "release"
+FAULT = "fault"
+
+NO_FAULT = "none"
+BC_NOT_FOLLOWING = "bc_not_following"      # BP dropped but BC did not build up
+BC_NOT_RELEASING = "bc_not_releasing"      # BP recharged but BC stayed up
+BC_WITHOUT_BP = "bc_without_bp"            # BC built up with BP still charged
+CR_LEAK = "cr_leak"                        # control reservoir falling
+
+CHANNELS = ("bp", "fp", "cr", "bc")
+COLUMNS = ("bp_pressure", "fp_pressure", "cr_pressure", "bc_pressure")
+
+# ---------------- THRESHOLDS ----------------
+# Pressures in bar, rates in bar/s, times in seconds
+APPLY_DROP = float(os.environ.get("BRAKE_APPLY_DROP", 0.2))          # BP below its charged level = application
+RELEASE_DROP = 0.1                         # BP back within this of the charged level = release
+BP_RELEASE_RATE = 0.1                      # ...or rising at least this fast
+BC_APPLIED = float(os.environ.get("BRAKE_BC_APPLIED", 0.8))          # BC at or above = brake applied
+BC_RELEASED = float(os.environ.get("BRAKE_BC_RELEASED", 0.4))        # BC at or below = brake released
+BC_SETTLED_RATE = 0.05                     # BC changing slower than this = application finished
+BC_RESPONSE_TIMEOUT = float(os.environ.get("BRAKE_BC_RESPONSE_TIMEOUT", 10))
+BC_RELEASE_TIMEOUT = float(os.environ.get("BRAKE_BC_RELEASE_TIMEOUT", 30))
+CR_LEAK_RATE = float(os.environ.get("BRAKE_CR_LEAK_RATE", 0.005))    # CR falling faster than this = leak
+
+SMOOTHING = 0.2                            # time constant of the value tracks
+RATE_SMOOTHING = 0.5                       # ...and of their rates
+CR_RATE_SMOOTHING = 30.0                   # CR leaks are slow; average its rate longer
+BP_REFERENCE_DECAY = 60.0                  # charged-BP level follows slow drift down with this time constant
+START_DROP = 0.05                          # an application is timed from BP leaving this band
+
+# ---------------- WINDOWS ----------------
+WINDOW_STEP = float(os.environ.get("BRAKE_WINDOW_STEP", 0.1))        # seconds between window samples
+PRE_SECONDS = float(os.environ.get("BRAKE_PRE_SECONDS", 5))
+POST_SECONDS = float(os.environ.get("BRAKE_POST_SECONDS", 10))
+WINDOW_DECIMALS = 2
+
+
+# ---------------- TRACKS ----------------
+class _Track:
+    """Exponentially smoothed value and rate of one channel, O(1) per sample."""
+
+    def __init__(self, tau=SMOOTHING, rate_tau=RATE_SMOOTHING):
+        self.tau = tau
+        self.rate_tau = rate_tau
+        self.value = None
+        self.rate = 0.0
+        self._t = None
+
+    def update(self, t, x):
+        if self.value is None:
+            self.value, self._t = x, t
+            return
+        dt = t - self._t
+        if dt <= 0:
+            return
+        previous = self.value
+        self.value += (1.0 - math.exp(-dt / self.tau)) * (x - previous)
+        self.rate += (1.0 - math.exp(-dt / self.rate_tau)) * ((self.value - previous) / dt - self.rate)
+        self._t = t
+
+
+# ---------------- DETECTOR ----------------
+class BrakeEventDetector:
+    """Brake application, release and fault events from BP/FP/CR/BC pressures.
+
+    ``add(t, bp, fp, cr, bc)`` does constant work per sample and returns
+    the events completed by it. An application starts when BP falls
+    ``APPLY_DROP`` below its charged level and ends when BC has built up
+    and settled; the release when BP recharges and BC exhausts. Each is
+    timed from the moment BP left its previous level.
+
+    Each event is a dict shaped like a brake_data row (``brake_status``,
+    ``brake_fault``, ``brake_time``, ``event_trigger``, the four pressures
+    at the event) plus ``duration`` and a ``window`` of samples every
+    ``WINDOW_STEP`` s from ``PRE_SECONDS`` before to ``POST_SECONDS`` after.
+    Events are returned once their post-event window is complete.
+    """
+
+    def __init__(self, window_step=WINDOW_STEP, pre_seconds=PRE_SECONDS, post_seconds=POST_SECONDS):
+        self.window_step = window_step
+        self.post_seconds = post_seconds
+        self.tracks = {name: _Track() for name in CHANNELS}
+        self.tracks["cr"].rate_tau = CR_RATE_SMOOTHING
+
+        self.state = IDLE
+        self.bp_charged = None                 # BP level while released
+        self._left_at = None                   # last time BP was at its previous level
+        self._last_t = None
+        self._latched = set()                  # faults already reported, until they clear
+
+        self._pre = deque(maxlen=int(pre_seconds / window_step) + 1)
+        self._pending = []
+        self._window_at = None
+        self.events = 0
+
+    # ---------- per sample ----------
+    def add(self, t, bp, fp, cr, bc):
+        values = (bp, fp, cr, bc)
+        for name, value in zip(CHANNELS, values):
+            self.tracks[name].update(t, value)
+
+        started = self._detect(t)
+        done = self._window(t, values)
+        for event in started:
+            self._pending.append((t + self.post_seconds, event, list(self._pre), []))
+        return done
+
+    def flush(self):
+        """Events still waiting for their post-event window, finished early."""
+        done = [self._finish(*pending) for pending in self._pending]
+        self._pending = []
+        return done
+
+    # ---------- state machine ----------
+    def _detect(self, t):
+        bp, cr, bc = self.tracks["bp"], self.tracks["cr"], self.tracks["bc"]
+        if self.bp_charged is None:
+            self.bp_charged = bp.value
+            self._left_at = self._last_t = t
+        dt, self._last_t = t - self._last_t, t
+        drop = self.bp_charged - bp.value
+        events = []
+
+        if self.state == IDLE:
+            # The charged level follows BP up at once and down only slowly
+            if bp.value >= self.bp_charged:
+                self.bp_charged = bp.value
+            else:
+                self.bp_charged -= (1.0 - math.exp(-dt / BP_REFERENCE_DECAY)) * drop
+            if drop < START_DROP:
+                self._left_at = t
+
+            if drop >= APPLY_DROP:
+                self.state = APPLYING
+            elif bc.value >= BC_APPLIED:
+                events += self._fault(t, BC_WITHOUT_BP)
+            elif bc.value <= BC_RELEASED:
+                self._latched.discard(BC_WITHOUT_BP)
+
+        elif self.state == APPLYING:
+            if bc.value >= BC_APPLIED and abs(bc.rate) <= BC_SETTLED_RATE:
+                events.append(self._event(t, APPLICATION, APPLIED, t - self._left_at))
+                self.state = APPLIED
+            elif drop <= RELEASE_DROP:
+                # BP recovered before BC built up: a dip, not an application
+                self.state = IDLE
+            elif t - self._left_at >= BC_RESPONSE_TIMEOUT and bc.value < BC_APPLIED:
+                events += self._fault(t, BC_NOT_FOLLOWING)
+                self.state = APPLIED
+
+        if self.state == APPLIED:
+            if drop <= RELEASE_DROP or bp.rate >= BP_RELEASE_RATE:
+                self._left_at = t
+                self.state = RELEASING
+
+        elif self.state == RELEASING:
+            if drop >= APPLY_DROP and bp.rate < 0:
+                # Re-applied before BC had exhausted
+                self.state = APPLIED
+            elif bc.value <= BC_RELEASED:
+                events.append(self._event(t, RELEASE, IDLE, t - self._left_at))
+                self._latched.discard(BC_NOT_FOLLOWING)
+                self._latched.discard(BC_NOT_RELEASING)
+                self.bp_charged = bp.value
+                self._left_at = t
+                self.state = IDLE
+            elif t - self._left_at >= BC_RELEASE_TIMEOUT:
+                events += self._fault(t, BC_NOT_RELEASING)
+
+        if cr.rate <= -CR_LEAK_RATE:
+            events += self._fault(t, CR_LEAK)
+        elif cr.rate >= 0:
+            self._latched.discard(CR_LEAK)
+        return events
+
+    def _fault(self, t, fault):
+        if fault in self._latched:
+            return []
+        self._latched.add(fault)
+        return [self._event(t, FAULT, self.state, None, fault)]
+
+    def _event(self, t, trigger, status, duration, fault=NO_FAULT):
+        self.events += 1
+        timestamp = storage.utc_timestamp(t)
+        event = {
+            "created_at": timestamp,
+            "brake_time": timestamp,
+            "event_trigger": trigger,
+            "brake_status": status,
+            "brake_fault": fault,
+            "duration": round(duration, 2) if duration is not None else None,
+        }
+        for column, name in zip(COLUMNS, CHANNELS):
+            event[column] = round(self.tracks[name].value, WINDOW_DECIMALS)
+        return event
+
+    # ---------- windows ----------
+    def _window(self, t, values):
+        if self._window_at is None or t - self._window_at >= 2 * self.window_step:
+            self._window_at = t                     # start, or resync after a gap
+        elif t - self._window_at < self.window_step:
+            return []
+        else:
+            self._window_at += self.window_step     # fixed grid, no drift from the sample rate
+        sample = [round(v, WINDOW_DECIMALS) for v in values]
+        self._pre.append(sample)
+
+        done = []
+        for pending in self._pending:
+            pending[3].append(sample)
+        while self._pending and t >= self._pending[0][0]:
+            done.append(self._finish(*self._pending.pop(0)))
+        return done
+
+    def _finish(self, until, event, pre, post):
+        event["window"] = {
+            "step": self.window_step,
+            "channels": CHANNELS,
+            "pre": pre,
+            "post": post,
+        }
+        samples = pre + post
+        if samples:
+            event["summary"] = {
+                name: [min(column), max(column), round(sum(column) / len(column), WINDOW_DECIMALS)]
+                for name, column in zip(CHANNELS, zip(*samples))
+            }
+        return event
+
+
+def to_json(event):
+    return json.dumps(event, separators=(",", ":"))
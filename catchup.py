@@ -0,0 +1,278 @@
+import time
+
+import metrics
+import storage
+from retention import iter_archive
+from upload_batch import AWS_IOT_MAX_PAYLOAD, PAYLOAD_HEADROOM, BatchTimer, TokenBucket
+from upload_cursor import get_cursor, highest_acked, next_gap, pending_count, record_acked
+
+# ---------------- DEFAULTS ----------------
+DEFAULT_BACKLOG_BATCH = 500                  # rows per backlog publish
+DEFAULT_BACKLOG_RATE = 16 * 1024             # backlog bytes per second (0 = uncapped)
+DEFAULT_JUMP_ROWS = 1000                     # live lane this far behind skips ahead
+DEFAULT_BACKLOG_RECHECK = 30.0               # seconds between checks once caught up
+
+LIVE = "live"
+BACKLOG = "backlog"
+
+LANE_ROWS = "upload_lane_rows"
+LANE_BYTES = "upload_lane_bytes"
+LIVE_JUMPS = metrics.counter("upload_live_jumps", "Times the live lane skipped ahead, leaving rows to the backlog")
+LIVE_LAG = metrics.gauge("upload_live_lag_rows", "Stored rows the live lane has not sent yet")
+ARCHIVE_ROWS = metrics.counter("upload_archive_rows", "Backlog rows read back from the retention archive")
+
+
+class _ArchivedRow(tuple):
+    """An archived row shaped like fetch_pending()'s: indexable like a
+    tuple and, like sqlite3.Row, by column name."""
+
+    def __new__(cls, columns, row):
+        self = super().__new__(cls, (row[column] for column in columns))
+        self._index = {column: i for i, column in enumerate(columns)}
+        return self
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            key = self._index[key]
+        return super().__getitem__(key)
+
+    def keys(self):
+        return list(self._index)
+
+
+# ---------------- LANE ----------------
+class Lane:
+    """One stream of batches over its own WindowedPublisher.
+
+    ``after_id`` is the highest id the lane has sent or passed over. Ids
+    between ``_mark`` and the publisher's acked prefix are delivered: the
+    lane's own batches, plus anything it skipped because it was already
+    acked. ``collect()`` records that span as one acked range.
+    """
+
+    def __init__(self, name, publisher, after_id):
+        self.name = name
+        self.publisher = publisher
+        self.after_id = after_id
+        self._mark = after_id
+
+        labels = {"lane": name}
+        self._rows = metrics.counter(LANE_ROWS, "Rows published, by upload lane", labels)
+        self._bytes = metrics.counter(LANE_BYTES, "Payload bytes published, by upload lane", labels)
+
+    def __len__(self):
+        return len(self.publisher)
+
+    def floor(self):
+        """Lowest id this lane still owns."""
+        return (self._mark if len(self.publisher) else self.after_id) + 1
+
+    def send(self, payload, batch, after_id):
+        """Publish ``batch``; every id in ``(after_id, first row)`` is already acked."""
+        if not len(self.publisher):
+            self._mark = after_id
+        last_id = batch[-1][0]
+        self.publisher.send(payload, last_id)
+        self.after_id = last_id
+        self._rows.inc(len(batch))
+        self._bytes.inc(len(payload))
+
+    def collect(self, conn, sink):
+        """Record newly acked batches; return the sink's cursor, or None."""
+        acked_id = self.publisher.collect_acked()
+        if acked_id is None:
+            return None
+        cursor = record_acked(conn, sink, self._mark + 1, acked_id)
+        self._mark = acked_id
+        return cursor
+
+    def jump(self, after_id):
+        """Continue after ``after_id`` (only once nothing is in flight)."""
+        self.after_id = self._mark = after_id
+
+
+# ---------------- TWO-LANE UPLOADER ----------------
+class CatchUpUploader:
+    """Live readings first, an outage backlog in the background.
+
+    The live lane sends new rows as they are stored, in normal-sized
+    batches. When it is more than ``jump_rows`` behind (at start-up after
+    an outage, or after one while running) it lets its in-flight batches
+    settle and skips to the newest row. Everything it passes over is left
+    to the backlog lane, which drains the unacked ids below the live lane
+    oldest first, in large batches, under a ``backlog_rate`` bytes/s cap.
+
+    Acked batches are stored as id ranges (see upload_cursor), so after a
+    restart neither lane sends what was already acknowledged; only the
+    batches in flight at the time go again (QoS1, at least once).
+
+    ``build_payload(rows, max_rows, max_bytes)`` returns ``(payload,
+    rows_included)`` and rows must have the id first, as fetch_pending()
+    returns them.
+
+    With ``archive_dir``, ids missing from the table are looked up in the
+    retention archive before the backlog lane counts them as delivered:
+    under disk pressure retention archives rows that were never uploaded.
+    """
+
+    def __init__(self, conn, sink, layout, build_payload, live_publisher, backlog_publisher,
+                 batch_size, max_bytes, max_wait,
+                 backlog_batch_size=DEFAULT_BACKLOG_BATCH,
+                 backlog_max_bytes=AWS_IOT_MAX_PAYLOAD - PAYLOAD_HEADROOM,
+                 backlog_rate=DEFAULT_BACKLOG_RATE, jump_rows=DEFAULT_JUMP_ROWS,
+                 backlog_recheck=DEFAULT_BACKLOG_RECHECK, archive_dir=None, clock=time.monotonic):
+        self.conn = conn
+        self.sink = sink
+        self.layout = layout
+        self.build_payload = build_payload
+        self.batch_size = batch_size
+        self.max_bytes = max_bytes
+        self.backlog_batch_size = backlog_batch_size
+        self.backlog_max_bytes = backlog_max_bytes
+        self.jump_rows = jump_rows
+        self.backlog_recheck = backlog_recheck
+        self.archive_dir = archive_dir
+        self.clock = clock
+
+        self.timer = BatchTimer(batch_size, max_wait)
+        self.bucket = TokenBucket(backlog_rate, clock=clock)
+        self.backlog_paused = False
+        self._base = (batch_size, max_bytes, max_wait, backlog_batch_size, backlog_max_bytes,
+                      backlog_rate, live_publisher.window, backlog_publisher.window)
+        self.jumps = 0
+        self._backlog_bytes = 0                # size of the last backlog payload
+        self._backlog_idle_until = 0.0
+
+        live_start = highest_acked(conn, sink)
+        if pending_count(conn, sink, storage.TABLE) > jump_rows:
+            live_start = max(live_start, self._max_id())
+        self.live = Lane(LIVE, live_publisher, live_start)
+        self.backlog = Lane(BACKLOG, backlog_publisher, get_cursor(conn, sink))
+
+    def __len__(self):
+        return len(self.live) + len(self.backlog)
+
+    def adapt(self, profile):
+        """Scale batch sizes, windows, pacing and the backlog cap from their
+        configured values by a linkquality.LinkProfile."""
+        (batch_size, max_bytes, max_wait, backlog_batch_size, backlog_max_bytes,
+         backlog_rate, live_window, backlog_window) = self._base
+
+        self.batch_size = self.timer.batch_size = max(1, int(batch_size * profile.batch_scale))
+        self.max_bytes = max(1024, int(max_bytes * profile.bytes_scale))
+        self.timer.max_wait = max_wait * profile.max_wait_scale
+        self.backlog_batch_size = max(1, int(backlog_batch_size * profile.batch_scale))
+        self.backlog_max_bytes = max(1024, int(backlog_max_bytes * profile.bytes_scale))
+        self.live.publisher.window = max(1, int(live_window * profile.window_scale))
+        self.backlog.publisher.window = max(1, int(backlog_window * profile.window_scale))
+
+        self.backlog_paused = profile.backlog_share <= 0
+        if backlog_rate > 0:
+            self.bucket.rate = backlog_rate * profile.backlog_share
+
+    def _archived(self, after_id, before_id, limit=None):
+        """Archived rows with ``after_id < id < before_id``, at most a backlog batch."""
+        if self.archive_dir is None:
+            return []
+        columns = ("id",) + storage.reading_columns(self.layout)
+        limit = limit or self.backlog_batch_size
+        rows = []
+        for row in iter_archive(self.archive_dir, self.layout, after_id=after_id, before_id=before_id):
+            rows.append(_ArchivedRow(columns, row))
+            if len(rows) >= limit:
+                break
+        return rows
+
+    def _max_id(self):
+        return self.conn.execute(f"SELECT MAX(id) FROM {storage.TABLE}").fetchone()[0] or 0
+
+    # ---------- acks ----------
+    def resend_unacked(self, only_expired=False):
+        return sum(
+            lane.publisher.resend_unacked(only_expired=only_expired)
+            for lane in (self.live, self.backlog)
+        )
+
+    def collect_acked(self):
+        """Record acked batches of both lanes; return the cursor if it was touched."""
+        cursor = None
+        for lane in (self.live, self.backlog):
+            lane_cursor = lane.collect(self.conn, self.sink)
+            if lane_cursor is not None:
+                cursor = lane_cursor
+        return cursor
+
+    # ---------- sending ----------
+    def step(self):
+        """Publish what is due on each lane; return the number of rows sent."""
+        now = self.clock()
+        return self._step_live(now) + self._step_backlog(now)
+
+    def _step_live(self, now):
+        lane = self.live
+        if lane.publisher.full():
+            return 0
+
+        lag = self._max_id() - lane.after_id
+        LIVE_LAG.set(max(lag, 0))
+        if lag > self.jump_rows:
+            if not len(lane):
+                lane.jump(lane.after_id + lag)
+                self.jumps += 1
+                LIVE_JUMPS.inc()
+                self._backlog_idle_until = 0.0
+            return 0
+
+        rows = storage.fetch_pending(self.conn, self.layout, lane.after_id, self.batch_size)
+        if rows and rows[0][0] > lane.after_id + 1 and self._archived(lane.after_id, rows[0][0], limit=1):
+            # Sending would count the archived ids below as delivered: leave
+            # them to the backlog lane and continue above them
+            if not len(lane):
+                lane.jump(rows[0][0] - 1)
+                self._backlog_idle_until = 0.0
+            return 0
+        if not self.timer.ready(len(rows), now):
+            return 0
+
+        payload, batch = self.build_payload(rows, self.batch_size, self.max_bytes)
+        lane.send(payload, batch, lane.after_id)
+        self.timer.reset()
+        return len(batch)
+
+    def _step_backlog(self, now):
+        lane = self.backlog
+        if self.backlog_paused or lane.publisher.full() or now < self._backlog_idle_until:
+            return 0
+        if self.bucket.delay(self._backlog_bytes) > 0:
+            return 0
+
+        after_id, before_id = next_gap(self.conn, self.sink, lane.after_id)
+        ceiling = self.live.floor()
+        before_id = ceiling if before_id is None else min(before_id, ceiling)
+        if after_id + 1 >= before_id:
+            if not len(lane):
+                # Caught up. Rows only land below the live lane again when it
+                # jumps, so rescan from the cursor now and then.
+                lane.jump(get_cursor(self.conn, self.sink))
+                self._backlog_idle_until = now + self.backlog_recheck
+            return 0
+
+        rows = storage.fetch_pending(
+            self.conn, self.layout, after_id, self.backlog_batch_size, before_id=before_id
+        )
+        if not rows or rows[0][0] > after_id + 1:
+            # Ids missing below the first stored row may have been archived before upload
+            archived = self._archived(after_id, rows[0][0] if rows else before_id)
+            if archived:
+                rows = archived
+                ARCHIVE_ROWS.inc(len(rows))
+        if not rows:
+            # Nothing stored or archived in the gap (ids never used, or pruned)
+            record_acked(self.conn, self.sink, after_id + 1, before_id - 1)
+            return 0
+
+        payload, batch = self.build_payload(rows, self.backlog_batch_size, self.backlog_max_bytes)
+        lane.send(payload, batch, after_id)
+        self.bucket.consume(len(payload))
+        self._backlog_bytes = len(payload)
+        return len(batch)
@@ -0,0 +1,179 @@
+import json
+import os
+from collections import namedtuple
+
+from filters import parse_chain
+from pressure_lut import GAIN_FULL_SCALE, Calibration, PressureConverter
+from sampler import ADS_DATA_RATES, DEFAULT_DATA_RATE, MUX_CODES, ADCBank
+
+# ---------------- CONFIG ----------------
+CHANNELS_CONFIG = os.environ.get("CHANNELS_CONFIG")   # JSON channel registry (see channels.example.json)
+
+# ADS1115 I2C addresses, set by wiring ADDR to GND, VDD, SDA or SCL
+ADS_ADDRESSES = (0x48, 0x49, 0x4A, 0x4B)
+DEFAULT_ADDRESS = 0x48
+
+
+# ---------------- CHANNEL ----------------
+# column: the matching column of a wide storage layout, if it has one
+# filters: "name:arg" filter chain (see filters.py), empty for the default
+Channel = namedtuple("Channel", "name address mux gain data_rate calibration column filters", defaults=((),))
+
+# The four fixed channels the capture scripts used before the registry
+DEFAULT_CHANNELS = {
+    "pressure": (
+        ("bp", "0", "bp_pressure"),
+        ("fp", "1", "fp_pressure"),
+        ("cr", "2", "cr_pressure"),
+        ("bc", "3", "bc_pressure"),
+    ),
+    "raw": (
+        ("bp", "0", "BP_raw"),
+        ("bc", "3", "BC_raw"),
+        ("fp", "1", "FP_raw"),
+        ("cr", "2", "CR_raw"),
+    ),
+}
+
+
+def _parse_channel(spec):
+    name = spec.get("name")
+    if not name:
+        raise ValueError(f"channel without a name: {spec!r}")
+
+    address = spec.get("address", DEFAULT_ADDRESS)
+    if isinstance(address, str):
+        address = int(address, 0)
+    if address not in ADS_ADDRESSES:
+        raise ValueError(f"{name}: address must be one of {[hex(a) for a in ADS_ADDRESSES]}")
+
+    mux = str(spec.get("mux", "0"))
+    if mux not in MUX_CODES:
+        raise ValueError(f"{name}: mux must be one of {sorted(MUX_CODES)}")
+
+    gain = spec.get("gain", 1)
+    if gain == "2/3":
+        gain = 2 / 3
+    if gain not in GAIN_FULL_SCALE:
+        raise ValueError(f"{name}: gain must be one of {sorted(GAIN_FULL_SCALE)}")
+
+    data_rate = spec.get("data_rate", DEFAULT_DATA_RATE)
+    if data_rate not in ADS_DATA_RATES:
+        raise ValueError(f"{name}: data_rate must be one of {ADS_DATA_RATES}")
+
+    try:
+        filters = tuple(f"{stage}:{arg}" for stage, arg in parse_chain(spec.get("filters", ())))
+    except ValueError as e:
+        raise ValueError(f"{name}: {e}") from None
+
+    calibration = Calibration(gain=gain, **spec.get("calibration", {}))
+    return Channel(name, address, mux, gain, data_rate, calibration, spec.get("column"), filters)
+
+
+# ---------------- REGISTRY ----------------
+class ChannelRegistry:
+    """Every analog channel the device captures, in frame order.
+
+    Frames from the sampler hold one value per channel in this order.
+    Up to four ADS1115s (0x48–0x4B) with four inputs each.
+    """
+
+    def __init__(self, channels):
+        self.channels = tuple(channels)
+        names = [channel.name for channel in self.channels]
+        if len(set(names)) != len(names):
+            raise ValueError("channel names must be unique")
+        inputs = [(channel.address, channel.mux) for channel in self.channels]
+        if len(set(inputs)) != len(inputs):
+            raise ValueError("two channels read the same ADC input")
+
+    def __len__(self):
+        return len(self.channels)
+
+    def __iter__(self):
+        return iter(self.channels)
+
+    @property
+    def names(self):
+        return tuple(channel.name for channel in self.channels)
+
+    @property
+    def addresses(self):
+        return tuple(sorted({channel.address for channel in self.channels}))
+
+    def wide_order(self, columns):
+        """Frame indices in the order of a wide layout's ``columns``.
+
+        None if the channels do not map one-to-one onto those columns,
+        in which case readings can only go to the narrow table.
+        """
+        index = {channel.column: i for i, channel in enumerate(self.channels)}
+        if len(self.channels) != len(columns) or set(index) != set(columns):
+            return None
+        return tuple(index[column] for column in columns)
+
+    def converter(self, order=None):
+        """PressureConverter for the channels, optionally reordered."""
+        channels = self.channels if order is None else [self.channels[i] for i in order]
+        return PressureConverter([channel.calibration for channel in channels])
+
+    def config_rows(self):
+        """``(name, config_json)`` for storage.register_channels()."""
+        return [(spec.pop("name"), json.dumps(spec, sort_keys=True)) for spec in self.to_dicts()]
+
+    def to_dicts(self):
+        return [
+            {
+                "name": channel.name,
+                "address": channel.address,
+                "mux": channel.mux,
+                "gain": channel.gain,
+                "data_rate": channel.data_rate,
+                "calibration": {
+                    "resistor": channel.calibration.resistor,
+                    "pressure_range": channel.calibration.pressure_range,
+                    "full_scale_voltage": channel.calibration.full_scale_voltage,
+                },
+                "column": channel.column,
+                "filters": list(channel.filters),
+            }
+            for channel in self.channels
+        ]
+
+
+def default_registry(layout, gain=1, data_rate=DEFAULT_DATA_RATE):
+    return ChannelRegistry(
+        Channel(name, DEFAULT_ADDRESS, mux, gain, data_rate, Calibration(gain=gain), column)
+        for name, mux, column in DEFAULT_CHANNELS[layout]
+    )
+
+
+def load_registry(path=CHANNELS_CONFIG, layout="pressure"):
+    """Channels from a JSON file, or the layout's four default channels.
+
+    The file holds ``{"channels": [{"name": ..., "address": "0x49",
+    "mux": "2", "gain": 1, "data_rate": 860, "calibration": {"resistor":
+    160, "pressure_range": 10}, "column": ..., "filters": ["median:5",
+    "ema:0.2"]}, ...]}``; everything but ``name`` has a default.
+    """
+    if not path:
+        return default_registry(layout)
+    with open(path, encoding="utf-8") as f:
+        config = json.load(f)
+    return ChannelRegistry(_parse_channel(spec) for spec in config["channels"])
+
+
+# ---------------- HARDWARE ----------------
+def open_adcs(registry):
+    """One ADS1115 driver per address in the registry (needs Blinka)."""
+    import board
+    import busio
+    import adafruit_ads1x15.ads1115 as ADS
+
+    i2c = busio.I2C(board.SCL, board.SDA)
+    return {address: ADS.ADS1115(i2c, address=address) for address in registry.addresses}
+
+
+def open_bank(registry):
+    """ADCBank reading every registry channel (raises without the hardware)."""
+    return ADCBank(open_adcs(registry), registry.channels)
@@ -0,0 +1,119 @@
+import math
+
+# ---------------- SWINGING DOOR ----------------
+class SwingingDoor:
+    """Swinging-door trending for one channel.
+
+    Emits a point only when the current segment can no longer be extended,
+    so that linear interpolation between consecutive archived points stays
+    within ``deviation`` of every input sample. Archived values lie on the
+    door mid-line rather than being raw samples, which keeps the bound
+    strict. ``max_interval`` (seconds) forces a point at least that often
+    so a flat signal still shows up.
+    """
+
+    def __init__(self, deviation, max_interval=None):
+        self.deviation = deviation
+        self.max_interval = max_interval
+        self._anchor = None          # last archived (t, v)
+        self._prev = None            # last received (t, v), not yet archived
+        self._slope_hi = math.inf
+        self._slope_lo = -math.inf
+
+    def _open_doors(self, t, v):
+        t0, v0 = self._anchor
+        dt = t - t0
+        self._slope_hi = (v + self.deviation - v0) / dt
+        self._slope_lo = (v - self.deviation - v0) / dt
+
+    def _on_line(self, t):
+        # Point on the mid-line of the current door window: every sample
+        # since the anchor is within ``deviation`` of anchor -> this point.
+        t0, v0 = self._anchor
+        return (t, v0 + (self._slope_hi + self._slope_lo) / 2 * (t - t0))
+
+    def add(self, t, v):
+        """Feed one sample; return the list of ``(t, v)`` points to archive."""
+        if self._anchor is None:
+            self._anchor = (t, v)
+            self._prev = None
+            return [(t, v)]
+
+        t0, v0 = self._anchor
+        dt = t - t0
+        if dt <= 0:
+            return []
+
+        hi = min(self._slope_hi, (v + self.deviation - v0) / dt)
+        lo = max(self._slope_lo, (v - self.deviation - v0) / dt)
+
+        if lo > hi:
+            # Doors swung past parallel: close the segment at the previous sample
+            archived = self._on_line(self._prev[0])
+            self._anchor = archived
+            self._prev = (t, v)
+            self._open_doors(t, v)
+            return [archived]
+
+        self._slope_hi, self._slope_lo = hi, lo
+
+        if self.max_interval is not None and dt >= self.max_interval:
+            archived = self._on_line(t)
+            self._anchor = archived
+            self._prev = None
+            self._slope_hi, self._slope_lo = math.inf, -math.inf
+            return [archived]
+
+        self._prev = (t, v)
+        return []
+
+    def flush(self):
+        """Archive the pending tail sample (call on shutdown)."""
+        if self._prev is None:
+            return []
+        archived = self._on_line(self._prev[0])
+        self._anchor = archived
+        self._prev = None
+        self._slope_hi, self._slope_lo = math.inf, -math.inf
+        return [archived]
+
+
+# ---------------- MULTI-CHANNEL STAGE ----------------
+class StreamCompressor:
+    """One swinging door per channel, merged back into rows.
+
+    ``add()`` returns ``[(t, values), ...]`` where ``values`` holds the
+    archived value for channels that needed a point at ``t`` and ``None``
+    for the others. ``decimals`` rounds archived values (0 gives ints, for
+    raw ADC counts); the rounding error comes on top of the deviation.
+    """
+
+    def __init__(self, deviations, max_interval=None, decimals=None):
+        self.doors = [SwingingDoor(d, max_interval) for d in deviations]
+        self.decimals = decimals
+        self.points_in = 0
+        self.points_out = 0
+
+    def _merge(self, emitted):
+        rows = {}
+        for channel, points in enumerate(emitted):
+            for t, v in points:
+                if self.decimals == 0:
+                    v = round(v)
+                elif self.decimals is not None:
+                    v = round(v, self.decimals)
+                rows.setdefault(t, [None] * len(self.doors))[channel] = v
+                self.points_out += 1
+        return [(t, tuple(rows[t])) for t in sorted(rows)]
+
+    def add(self, t, values):
+        self.points_in += len(values)
+        return self._merge([door.add(t, v) for door, v in zip(self.doors, values)])
+
+    def flush(self):
+        return self._merge([door.flush() for door in self.doors])
+
+    @property
+    def ratio(self):
+        """Input samples per archived point (higher is better)."""
+        return self.points_in / self.points_out if self.points_out else 0.0
@@ -4,7 +4,7 @@ import time
 from datetime import datetime
 import os
 
-DB_NAME = "network_monitor.db"
+DB_NAME = os.environ.get("NETWORK_DB", "network_monitor.db")  # read by the uploader (linkquality.py)
 
 def init_db():
     conn = sqlite3.connect(DB_NAME)
@@ -1,110 +1,146 @@
 # ---------------- IMPORTS ----------------
 import time
 import sys
-import sqlite3
 import os
+import logging
 
 # ---------------- ENCODING ----------------
 sys.stdout.reconfigure(encoding='utf-8')
 
 # ---------------- CONFIG ----------------
-RAW_THRESHOLD = 1638       
-READ_INTERVAL = 5          
+COMPRESSION_DEVIATION = float(os.environ.get("COMPRESSION_DEVIATION", 819))     # max rebuild error, raw counts
+COMPRESSION_MAX_INTERVAL = float(os.environ.get("COMPRESSION_MAX_INTERVAL", 60)) # force a point at least this often (s)
+READ_INTERVAL = 5
+SCHEDULE_INTERVAL = 600                                             # seconds between SCHEDULE status lines
+READ_POLICY = os.environ.get("READ_POLICY", "skip")                 # missed ticks: "skip" or "catch_up"
+WRITE_MAX_ROWS = int(os.environ.get("WRITE_MAX_ROWS", 20))          # rows per commit
+WRITE_MAX_DELAY = float(os.environ.get("WRITE_MAX_DELAY", 30))      # durability window (s)
+STORAGE_SCHEMA = os.environ.get("STORAGE_SCHEMA", "wide")           # "wide", or "narrow" (local only: not uploaded or exported)
 
 # ---------------- DATABASE PATH ----------------
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DB_DIR = os.path.join(BASE_DIR, "db")
 os.makedirs(DB_DIR, exist_ok=True)  # Ensure the db folder exists
 DB_PATH = os.path.join(DB_DIR, "new_db.db")
+sys.path.insert(0, os.path.dirname(BASE_DIR))  # shared modules live in the project root
+
+import logsetup
+import metrics
+import storage
+import channels
+from group_writer import GroupCommitWriter
+from rollups import RollupHook, NarrowRollupHook
+from compression import StreamCompressor
+from sampler import I2C_READ_SECONDS
+from scheduler import Scheduler
+
+log = logsetup.setup("capture")
+
+# ---------------- CHANNELS ----------------
+# Every ADC input to capture, in frame order (CHANNELS_CONFIG, or BP/BC/FP/CR on 0x48)
+registry = channels.load_registry(layout="raw")
+wide_order = registry.wide_order(storage.LAYOUTS["raw"]["columns"])
+if STORAGE_SCHEMA not in ("wide", "narrow"):
+    raise ValueError(f"❌ STORAGE_SCHEMA must be 'wide' or 'narrow', not {STORAGE_SCHEMA!r}")
+NARROW = STORAGE_SCHEMA == "narrow"
+if not NARROW and wide_order is None:
+    raise ValueError(
+        "❌ Channels do not match the wide table's columns; STORAGE_SCHEMA=narrow "
+        "stores them, but only locally (not uploaded or exported)"
+    )
 
 # ---------------- DATABASE SETUP ----------------
-conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-cursor = conn.cursor()
-
-# Create table if it doesn't exist
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS brake_pressure_log (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-    BP_raw INTEGER,
-    BC_raw INTEGER,
-    FP_raw INTEGER,
-    CR_raw INTEGER
-)
-""")
-conn.commit()
+conn = storage.connect(DB_PATH, "raw")
+channel_ids = storage.register_channels(conn, registry.config_rows())
+frame_ids = [channel_ids[name] for name in registry.names]
+
+# per-minute / per-hour rollups, same transaction
+if NARROW:
+    writer = GroupCommitWriter(
+        conn, storage.CHANNEL_TABLE, storage.NARROW_COLUMNS,
+        max_rows=WRITE_MAX_ROWS * len(registry), max_delay=WRITE_MAX_DELAY,
+        hooks=[NarrowRollupHook(channel_ids)]
+    )
+else:
+    writer = GroupCommitWriter(
+        conn, storage.TABLE, storage.reading_columns("raw"),
+        max_rows=WRITE_MAX_ROWS, max_delay=WRITE_MAX_DELAY,
+        hooks=[RollupHook("raw")]
+    )
+writer.install_signal_handlers()
+log.info("%d channel(s) on %d ADC(s), %s storage", len(registry), len(registry.addresses), "narrow" if NARROW else "wide")
+if NARROW:
+    log.warning("⚠️ Narrow storage is local only: %s rows are not uploaded or exported", storage.CHANNEL_TABLE)
+
+# ---------------- METRICS ----------------
+metrics.gauge("capture_buffered_rows", "Readings waiting for the next group commit").set_function(lambda: len(writer))
+metrics.start_exporter(9101)  # METRICS_PORT overrides
 
 # ---------------- ADS1115 SENSOR SETUP ----------------
-ADS_AVAILABLE = True
+# Conversions on different ADCs run at the same time (see sampler.ADCBank)
+bank = None
 
 try:
-    import board
-    import busio
-    import adafruit_ads1x15.ads1115 as ADS
-    from adafruit_ads1x15.analog_in import AnalogIn
-
-    # Initialize I2C and ADS1115
-    i2c = busio.I2C(board.SCL, board.SDA)
-    ads = ADS.ADS1115(i2c)
-    ads.gain = 1
-
-    # Define analog channels
-    bp_channel = AnalogIn(ads, 0)
-    fp_channel = AnalogIn(ads, 1)
-    cr_channel = AnalogIn(ads, 2)
-    bc_channel = AnalogIn(ads, 3)
-
+    bank = channels.open_bank(registry)
 except Exception as e:
-    ADS_AVAILABLE = False
-    print(f"⚠️ ADS1115 not available: {e}", flush=True)
+    log.warning("⚠️ ADS1115 not available: %s", e)
 
 # ---------------- SENSOR READ FUNCTION ----------------
 def read_raw_values():
-    if ADS_AVAILABLE:
-        return (
-            bp_channel.value,
-            bc_channel.value,
-            fp_channel.value,
-            cr_channel.value
-        )
+    if bank is not None:
+        with I2C_READ_SECONDS.time():
+            return bank.read_frame()
     else:
-        return (0, 0, 0, 0)
+        return [0] * len(registry)
 
 # ---------------- MAIN LOOP ----------------
-print("🚀 System started...", flush=True)
-
-last_raw = None
+log.info("🚀 System started...")
 
-while True:
-    current_raw = read_raw_values()
-    timestamp = time.strftime('%Y-%m-%d %H:%M:%S')
-
-    # Print raw values
-    print(
-        f"RAW VALUES | BP:{current_raw[0]} | BC:{current_raw[1]} | FP:{current_raw[2]} | CR:{current_raw[3]} | timestamp:{timestamp}",
-        flush=True
-    )
+# Per-channel swinging door; untouched channels are stored as NULL (wide) or not at all (narrow)
+compressor = StreamCompressor(
+    [COMPRESSION_DEVIATION] * len(registry),
+    max_interval=COMPRESSION_MAX_INTERVAL,
+    decimals=0
+)
 
-    upload = False
+def store(rows):
+    for sample_time, values in rows:
+        if NARROW:
+            for row in storage.narrow_rows(sample_time, values, frame_ids):
+                writer.add(row)
+        else:
+            writer.add((*[values[i] for i in wide_order], storage.utc_timestamp(sample_time)))
+    return len(rows)
 
-    # Insert first reading or if significant change occurs
-    if last_raw is None:
-        upload = True
-    else:
-        diffs = [abs(current_raw[i] - last_raw[i]) for i in range(4)]
-        if any(diff >= RAW_THRESHOLD for diff in diffs):
-            upload = True
-
-    if upload:
-        cursor.execute("""
-            INSERT INTO brake_pressure_log (BP_raw, BC_raw, FP_raw, CR_raw)
-            VALUES (?, ?, ?, ?)
-        """, (*current_raw,))
-        conn.commit()
-        last_raw = current_raw
-        print(f"✅ Data inserted into DB at {timestamp}", flush=True)
-    else:
-        print("⏭ No significant change → Skipped insert", flush=True)
+scheduler = Scheduler(READ_INTERVAL, policy=READ_POLICY, name="capture")
+schedule_at = time.monotonic() + SCHEDULE_INTERVAL
 
-    print("---------------------------------------------\n", flush=True)
-    time.sleep(READ_INTERVAL)
+try:
+    while True:
+        scheduler.wait()
+        current_raw = read_raw_values()
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("RAW VALUES | %s", " | ".join(
+                f"{name.upper()}:{value}" for name, value in zip(registry.names, current_raw)
+            ))
+
+        inserted = store(compressor.add(time.time(), current_raw))
+
+        if inserted:
+            log.info(
+                "✅ %d point(s) queued for DB (%d buffered, compression %.1fx)",
+                inserted, len(writer), compressor.ratio, extra=logsetup.every(60)
+            )
+        else:
+            writer.maybe_flush()
+            log.debug("⏭ No significant change → Skipped insert", extra=logsetup.every(60))
+
+        if time.monotonic() >= schedule_at:
+            schedule_at += SCHEDULE_INTERVAL
+            log.info("SCHEDULE | %s", scheduler.stats())
+
+finally:
+    store(compressor.flush())
+    writer.close()
+    conn.close()
+    log.info("🔻 Buffered readings flushed, shutting down")
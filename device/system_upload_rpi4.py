@@ -1,6 +1,8 @@
 import sqlite3
 import time
 import os
+import sys
+import threading
 import json
 from AWSIoTPythonSDK.MQTTLib import AWSIoTMQTTClient
 
@@ -8,77 +10,123 @@ from AWSIoTPythonSDK.MQTTLib import AWSIoTMQTTClient
 # PATH CONFIGURATION
 # ==============================
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BASE_DIR))  # shared modules live in the project root
+
+import logsetup
+import metrics
+import storage
+from upload_batch import build_batch, build_compact_batch
+from payload_codec import timestamp_to_ms
+from publisher import WindowedPublisher
+from upload_cursor import init_cursor, pending_count
+from catchup import CatchUpUploader
+from retention import archive_dir_for
+from linkquality import LinkMonitor, Backoff
+
+log = logsetup.setup("upload")
+
 CERT_FOLDER = os.path.join(BASE_DIR, "certs")
 DB_PATH = os.path.join(BASE_DIR, "db", "new_db.db")
 
 ENDPOINT = "amu2pa1jg3r4s-ats.iot.ap-south-1.amazonaws.com"
 PORT = 8883
 TOPIC = "brake/data"
+SINK = "aws_iot"
 
 ROOT_CA = os.path.join(CERT_FOLDER, "AmazonRootCA1.pem")
 CERTIFICATE = os.path.join(CERT_FOLDER, "certificate.pem.crt")
 PRIVATE_KEY = os.path.join(CERT_FOLDER, "private.pem.key")
 
+# ==============================
+# BATCH CONFIGURATION
+# ==============================
+BATCH_SIZE = int(os.environ.get("UPLOAD_BATCH_SIZE", 50))            # rows per publish
+BATCH_MAX_WAIT = float(os.environ.get("UPLOAD_BATCH_MAX_WAIT", 5))   # seconds to wait for a full batch
+BATCH_MAX_BYTES = int(os.environ.get("UPLOAD_BATCH_MAX_BYTES", 64 * 1024))
+UPLOAD_FORMAT = os.environ.get("UPLOAD_FORMAT", "json")                # "json" or "compact" (payload_codec)
+UPLOAD_COMPRESS = os.environ.get("UPLOAD_COMPRESS", "auto")            # zlib the compact body: "1", "0" or "auto" (by link)
+UPLOAD_WINDOW = int(os.environ.get("UPLOAD_WINDOW", 8))                # QoS1 batches in flight
+UPLOAD_ACK_TIMEOUT = float(os.environ.get("UPLOAD_ACK_TIMEOUT", 30))   # resend if no PUBACK (s)
+
+# Outage backlog: drained behind the live readings (see catchup.py)
+BACKLOG_BATCH_SIZE = int(os.environ.get("UPLOAD_BACKLOG_BATCH_SIZE", 500))
+BACKLOG_RATE = int(os.environ.get("UPLOAD_BACKLOG_RATE", 16 * 1024))     # bytes/s, 0 = uncapped
+BACKLOG_WINDOW = int(os.environ.get("UPLOAD_BACKLOG_WINDOW", 2))         # backlog batches in flight
+LIVE_JUMP_ROWS = int(os.environ.get("UPLOAD_LIVE_JUMP_ROWS", 1000))      # live lane skips ahead past this
+
+# ==============================
+# LINK CONFIGURATION
+# ==============================
+NETWORK_DB = os.environ.get("NETWORK_DB", os.path.join(BASE_DIR, "db", "network_monitor.db"))  # network.py probes
+RECONNECT_MAX_DELAY = int(os.environ.get("UPLOAD_RECONNECT_MAX_DELAY", 128))                  # seconds
+
+# ==============================
+# METRICS
+# ==============================
+BACKLOG_INTERVAL = 10                     # seconds between COUNT(*) backlog refreshes
+
+CONNECTS = metrics.counter("upload_mqtt_connects", "Successful MQTT (re)connects")
+DISCONNECTS = metrics.counter("upload_mqtt_disconnects", "MQTT disconnects")
+BACKLOG = metrics.gauge("upload_backlog_rows", "Rows not yet acknowledged by AWS IoT")
+CURSOR = metrics.gauge("upload_cursor_id", "Highest acknowledged row id")
+metrics.start_exporter(9102)  # METRICS_PORT overrides
+
 # ==============================
 # FETCH DEVICE ID FROM DATABASE
 # ==============================
 def get_device_id():
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = storage.connect(DB_PATH, "raw")
         cursor = conn.cursor()
         cursor.execute("SELECT device_id FROM device_config LIMIT 1")
         result = cursor.fetchone()
         conn.close()
 
         if result:
-            print(f"\n The Device id is assigned : {result[0]}\n", flush=True)
+            log.info("The Device id is assigned : %s", result[0])
             return result[0]
         else:
-            print("\n Device id not assigned\n", flush=True)
+            log.error("Device id not assigned")
             return None
 
     except Exception as e:
-        print("Error fetching device_id:", e, flush=True)
+        log.error("Error fetching device_id: %s", e)
         return None
 
 
 DEVICE_ID = get_device_id()
 
 if DEVICE_ID is None:
-    print(" Exiting uploader because device_id is missing.", flush=True)
+    log.error("Exiting uploader because device_id is missing.")
     exit()
 
 # ==============================
 # VERIFY CERTIFICATES
 # ==============================
-print("🔎 Verifying certificate files...\n", flush=True)
+log.info("🔎 Verifying certificate files...")
 
 for file_path in [ROOT_CA, CERTIFICATE, PRIVATE_KEY]:
     if not os.path.exists(file_path):
-        print(f" Missing file: {file_path}", flush=True)
+        log.error("Missing file: %s", file_path)
         exit()
     else:
-        print(f"✅ Found: {file_path}", flush=True)
+        log.debug("✅ Found: %s", file_path)
 
-print("Certificate verification successful!\n", flush=True)
+log.info("Certificate verification successful!")
 
 # ==============================
 # DATABASE CONNECTION
 # ==============================
-conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+conn = storage.connect(DB_PATH, "raw")
 conn.row_factory = sqlite3.Row
-cur = conn.cursor()
 
-# Ensure uploaded column exists
-cur.execute("PRAGMA table_info(brake_pressure_log)")
-columns = [col[1] for col in cur.fetchall()]
+# Upload progress is a per-sink high-water mark (migrated from the old 'uploaded' flag)
+last_uploaded_id = init_cursor(conn, SINK)
+log.info("Upload cursor [%s] at id=%d", SINK, last_uploaded_id)
+CURSOR.set(last_uploaded_id)
+backlog_checked_at = 0.0
 
-if "uploaded" not in columns:
-    print("Adding 'uploaded' column...", flush=True)
-    cur.execute("ALTER TABLE brake_pressure_log ADD COLUMN uploaded INTEGER DEFAULT 0")
-    conn.commit()
-
-print("Uploader Started...\n", flush=True)
+log.info("Uploader Started...")
 
 # ==============================
 # MQTT CLIENT SETUP
@@ -87,73 +135,156 @@ mqtt_client = AWSIoTMQTTClient(DEVICE_ID)
 mqtt_client.configureEndpoint(ENDPOINT, PORT)
 mqtt_client.configureCredentials(ROOT_CA, PRIVATE_KEY, CERTIFICATE)
 
-mqtt_client.configureOfflinePublishQueueing(-1)
+# No SDK offline queue: unacked batches are tracked and resent by WindowedPublisher,
+# and the DB cursor only moves once AWS IoT has acknowledged them.
+mqtt_client.configureOfflinePublishQueueing(0)
 mqtt_client.configureDrainingFrequency(2)
 mqtt_client.configureConnectDisconnectTimeout(10)
 mqtt_client.configureMQTTOperationTimeout(5)
+# SDK reconnects back off from 1 s up to RECONNECT_MAX_DELAY; reset after 20 s online
+mqtt_client.configureAutoReconnectBackoffTime(1, RECONNECT_MAX_DELAY, 20)
+
+resend_pending = threading.Event()
+online = threading.Event()
+
+def on_online():
+    log.info("MQTT Connected to AWS IoT Core")
+    CONNECTS.inc()
+    online.set()
+    resend_pending.set()
+
+def on_offline():
+    log.warning("MQTT Disconnected from AWS IoT Core")
+    DISCONNECTS.inc()
+    online.clear()
 
-mqtt_client.onOnline = lambda: print(" MQTT Connected to AWS IoT Core", flush=True)
-mqtt_client.onOffline = lambda: print("MQTT Disconnected from AWS IoT Core", flush=True)
+mqtt_client.onOnline = on_online
+mqtt_client.onOffline = on_offline
 
-print("🔌 Connecting to AWS IoT Core...\n", flush=True)
-mqtt_client.connect()
+# Live and backlog lanes each get their PUBACKs through their own ackCallback
+def publish_live(payload):
+    return mqtt_client.publishAsync(TOPIC, payload, 1, ackCallback=live_publisher.on_ack)
+
+def publish_backlog(payload):
+    return mqtt_client.publishAsync(TOPIC, payload, 1, ackCallback=backlog_publisher.on_ack)
+
+live_publisher = WindowedPublisher(publish_live, window=UPLOAD_WINDOW, ack_timeout=UPLOAD_ACK_TIMEOUT)
+backlog_publisher = WindowedPublisher(publish_backlog, window=BACKLOG_WINDOW, ack_timeout=UPLOAD_ACK_TIMEOUT)
+
+# Link quality from our own PUBACKs plus network.py probes
+link = LinkMonitor([live_publisher, backlog_publisher], probe_db=NETWORK_DB)
+error_backoff = Backoff(base=1, cap=60)
+
+log.info("🔌 Connecting to AWS IoT Core...")
+connect_backoff = Backoff(base=2, cap=RECONNECT_MAX_DELAY)
+while True:
+    try:
+        mqtt_client.connect()
+        online.set()
+        break
+    except Exception as e:
+        delay = connect_backoff.next_delay()
+        log.error("MQTT connect failed: %s | retrying in %.0fs", e, delay, extra=logsetup.every(60))
+        time.sleep(delay)
+
+# ==============================
+# PAYLOAD
+# ==============================
+def row_to_payload(row):
+    return {
+        "Device_id": DEVICE_ID,
+        "timestamp": row["timestamp"],
+        "bp_raw": row["BP_raw"],
+        "bc_raw": row["BC_raw"],
+        "cr_raw": row["CR_raw"],
+        "fp_raw": row["FP_raw"]
+    }
+
+def row_to_reading(row):
+    return (
+        row["id"],
+        timestamp_to_ms(row["timestamp"]),
+        (row["BP_raw"], row["BC_raw"], row["FP_raw"], row["CR_raw"])
+    )
+
+def build_payload(rows, max_rows, max_bytes):
+    if UPLOAD_FORMAT == "compact":
+        return build_compact_batch(
+            rows, row_to_reading, storage.LAYOUTS["raw"]["columns"],
+            max_rows, max_bytes, device_id=DEVICE_ID,
+            compress=link.profile.compress if UPLOAD_COMPRESS == "auto" else UPLOAD_COMPRESS == "1"
+        )
+    return build_batch(rows, row_to_payload, max_rows, max_bytes)
+
+uploader = CatchUpUploader(
+    conn, SINK, "raw", build_payload, live_publisher, backlog_publisher,
+    BATCH_SIZE, BATCH_MAX_BYTES, BATCH_MAX_WAIT,
+    backlog_batch_size=BACKLOG_BATCH_SIZE, backlog_rate=BACKLOG_RATE, jump_rows=LIVE_JUMP_ROWS,
+    archive_dir=archive_dir_for(DB_PATH)
+)
+metrics.gauge("upload_inflight_batches", "Published batches awaiting PUBACK").set_function(lambda: len(uploader))
+log.info("Live lane after id=%d, backlog lane after id=%d", uploader.live.after_id, uploader.backlog.after_id)
 
 # ==============================
 # MAIN LOOP
 # ==============================
 while True:
     try:
-        cur.execute("""
-            SELECT * FROM brake_pressure_log
-            WHERE uploaded = 0 OR uploaded IS NULL
-            ORDER BY timestamp ASC
-            LIMIT 1
-        """)
-
-        row = cur.fetchone()
-
-        if row:
-            payload = {
-                "Device_id": DEVICE_ID,
-                "timestamp": row["timestamp"],
-                "bp_raw": row["BP_raw"],
-                "bc_raw": row["BC_raw"],
-                "cr_raw": row["CR_raw"],
-                "fp_raw": row["FP_raw"]
-            }
-
-            payload_json = json.dumps(payload)
-            payload_pretty = json.dumps(payload, indent=2)
-
-            # Publish to AWS IoT
-            mqtt_client.publish(TOPIC, payload_json, 1)
-
-            # Update DB status
-            cur.execute(
-                "UPDATE brake_pressure_log SET uploaded = 1 WHERE id = ?",
-                (row["id"],)
+        link.set_connected(online.is_set())
+        link_state = link.state
+        if link.update() != link_state:
+            uploader.adapt(link.profile)
+            log.info(
+                "📶 Link %s → %s | rtt=%.2fs failures=%.0f%% throughput=%.0f B/s",
+                link_state, link.state, link.rtt or 0.0, link.failure_ratio * 100, link.throughput
             )
-            conn.commit()
-
-            # ================= OUTPUT FORMAT =================
-            print("\n================================================", flush=True)
-            print("📤 Data Published to AWS IoT Core", flush=True)
-            print(f"Device_id = {DEVICE_ID}\n", flush=True)
-
-            print("Data Uploaded :", flush=True)
-            print(payload_pretty, flush=True)
 
-            print("\nPayload Sent:", flush=True)
-            print(payload_json, flush=True)
+        if not online.is_set():
+            # The SDK is reconnecting with its own backoff
+            log.warning("Not connected to AWS IoT, waiting for reconnect...", extra=logsetup.every(60))
+            time.sleep(1)
+            continue
+
+        if resend_pending.is_set():
+            resend_pending.clear()
+            resent = uploader.resend_unacked()
+            if resent:
+                log.info("🔁 Resent %d unacked batch(es) after reconnect", resent)
+        else:
+            uploader.resend_unacked(only_expired=True)
+
+        # Acked batches become acked id ranges; the cursor follows the contiguous prefix
+        acked_id = uploader.collect_acked()
+        if acked_id is not None:
+            last_uploaded_id = acked_id
+            CURSOR.set(last_uploaded_id)
+            log.info(
+                "✅ Acked through id=%d | live after id=%d backlog after id=%d | in flight=%d rtt=%.3fs",
+                last_uploaded_id, uploader.live.after_id, uploader.backlog.after_id,
+                len(uploader), live_publisher.mean_rtt(),
+                extra=logsetup.every(60)
+            )
 
-            print("================================================\n", flush=True)
+        if time.monotonic() - backlog_checked_at >= BACKLOG_INTERVAL:
+            BACKLOG.set(pending_count(conn, SINK))
+            backlog_checked_at = time.monotonic()
+
+        # Publish to AWS IoT; PUBACKs arrive later through each lane's on_ack
+        sent = uploader.step()
+        error_backoff.reset()
+        if sent:
+            log.debug(
+                "📤 Published %d rows | live after id=%d backlog after id=%d | in flight %d",
+                sent, uploader.live.after_id, uploader.backlog.after_id, len(uploader)
+            )
+            continue
 
-        else:
-            print("No new data to upload...", flush=True)
+        if not len(uploader):
+            log.debug("No new data to upload...", extra=logsetup.every(60))
 
-        time.sleep(2)
+        time.sleep(0.05 if len(uploader) else 2)
 
     except Exception as e:
-        print("\n Runtime Error:", e, flush=True)
-        print("Retrying in 5 seconds...", flush=True)
-        time.sleep(5)
\ No newline at end of file
+        delay = error_backoff.next_delay()
+        log.error("Runtime Error: %s | retrying in %.1f seconds", e, delay, extra=logsetup.every(60))
+        time.sleep(delay)
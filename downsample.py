@@ -0,0 +1,100 @@
+import math
+
+# ---------------- DOWNSAMPLING ----------------
+# Both take time-ordered ``(ts, value)`` points and return at most
+# ``threshold`` of them, always keeping the first and last point.
+
+
+def lttb(points, threshold):
+    """Largest-Triangle-Three-Buckets: keeps the visual shape of a line.
+
+    The middle points are split into ``threshold - 2`` buckets; from each,
+    the point forming the largest triangle with the previously kept point
+    and the average of the next bucket is kept.
+    """
+    n = len(points)
+    if threshold >= n or threshold < 3:
+        return list(points)
+
+    sampled = [points[0]]
+    every = (n - 2) / (threshold - 2)
+    a = 0
+
+    for i in range(threshold - 2):
+        # Average of the next bucket (the last point for the final bucket)
+        next_start = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        if next_start >= next_end:
+            next_start, next_end = n - 1, n
+        count = next_end - next_start
+        avg_t = sum(points[j][0] for j in range(next_start, next_end)) / count
+        avg_v = sum(points[j][1] for j in range(next_start, next_end)) / count
+
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        at, av = points[a]
+        best = -1.0
+        best_j = start
+        for j in range(start, end):
+            t, v = points[j]
+            area = abs((at - avg_t) * (v - av) - (at - t) * (avg_v - av))
+            if area > best:
+                best = area
+                best_j = j
+        sampled.append(points[best_j])
+        a = best_j
+
+    sampled.append(points[-1])
+    return sampled
+
+
+def minmax(points, threshold):
+    """Min and max of each of ``(threshold - 2) // 2`` equal time buckets.
+
+    Keeps every spike, which LTTB can drop; points are returned in time
+    order within each bucket.
+    """
+    n = len(points)
+    buckets = (threshold - 2) // 2
+    if threshold >= n or buckets < 1:
+        return list(points)
+
+    first_t = points[0][0]
+    width = (points[-1][0] - first_t) / buckets or 1.0
+
+    sampled = [points[0]]
+    low = high = None
+    current = 0
+    for point in points[1:-1]:
+        bucket = min(int((point[0] - first_t) / width), buckets - 1)
+        if bucket != current and low is not None:
+            sampled.extend(sorted({low, high}))
+            low = high = None
+        current = bucket
+        if low is None or point[1] < low[1]:
+            low = point
+        if high is None or point[1] > high[1]:
+            high = point
+    if low is not None:
+        sampled.extend(sorted({low, high}))
+    sampled.append(points[-1])
+    return sampled
+
+
+METHODS = {"lttb": lttb, "minmax": minmax}
+
+
+def downsample(points, threshold, method="lttb"):
+    try:
+        fn = METHODS[method]
+    except KeyError:
+        raise ValueError(f"method must be one of {sorted(METHODS)}") from None
+    return fn(points, threshold)
+
+
+def finite(points):
+    """Drop points whose value is missing or not a finite number."""
+    return [
+        (ts, value) for ts, value in points
+        if value is not None and not (isinstance(value, float) and not math.isfinite(value))
+    ]
@@ -0,0 +1,326 @@
+import argparse
+import csv
+import glob
+import json
+import os
+import sys
+
+import storage
+from retention import archive_dir_for, iter_archive
+from rollups import to_epoch
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+# ---------------- CONFIG ----------------
+CHUNK_ROWS = 5000          # rows held in memory at any time
+TIME_FIELDS = ("timestamp", "created_at")
+
+
+# ---------------- RESUME STATE ----------------
+def state_path_for(out):
+    return out.rstrip("/\\") + ".state.json"
+
+
+def load_state(out, filters):
+    """Previous progress for this output, or a fresh state.
+
+    Resuming with different filters would leave a file mixing two exports,
+    so that is refused rather than guessed at.
+    """
+    path = state_path_for(out)
+    if not os.path.exists(path):
+        return {"filters": filters, "last_id": 0, "offsets": {}, "rows": 0,
+                "bytes": 0, "parts": 0}
+    with open(path) as f:
+        state = json.load(f)
+    if state["filters"] != filters:
+        raise SystemExit(
+            f"❌ {out} was exported with {state['filters']}, not {filters}; "
+            f"use a new output or delete {path}"
+        )
+    return state
+
+
+def save_state(out, state):
+    path = state_path_for(out)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+# ---------------- WRITERS ----------------
+class CsvSink:
+    """Appends to one CSV file; the header is written only once.
+
+    Anything past ``committed`` bytes was written after the last saved
+    state (an interrupted run) and is cut off so it is not duplicated.
+    """
+
+    def __init__(self, out, columns, committed=0):
+        self.columns = columns
+        self.file = open(out, "a+", newline="")
+        self.file.truncate(committed)
+        self.writer = csv.writer(self.file)
+        if committed == 0:
+            self.writer.writerow(columns)
+
+    def write(self, rows):
+        self.writer.writerows([row.get(c) for c in self.columns] for row in rows)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    @property
+    def size(self):
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetSink:
+    """One Parquet part file per run inside ``out``, one row group per chunk.
+
+    Parquet files cannot be appended to, so a resumed export adds a new
+    ``part-NNNNN.parquet`` next to the previous ones; readers load the
+    directory as a single dataset.
+    """
+
+    def __init__(self, out, columns, part):
+        if not PYARROW_AVAILABLE:
+            raise SystemExit("❌ Parquet output needs pyarrow (pip install pyarrow)")
+        os.makedirs(out, exist_ok=True)
+        self.columns = columns
+        self.path = os.path.join(out, f"part-{part:05d}.parquet")
+        self.writer = None
+
+    def write(self, rows):
+        table = pa.table({c: [row.get(c) for row in rows] for c in self.columns})
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.path, table.schema)
+        self.writer.write_table(table.cast(self.writer.schema))
+
+    def close(self):
+        # The row group footer is only written here; an interrupted part
+        # is unreadable, so progress is saved for closed parts only.
+        if self.writer is not None:
+            self.writer.close()
+
+
+def open_sink(fmt, out, columns, state):
+    if fmt == "parquet":
+        return ParquetSink(out, columns, state["parts"])
+    return CsvSink(out, columns, state["bytes"])
+
+
+# ---------------- SOURCES ----------------
+def iter_db_rows(db_path, layout, after_id, start=None, end=None, chunk=CHUNK_ROWS):
+    """Archived then live rows with id > after_id, as dicts in id order."""
+    archived = iter_archive(archive_dir_for(db_path), layout, start, end, after_id=after_id)
+    for row in archived:
+        after_id = row["id"]
+        yield row
+
+    columns = ("id",) + storage.reading_columns(layout)
+    time_column = storage.LAYOUTS[layout]["time_column"]
+    sql = f"SELECT {', '.join(columns)} FROM {storage.TABLE} WHERE id > ?"
+    params = [after_id]
+    if start is not None:
+        sql += f" AND {time_column} >= ?"
+        params.append(storage.utc_timestamp(start))
+    if end is not None:
+        sql += f" AND {time_column} < ?"
+        params.append(storage.utc_timestamp(end))
+    sql += " ORDER BY id"
+
+    conn = storage.connect(db_path, layout)
+    try:
+        cursor = conn.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(chunk)
+            if not rows:
+                break
+            for row in rows:
+                yield dict(zip(columns, row))
+    finally:
+        conn.close()
+
+
+def _record_time(record):
+    for field in TIME_FIELDS:
+        if field in record:
+            return to_epoch(record[field])
+    return None
+
+
+def iter_jsonl_rows(paths, offsets, start=None, end=None):
+    """JSON-lines records as ``(path, next_offset, record)``, from saved offsets."""
+    for path in paths:
+        with open(path, "rb") as f:
+            f.seek(offsets.get(path, 0))
+            for line in iter(f.readline, b""):
+                offset = f.tell()
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                ts = _record_time(record)
+                if ts is not None and (
+                    (start is not None and ts < start) or (end is not None and ts >= end)
+                ):
+                    yield path, offset, None
+                    continue
+                yield path, offset, record
+
+
+# ---------------- EXPORT ----------------
+def _chunks(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def export_db(db_path, layout, out, fmt="csv", channels=None, start=None, end=None,
+              chunk=CHUNK_ROWS):
+    """Stream rows not exported yet from the DB (and its archive) into ``out``."""
+    all_channels = storage.LAYOUTS[layout]["columns"]
+    channels = list(channels or all_channels)
+    unknown = set(channels) - set(all_channels)
+    if unknown:
+        raise ValueError(f"unknown channel(s) {sorted(unknown)}")
+
+    time_column = storage.LAYOUTS[layout]["time_column"]
+    columns = ["id", time_column] + channels
+    filters = {"source": "db", "layout": layout, "channels": channels,
+               "start": start, "end": end, "format": fmt}
+    state = load_state(out, filters)
+
+    sink = open_sink(fmt, out, columns, state)
+    exported = 0
+    last_id = state["last_id"]
+    try:
+        rows = iter_db_rows(db_path, layout, state["last_id"], start, end, chunk)
+        for batch in _chunks(rows, chunk):
+            last_id = batch[-1]["id"]
+            # Compressed rows can carry no value for the selected channels
+            batch = [r for r in batch if any(r[c] is not None for c in channels)]
+            if batch:
+                sink.write(batch)
+                exported += len(batch)
+            if fmt == "csv":
+                state["last_id"] = last_id
+                state["rows"] += len(batch)
+                state["bytes"] = sink.size
+                save_state(out, state)
+    finally:
+        sink.close()
+
+    if fmt == "parquet" and exported:
+        state["last_id"] = last_id
+        state["rows"] += exported
+        state["parts"] += 1
+        save_state(out, state)
+    return exported, state
+
+
+def export_jsonl(paths, out, fmt="csv", channels=None, start=None, end=None,
+                 chunk=CHUNK_ROWS):
+    """Stream legacy JSON-lines files (one reading per line) into ``out``.
+
+    Columns come from ``channels`` or the keys of the first record; each
+    file's byte offset is saved so a re-run only reads appended lines.
+    """
+    filters = {"source": "jsonl", "channels": channels, "start": start, "end": end,
+               "format": fmt}
+    state = load_state(out, filters)
+    offsets = state["offsets"]
+
+    records = iter_jsonl_rows(paths, dict(offsets), start, end)
+    sink = None
+    exported = 0
+    try:
+        for batch in _chunks(records, chunk):
+            rows = [record for _, _, record in batch if record is not None]
+            if rows:
+                if sink is None:
+                    # Keep the header of the first run when resuming
+                    state.setdefault("columns", list(channels or rows[0].keys()))
+                    sink = open_sink(fmt, out, state["columns"], state)
+                sink.write(rows)
+                exported += len(rows)
+            for path, offset, _ in batch:
+                offsets[path] = offset
+            if fmt == "csv":
+                state["rows"] += len(rows)
+                if sink is not None:
+                    state["bytes"] = sink.size
+                save_state(out, state)
+    finally:
+        if sink is not None:
+            sink.close()
+
+    if fmt == "parquet" and exported:
+        state["rows"] += exported
+        state["parts"] += 1
+        save_state(out, state)
+    return exported, state
+
+
+# ---------------- CLI ----------------
+def _epoch(value):
+    return to_epoch(value) if value else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Incremental, constant-memory export of pressure readings"
+    )
+    sub = parser.add_subparsers(dest="source", required=True)
+
+    p = sub.add_parser("db", help="SQLite log plus its retention archive")
+    p.add_argument("db")
+    p.add_argument("out")
+    p.add_argument("--layout", default="pressure", choices=sorted(storage.LAYOUTS))
+
+    p = sub.add_parser("jsonl", help="JSON-lines files, e.g. 'data/*.csv'")
+    p.add_argument("pattern")
+    p.add_argument("out")
+
+    for p in sub.choices.values():
+        p.add_argument("--format", default="csv", choices=("csv", "parquet"))
+        p.add_argument("--channels", help="comma-separated columns (default: all)")
+        p.add_argument("--start", help="UTC 'YYYY-MM-DD HH:MM:SS' (inclusive)")
+        p.add_argument("--end", help="UTC 'YYYY-MM-DD HH:MM:SS' (exclusive)")
+        p.add_argument("--chunk", type=int, default=CHUNK_ROWS)
+
+    args = parser.parse_args(argv)
+    channels = args.channels.split(",") if args.channels else None
+    start, end = _epoch(args.start), _epoch(args.end)
+
+    if args.source == "db":
+        exported, state = export_db(
+            args.db, args.layout, args.out, args.format, channels, start, end, args.chunk
+        )
+    else:
+        paths = sorted(p for p in glob.glob(args.pattern)
+                       if os.path.abspath(p) != os.path.abspath(args.out))
+        exported, state = export_jsonl(
+            paths, args.out, args.format, channels, start, end, args.chunk
+        )
+
+    print(f"✅ Exported {exported} new row(s) to {args.out} ({state['rows']} total)")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
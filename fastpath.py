@@ -0,0 +1,150 @@
+import threading
+import time
+from collections import deque
+
+import metrics
+import storage
+from upload_cursor import READINGS_SINKS
+
+# ---------------- DEFAULTS ----------------
+DEFAULT_QUEUE_ROWS = 5000       # readings held for the live path before spilling
+DEFAULT_LINGER = 0.02           # seconds to wait for more readings once one is queued
+
+LIVE = "live"
+SPILL = "spill"
+
+SAMPLE_TO_PUBLISH = metrics.histogram(
+    "combined_sample_to_publish_seconds", "Oldest reading in a batch, sample time to publish"
+)
+SPILL_BATCHES = metrics.counter("combined_spill_batches", "Batches read back from SQLite")
+LIVE_BATCHES = metrics.counter("combined_live_batches", "Batches taken from the in-memory queue")
+QUEUE_OVERFLOWS = metrics.counter("combined_queue_overflows", "Times the live queue was dropped when full")
+
+
+def first_free_id(conn, table=storage.TABLE):
+    """Next row id for a process that allocates ids itself.
+
+    Past the highest stored id *and* everything any sink has acked: a crash can lose
+    buffered rows that were already published and acked, and reusing their
+    ids would make new readings look uploaded.
+    """
+    max_row = conn.execute(f"SELECT MAX(id) FROM {table}").fetchone()[0] or 0
+    max_cursor = conn.execute(f"SELECT MAX(last_id) FROM upload_cursor WHERE {READINGS_SINKS}").fetchone()[0] or 0
+    max_range = conn.execute(f"SELECT MAX(last_id) FROM upload_ranges WHERE {READINGS_SINKS}").fetchone()[0] or 0
+    return max(max_row, max_cursor, max_range) + 1
+
+
+# ---------------- LIVE QUEUE ----------------
+class LiveFeed:
+    """Bounded in-memory hand-off from capture to upload.
+
+    The capture side ``put()``s every reading it also buffers for SQLite,
+    with consecutive ids. When the queue is full it is emptied rather than
+    blocking capture; the uploader sees the id gap and reads those rows
+    back from SQLite instead.
+    """
+
+    def __init__(self, max_rows=DEFAULT_QUEUE_ROWS):
+        self.max_rows = max_rows
+        self._items = deque()
+        self._cond = threading.Condition()
+        self.overflows = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def put(self, row_id, row, sampled_at):
+        with self._cond:
+            if len(self._items) >= self.max_rows:
+                self._items.clear()
+                self.overflows += 1
+                QUEUE_OVERFLOWS.inc()
+            self._items.append((row_id, row, sampled_at))
+            self._cond.notify()
+
+    def clear(self):
+        with self._cond:
+            self._items.clear()
+
+    def take(self, after_id, max_rows, timeout, linger=DEFAULT_LINGER):
+        """Readings with consecutive ids from ``after_id + 1``.
+
+        Returns ``(rows, oldest_sample_time)``; ``rows`` is empty if nothing
+        arrived within ``timeout``, and None if the next id is not in the
+        queue (dropped on overflow or never queued), meaning: spill.
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                while self._items and self._items[0][0] <= after_id:
+                    self._items.popleft()
+                if self._items:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return [], None
+                self._cond.wait(remaining)
+
+            if self._items[0][0] != after_id + 1:
+                return None, None
+
+            # Give a burst a moment to fill the batch
+            linger_until = time.monotonic() + linger
+            while len(self._items) < max_rows:
+                remaining = linger_until - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            rows = []
+            oldest = self._items[0][2]
+            expected = after_id + 1
+            while self._items and len(rows) < max_rows and self._items[0][0] == expected:
+                rows.append(self._items.popleft()[1])
+                expected += 1
+            return rows, oldest
+
+
+# ---------------- SOURCE SELECTION ----------------
+class BatchSource:
+    """Next batch to publish: live from the queue, or spilled from SQLite.
+
+    Starts in spill mode so any backlog left by a previous run goes first.
+    Spill mode ends once SQLite has nothing newer than what was sent (the
+    remaining readings are still in the queue); live mode ends at the
+    first id gap.
+    """
+
+    def __init__(self, feed, conn, layout, batch_size, live_timeout=0.2, spill_idle=0.1):
+        self.feed = feed
+        self.conn = conn
+        self.layout = layout
+        self.batch_size = batch_size
+        self.live_timeout = live_timeout
+        self.spill_idle = spill_idle
+        self.mode = SPILL
+
+    def next_batch(self, after_id):
+        if self.mode == LIVE:
+            rows, oldest = self.feed.take(after_id, self.batch_size, self.live_timeout)
+            if rows is not None:
+                if rows:
+                    LIVE_BATCHES.inc()
+                    SAMPLE_TO_PUBLISH.observe(max(0.0, time.time() - oldest))
+                return rows
+            self.mode = SPILL
+
+        rows = storage.fetch_pending(self.conn, self.layout, after_id, self.batch_size)
+        if rows:
+            SPILL_BATCHES.inc()
+        if len(rows) < self.batch_size:
+            self.mode = LIVE
+            if not rows:
+                # Next readings are still in the capture buffer, not yet committed
+                time.sleep(self.spill_idle)
+        return rows
+
+    def link_down(self):
+        """Nothing can be published: drop the queue and resume from SQLite."""
+        self.feed.clear()
+        self.mode = SPILL
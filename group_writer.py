@@ -0,0 +1,86 @@
+import signal
+import time
+
+import metrics
+
+# ---------------- DEFAULTS ----------------
+DEFAULT_MAX_ROWS = 50        # flush after this many buffered readings
+DEFAULT_MAX_DELAY = 5.0      # ...or once the oldest buffered reading is this old (s)
+
+# ---------------- METRICS ----------------
+COMMIT_SECONDS = metrics.histogram("db_commit_seconds", "Group commit duration, hooks included")
+COMMITTED_ROWS = metrics.counter("db_committed_rows", "Readings committed to SQLite")
+
+
+# ---------------- GROUP COMMIT WRITER ----------------
+class GroupCommitWriter:
+    """Buffer inserts in memory and commit them as one transaction.
+
+    A flush happens when ``max_rows`` readings are buffered, when the
+    oldest buffered reading is ``max_delay`` seconds old, or on close().
+    ``max_delay`` is therefore the durability window: at most that much
+    data is lost on power failure. Each ``hooks`` callable is run as
+    ``hook(conn, rows)`` inside the same transaction as the insert.
+    """
+
+    def __init__(self, conn, table, columns, max_rows=DEFAULT_MAX_ROWS,
+                 max_delay=DEFAULT_MAX_DELAY, clock=time.monotonic, hooks=()):
+        self.conn = conn
+        self.hooks = list(hooks)
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self.clock = clock
+        self.sql = (
+            f"INSERT INTO {table} ({', '.join(columns)}) "
+            f"VALUES ({', '.join('?' for _ in columns)})"
+        )
+        self._rows = []
+        self._first_at = None
+        self.flushed_rows = 0
+        self.commits = 0
+
+    def __len__(self):
+        return len(self._rows)
+
+    def add(self, values):
+        if not self._rows:
+            self._first_at = self.clock()
+        self._rows.append(tuple(values))
+        self.maybe_flush()
+
+    def maybe_flush(self):
+        if not self._rows:
+            return 0
+        if (len(self._rows) >= self.max_rows
+                or self.clock() - self._first_at >= self.max_delay):
+            return self.flush()
+        return 0
+
+    def flush(self):
+        if not self._rows:
+            return 0
+
+        rows = self._rows
+        with COMMIT_SECONDS.time():
+            with self.conn:
+                self.conn.executemany(self.sql, rows)
+                for hook in self.hooks:
+                    hook(self.conn, rows)
+
+        self._rows = []
+        self._first_at = None
+        self.flushed_rows += len(rows)
+        COMMITTED_ROWS.inc(len(rows))
+        self.commits += 1
+        return len(rows)
+
+    def close(self):
+        self.flush()
+
+    def install_signal_handlers(self):
+        # Turn SIGTERM into SystemExit so the caller's finally: close() runs
+        # on the main thread instead of flushing from inside the handler.
+        def _exit(signum, frame):
+            raise SystemExit(0)
+
+        signal.signal(signal.SIGTERM, _exit)
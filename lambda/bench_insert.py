@@ -0,0 +1,84 @@
+"""Per-row insert latency of lambda_handler against a local Postgres.
+
+Point the usual SUPABASE_* variables at any Postgres-compatible server, e.g.
+
+    docker run --rm -p 5432:5432 -e POSTGRES_PASSWORD=postgres postgres:16
+    SUPABASE_URL=localhost SUPABASE_PASSWORD=postgres python3 lambda/bench_insert.py
+
+and compare the old connect-per-row path with the warm, bulk-insert path.
+"""
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import lambda_function as lf
+
+ROWS = int(os.environ.get("BENCH_ROWS", 500))
+BATCH = int(os.environ.get("BENCH_BATCH", 100))
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS brake_data (
+    id BIGSERIAL PRIMARY KEY,
+    created_at TEXT,
+    bp_pressure REAL,
+    fp_pressure REAL,
+    cr_pressure REAL,
+    bc_pressure REAL,
+    brake_fault TEXT,
+    brake_time TEXT,
+    event_trigger TEXT,
+    brake_status TEXT
+)
+"""
+
+
+def reading(i):
+    return {
+        "created_at": datetime.utcnow().isoformat(),
+        "bp_pressure": 5.0 + (i % 10) / 10,
+        "fp_pressure": 5.0,
+        "cr_pressure": 5.0,
+        "bc_pressure": 0.0,
+    }
+
+
+def cold_per_row(n):
+    # Previous behaviour: a new connection and one INSERT per reading
+    for i in range(n):
+        conn = lf._connect()
+        lf.insert_rows(conn, [lf.row_values(reading(i))])
+        conn.close()
+
+
+def warm_per_row(n):
+    for i in range(n):
+        lf.lambda_handler(reading(i), None)
+
+
+def warm_batched(n):
+    for start in range(0, n, BATCH):
+        batch = [reading(i) for i in range(start, min(n, start + BATCH))]
+        lf.lambda_handler(json.dumps(batch), None)
+
+
+def run(label, fn, n):
+    start = time.perf_counter()
+    fn(n)
+    elapsed = time.perf_counter() - start
+    print(f"{label:>16}: {elapsed / n * 1000:8.3f} ms/row  ({n / elapsed:8.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    conn = lf.get_connection()
+    cursor = conn.cursor()
+    cursor.execute(SCHEMA_SQL)
+    conn.commit()
+    cursor.close()
+
+    run("connect per row", cold_per_row, min(ROWS, 100))
+    run("warm per row", warm_per_row, ROWS)
+    run(f"warm batch={BATCH}", warm_batched, ROWS)
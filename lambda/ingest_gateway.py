@@ -0,0 +1,448 @@
+#!/usr/bin/env python3
+"""Local ingest: MQTT broker -> brake_data, without IoT Core and Lambda.
+
+Subscribes to the uploaders' topics on a local broker (e.g. mosquitto),
+decodes payloads exactly like lambda_handler (single JSON reading, JSON
+array or compact batch) and writes them to SQLite or Postgres in large
+batched transactions.
+
+    GATEWAY_BROKER=localhost GATEWAY_DB=db/ingest.db python3 lambda/ingest_gateway.py
+    GATEWAY_STORE=postgres SUPABASE_URL=localhost SUPABASE_PASSWORD=... python3 lambda/ingest_gateway.py
+
+QoS1 redeliveries are dropped by (device, id): the device comes from the
+compact header or a ``device_id``/``Device_id`` field, else the topic;
+readings without an id cannot be deduplicated and are always stored.
+With paho-mqtt 2.x messages are acknowledged only after their rows are
+committed; with 1.x paho acknowledges them once they are queued.
+"""
+import asyncio
+import concurrent.futures
+import os
+import signal
+import sqlite3
+import sys
+import time
+from collections import deque
+
+import paho.mqtt.client as mqtt
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import lambda_function as lf
+import logsetup
+import metrics
+import storage
+from linkquality import Backoff
+from payload_codec import timestamp_to_ms
+
+# ================= CONFIG =================
+BROKER_HOST = os.environ.get("GATEWAY_BROKER", "localhost")
+BROKER_PORT = int(os.environ.get("GATEWAY_BROKER_PORT", 1883))
+TOPICS = os.environ.get("GATEWAY_TOPICS", "brake/pressure,brake/data").split(",")
+CLIENT_ID = os.environ.get("GATEWAY_CLIENT_ID", "ingest-gateway")
+
+STORE = os.environ.get("GATEWAY_STORE", "sqlite")                     # "sqlite" or "postgres" (SUPABASE_* env)
+DB_PATH = os.environ.get("GATEWAY_DB", "db/ingest.db")
+
+QUEUE_MESSAGES = int(os.environ.get("GATEWAY_QUEUE", 10000))          # received, not yet written; full = backpressure
+BATCH_ROWS = int(os.environ.get("GATEWAY_BATCH_ROWS", 5000))          # rows per transaction
+FLUSH_INTERVAL = float(os.environ.get("GATEWAY_FLUSH_INTERVAL", 0.5)) # seconds to wait for a full batch
+DEDUP_IDS = int(os.environ.get("GATEWAY_DEDUP_IDS", 100000))          # recent ids remembered per device
+
+STATS_INTERVAL = 60                       # seconds between summary log lines
+METRICS_PORT = 9104                       # default, overridden by METRICS_PORT env
+
+log = logsetup.setup("gateway")
+
+MESSAGES = metrics.counter("gateway_messages", "MQTT messages received")
+BAD_MESSAGES = metrics.counter("gateway_bad_messages", "Messages that could not be decoded")
+ROWS = metrics.counter("gateway_rows", "Rows committed")
+DUPLICATES = metrics.counter("gateway_duplicates", "Redelivered readings dropped")
+COMMITS = metrics.counter("gateway_commits", "Write transactions")
+WRITE_ERRORS = metrics.counter("gateway_write_errors", "Failed write transactions")
+QUEUE_DEPTH = metrics.gauge("gateway_queue_messages", "Messages waiting to be written")
+INGEST_LAG = metrics.histogram("gateway_ingest_lag_seconds", "Reading timestamp to commit")
+QUEUE_LAG = metrics.histogram("gateway_queue_lag_seconds", "Message receipt to commit")
+WRITE_SECONDS = metrics.histogram("gateway_write_seconds", "Duration of one write transaction")
+LAST_LAG = metrics.gauge("gateway_last_lag_seconds", "Oldest reading in the last commit, timestamp to commit")
+
+# Rows are lambda_function.row_values() plus the dedup key
+COLUMNS = lf.COLUMNS + ("device_id", "reading_id")
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS brake_data (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at TEXT,
+    bp_pressure REAL,
+    fp_pressure REAL,
+    cr_pressure REAL,
+    bc_pressure REAL,
+    brake_fault TEXT,
+    brake_time TEXT,
+    event_trigger TEXT,
+    brake_status TEXT,
+    device_id TEXT,
+    reading_id INTEGER
+)
+"""
+
+# Existing Supabase tables only gain the two dedup columns
+POSTGRES_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS brake_data (
+        id BIGSERIAL PRIMARY KEY,
+        created_at TEXT,
+        bp_pressure REAL,
+        fp_pressure REAL,
+        cr_pressure REAL,
+        bc_pressure REAL,
+        brake_fault TEXT,
+        brake_time TEXT,
+        event_trigger TEXT,
+        brake_status TEXT
+    )
+    """,
+    "ALTER TABLE brake_data ADD COLUMN IF NOT EXISTS device_id TEXT",
+    "ALTER TABLE brake_data ADD COLUMN IF NOT EXISTS reading_id BIGINT",
+)
+
+# NULL reading_ids never conflict, so readings without an id are all kept
+DEDUP_INDEX_SQL = "CREATE UNIQUE INDEX IF NOT EXISTS brake_data_reading ON brake_data (device_id, reading_id)"
+
+
+# ================= STORES =================
+class SQLiteStore:
+    def __init__(self, path):
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=storage.BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+        for name, value in storage.PRAGMAS:
+            self.conn.execute(f"PRAGMA {name} = {value}")
+        with self.conn:
+            self.conn.execute(SQLITE_SCHEMA)
+            self.conn.execute(DEDUP_INDEX_SQL)
+        self.sql = (
+            f"INSERT OR IGNORE INTO brake_data ({', '.join(COLUMNS)}) "
+            f"VALUES ({', '.join(['?'] * len(COLUMNS))})"
+        )
+
+    def write(self, rows):
+        """Insert ``rows`` in one transaction; return how many were new."""
+        with self.conn:
+            return self.conn.executemany(self.sql, rows).rowcount
+
+    def close(self):
+        self.conn.close()
+
+
+class PostgresStore:
+    def __init__(self):
+        self.conn = None
+        cursor = self._connection().cursor()
+        try:
+            for sql in POSTGRES_SCHEMA + (DEDUP_INDEX_SQL,):
+                cursor.execute(sql)
+            self.conn.commit()
+        finally:
+            cursor.close()
+
+    def _connection(self):
+        if self.conn is None:
+            self.conn = lf._connect()
+        return self.conn
+
+    def write(self, rows):
+        """Insert ``rows`` in one transaction; return how many were new."""
+        conn = self._connection()
+        cursor = conn.cursor()
+        placeholders = "(" + ", ".join(["%s"] * len(COLUMNS)) + ")"
+        inserted = 0
+        try:
+            for start in range(0, len(rows), lf.INSERT_CHUNK):
+                chunk = rows[start:start + lf.INSERT_CHUNK]
+                cursor.execute(
+                    f"INSERT INTO brake_data ({', '.join(COLUMNS)}) VALUES "
+                    + ", ".join([placeholders] * len(chunk))
+                    + " ON CONFLICT (device_id, reading_id) DO NOTHING",
+                    [value for row in chunk for value in row]
+                )
+                inserted += max(cursor.rowcount, 0)
+            conn.commit()
+            return inserted
+        except Exception:
+            # Reconnect on the next write; the batch is retried whole
+            self.close()
+            raise
+        finally:
+            cursor.close()
+
+    def close(self):
+        try:
+            if self.conn is not None:
+                self.conn.close()
+        except Exception:
+            pass
+        self.conn = None
+
+
+def open_store():
+    if STORE == "postgres":
+        return PostgresStore()
+    return SQLiteStore(DB_PATH)
+
+
+# ================= DEDUP =================
+class RecentIds:
+    """The last ``size`` reading ids seen per device.
+
+    Catches redeliveries before they reach the database; the unique index
+    on (device_id, reading_id) still catches anything older.
+    """
+
+    def __init__(self, size=DEDUP_IDS):
+        self.size = size
+        self._devices = {}
+
+    def seen(self, device, reading_id):
+        """True if already seen; otherwise remember it."""
+        ids = self._devices.get(device)
+        if ids is None:
+            ids = self._devices[device] = (set(), deque())
+        known, order = ids
+        if reading_id in known:
+            return True
+        known.add(reading_id)
+        order.append(reading_id)
+        if len(order) > self.size:
+            known.discard(order.popleft())
+        return False
+
+    def forget(self, keys):
+        """Drop ids whose rows were never committed."""
+        for device, reading_id in keys:
+            ids = self._devices.get(device)
+            if ids is not None:
+                ids[0].discard(reading_id)
+
+
+def _device_of(data, default):
+    return str(data.get("device_id") or data.get("Device_id") or default)
+
+
+def _sample_time(created_at):
+    try:
+        return timestamp_to_ms(created_at) / 1000
+    except (TypeError, ValueError):
+        return None
+
+
+# ================= GATEWAY =================
+class Gateway:
+    """Queue of raw MQTT messages -> decoded, deduplicated row batches -> store.
+
+    ``submit()`` is called from the MQTT network thread and blocks while
+    the queue is full, so paho stops reading from the broker instead of
+    buffering without bound. One batch is written (in a worker thread)
+    while the next is decoded. ``ack(mid, qos)`` is called for each
+    message once its rows are committed, or once it is rejected as
+    undecodable.
+    """
+
+    def __init__(self, store, ack=None, queue_size=QUEUE_MESSAGES, batch_rows=BATCH_ROWS,
+                 flush_interval=FLUSH_INTERVAL, dedup_ids=DEDUP_IDS):
+        self.store = store
+        self.ack = ack
+        self.batch_rows = batch_rows
+        self.flush_interval = flush_interval
+        self.recent = RecentIds(dedup_ids)
+        self.queue = asyncio.Queue(queue_size)
+        self.loop = asyncio.get_event_loop()
+        self.running = True
+        self.backoff = Backoff(1.0, 30.0)
+
+        QUEUE_DEPTH.set_function(self.queue.qsize)
+
+    # ---------- MQTT thread ----------
+    def submit(self, topic, payload, mid=0, qos=0):
+        item = (time.time(), topic, payload, mid, qos)
+        future = asyncio.run_coroutine_threadsafe(self.queue.put(item), self.loop)
+        while True:
+            try:
+                return future.result(timeout=1.0)
+            except concurrent.futures.TimeoutError:
+                if not self.running:
+                    # Shutting down with a full queue: leave it to the redelivery
+                    future.cancel()
+                    return
+
+    # ---------- event loop ----------
+    async def _collect(self):
+        """Messages until ``batch_rows`` readings or ``flush_interval`` passes."""
+        try:
+            first = await asyncio.wait_for(self.queue.get(), timeout=1.0)
+        except asyncio.TimeoutError:
+            return [], [], []
+
+        rows, keys, acks = [], [], []
+        deadline = self.loop.time() + self.flush_interval
+        item = first
+        while True:
+            self._decode(item, rows, keys, acks)
+            if len(rows) >= self.batch_rows:
+                break
+            try:
+                item = self.queue.get_nowait()
+            except asyncio.QueueEmpty:
+                remaining = deadline - self.loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    break
+        return rows, keys, acks
+
+    def _decode(self, item, rows, keys, acks):
+        received_at, topic, payload, mid, qos = item
+        MESSAGES.inc()
+        acks.append((mid, qos, received_at))
+        try:
+            readings = lf.parse_event(payload)
+        except Exception as e:
+            BAD_MESSAGES.inc()
+            log.warning("⚠️ Bad payload on %s: %s", topic, e, extra=logsetup.every(60))
+            return
+
+        for data in readings:
+            device = _device_of(data, topic)
+            reading_id = data.get("id")
+            if reading_id is not None:
+                if self.recent.seen(device, reading_id):
+                    DUPLICATES.inc()
+                    continue
+                keys.append((device, reading_id))
+            rows.append(lf.row_values(data) + (device, reading_id))
+
+    async def _write(self, rows, keys, acks):
+        """Commit one batch, retrying until it succeeds or the gateway stops."""
+        while rows:
+            try:
+                with WRITE_SECONDS.time():
+                    inserted = await self.loop.run_in_executor(None, self.store.write, rows)
+                break
+            except Exception as e:
+                WRITE_ERRORS.inc()
+                delay = self.backoff.next_delay()
+                log.error("❌ Write of %d rows failed, retrying in %.1fs: %s", len(rows), delay, e)
+                if not self.running:
+                    # Unacked messages are redelivered after a restart
+                    self.recent.forget(keys)
+                    return
+                await asyncio.sleep(delay)
+        else:
+            inserted = 0
+
+        self.backoff.reset()
+        now = time.time()
+        if rows:
+            COMMITS.inc()
+            ROWS.inc(inserted)
+            DUPLICATES.inc(len(rows) - inserted)
+            parsed = {}
+            for row in rows:
+                if row[0] not in parsed:
+                    parsed[row[0]] = _sample_time(row[0])
+            sample_times = [parsed[row[0]] for row in rows if parsed[row[0]] is not None]
+            for sample_time in sample_times:
+                INGEST_LAG.observe(max(0.0, now - sample_time))
+            if sample_times:
+                LAST_LAG.set(max(0.0, now - min(sample_times)))
+
+        for mid, qos, received_at in acks:
+            QUEUE_LAG.observe(now - received_at)
+            if qos and self.ack is not None:
+                self.ack(mid, qos)
+
+    async def run(self):
+        writing = None
+        last_stats = time.monotonic()
+        try:
+            while self.running or not self.queue.empty():
+                batch = await self._collect()
+                if writing is not None:
+                    await writing
+                    writing = None
+                if batch[2]:
+                    writing = self.loop.create_task(self._write(*batch))
+
+                if time.monotonic() - last_stats >= STATS_INTERVAL:
+                    last_stats = time.monotonic()
+                    log.info(
+                        "📥 %d messages, %d rows, %d duplicates, queue=%d, lag=%.1fs",
+                        MESSAGES.value, ROWS.value, DUPLICATES.value,
+                        self.queue.qsize(), LAST_LAG.value
+                    )
+        finally:
+            if writing is not None:
+                await writing
+
+    def stop(self):
+        self.running = False
+
+
+# ================= MQTT =================
+def make_client():
+    # paho 2.x needs the callback API version and can hold back PUBACKs
+    if hasattr(mqtt, "CallbackAPIVersion"):
+        client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1, client_id=CLIENT_ID, clean_session=False)
+        client.manual_ack_set(True)
+        return client, client.ack
+    return mqtt.Client(client_id=CLIENT_ID, clean_session=False), None
+
+
+def main():
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    store = open_store()
+    client, ack = make_client()
+    gateway = Gateway(store, ack=ack)
+
+    def on_connect(client, userdata, flags, rc):
+        if rc == 0:
+            log.info("✅ Connected to %s:%d, subscribing to %s", BROKER_HOST, BROKER_PORT, ", ".join(TOPICS))
+            client.subscribe([(topic, 1) for topic in TOPICS])
+        else:
+            log.error("❌ Broker refused connection, rc=%s", rc)
+
+    def on_disconnect(client, userdata, rc):
+        log.warning("⚠️ Disconnected from broker, rc=%s", rc)
+
+    def on_message(client, userdata, msg):
+        gateway.submit(msg.topic, msg.payload, msg.mid, msg.qos)
+
+    client.on_connect = on_connect
+    client.on_disconnect = on_disconnect
+    client.on_message = on_message
+    client.reconnect_delay_set(min_delay=1, max_delay=30)
+
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, gateway.stop)
+
+    metrics.start_exporter(METRICS_PORT)
+    log.info("🚀 Ingest gateway writing to %s", "Postgres" if STORE == "postgres" else DB_PATH)
+    client.connect_async(BROKER_HOST, BROKER_PORT, keepalive=60)
+    client.loop_start()
+    try:
+        loop.run_until_complete(gateway.run())
+    finally:
+        client.disconnect()
+        client.loop_stop()
+        store.close()
+        loop.close()
+        log.info("🛑 Ingest gateway stopped")
+
+
+if __name__ == "__main__":
+    main()
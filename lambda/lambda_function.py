@@ -1,46 +1,219 @@
 import os
+import sys
 import json
+import base64
 import pg8000
 from datetime import datetime
 
+try:
+    from payload_codec import decode_batch, is_compact, ms_to_timestamp
+except ImportError:
+    # Local checkout: the codec lives in the project root (bundle it in the Lambda zip)
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+    from payload_codec import decode_batch, is_compact, ms_to_timestamp
+
 SUPABASE_URL = os.environ.get("SUPABASE_URL")
 SUPABASE_DB = os.environ.get("SUPABASE_DB", "postgres")
 SUPABASE_USER = os.environ.get("SUPABASE_USER", "postgres")
 SUPABASE_PASSWORD = os.environ.get("SUPABASE_PASSWORD")
 SUPABASE_PORT = int(os.environ.get("SUPABASE_PORT", 5432))
 
-def lambda_handler(event, context):
-    # Parse incoming event
-    data = event if isinstance(event, dict) else json.loads(event)
-
-    created_at = data.get("created_at", datetime.utcnow().isoformat())
-    bp_pressure = data.get("bp_pressure", 0.0)
-    fp_pressure = data.get("fp_pressure", 0.0)
-    cr_pressure = data.get("cr_pressure", 0.0)
-    bc_pressure = data.get("bc_pressure", 0.0)
-    brake_fault = data.get("brake_fault", "none")
-    brake_time = data.get("brake_time", datetime.utcnow().isoformat())
-    event_trigger = data.get("event_trigger", "none")
-    brake_status = data.get("brake_status", "idle")
 
+# Channels a compact batch may carry; anything else (e.g. the rpi4's raw
+# ADC counts) is rejected rather than stored as 0.0 by row_values()
+CHANNELS = ("bp_pressure", "fp_pressure", "cr_pressure", "bc_pressure")
+
+
+def _compact_readings(raw):
+    batch = decode_batch(raw)
+    unknown = [name for name in batch["channels"] if name not in CHANNELS]
+    if unknown:
+        raise ValueError(f"unknown channel(s) {unknown}; expected some of {list(CHANNELS)}")
+    readings = []
+    for reading in batch["readings"]:
+        data = {name: reading[name] for name in batch["channels"]}
+        data["created_at"] = ms_to_timestamp(reading["ts_ms"])
+        # Not stored by lambda_handler; ingest_gateway dedups on them
+        data["id"] = reading["id"]
+        data["device_id"] = batch["device_id"]
+        readings.append(data)
+    return readings
+
+
+def parse_event(event):
+    # Compact binary payloads arrive as bytes, or base64 under "data" when the
+    # IoT rule uses: SELECT encode(*, 'base64') AS data FROM 'brake/pressure'
+    if isinstance(event, (bytes, bytearray)):
+        raw = bytes(event)
+    elif isinstance(event, dict) and isinstance(event.get("data"), str):
+        raw = base64.b64decode(event["data"])
+    else:
+        raw = None
+
+    if raw is not None:
+        if is_compact(raw):
+            return _compact_readings(raw)
+        event = raw.decode("utf-8")
+
+    data = event if isinstance(event, (dict, list)) else json.loads(event)
+    return data if isinstance(data, list) else [data]
+
+
+def row_values(data):
+    return (
+        data.get("created_at", datetime.utcnow().isoformat()),
+        data.get("bp_pressure", 0.0),
+        data.get("fp_pressure", 0.0),
+        data.get("cr_pressure", 0.0),
+        data.get("bc_pressure", 0.0),
+        data.get("brake_fault", "none"),
+        data.get("brake_time", datetime.utcnow().isoformat()),
+        data.get("event_trigger", "none"),
+        data.get("brake_status", "idle"),
+    )
+
+
+# ================= CONNECTION REUSE =================
+# Kept at module scope so warm invocations skip the TLS + Postgres handshake.
+_conn = None
+
+INSERT_CHUNK = 500          # rows per multi-row INSERT statement
+
+COLUMNS = (
+    "created_at", "bp_pressure", "fp_pressure", "cr_pressure", "bc_pressure",
+    "brake_fault", "brake_time", "event_trigger", "brake_status",
+)
+
+# Device brake events (brake_events.py) also keep their whole record,
+# pre/post windows and summary included; brake_data gets the usual row
+EVENT_COLUMNS = (
+    "device_id", "event_id", "created_at", "event_trigger",
+    "brake_status", "brake_fault", "duration", "record",
+)
+
+EVENTS_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS brake_events (
+    id BIGSERIAL PRIMARY KEY,
+    device_id TEXT,
+    event_id BIGINT,
+    created_at TEXT,
+    event_trigger TEXT,
+    brake_status TEXT,
+    brake_fault TEXT,
+    duration REAL,
+    record JSONB,
+    UNIQUE (device_id, event_id)
+)
+"""
+
+
+def is_brake_event(data):
+    return isinstance(data, dict) and "event_id" in data
+
+
+def event_values(data):
+    return (
+        data.get("device_id"),
+        data["event_id"],
+        data.get("created_at"),
+        data.get("event_trigger"),
+        data.get("brake_status"),
+        data.get("brake_fault"),
+        data.get("duration"),
+        json.dumps(data, separators=(",", ":")),
+    )
+
+
+def _connect():
+    return pg8000.connect(
+        host=SUPABASE_URL.replace("https://", ""),
+        database=SUPABASE_DB,
+        user=SUPABASE_USER,
+        password=SUPABASE_PASSWORD,
+        port=SUPABASE_PORT
+    )
+
+
+def _close():
+    global _conn
     try:
-        conn = pg8000.connect(
-            host=SUPABASE_URL.replace("https://", ""),
-            database=SUPABASE_DB,
-            user=SUPABASE_USER,
-            password=SUPABASE_PASSWORD,
-            port=SUPABASE_PORT
-        )
-        cursor = conn.cursor()
-        cursor.execute("""
-            INSERT INTO brake_data
-            (created_at, bp_pressure, fp_pressure, cr_pressure, bc_pressure, brake_fault, brake_time, event_trigger, brake_status)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-        """, (created_at, bp_pressure, fp_pressure, cr_pressure, bc_pressure,
-              brake_fault, brake_time, event_trigger, brake_status))
+        if _conn is not None:
+            _conn.close()
+    except Exception:
+        pass
+    _conn = None
+
+
+def get_connection():
+    global _conn
+    if _conn is not None:
+        try:
+            cursor = _conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchall()
+            cursor.close()
+            return _conn
+        except Exception:
+            _close()
+
+    _conn = _connect()
+    return _conn
+
+
+def insert_rows(conn, rows, events=()):
+    """Insert all rows (and event records) in one transaction using multi-row INSERTs."""
+    cursor = conn.cursor()
+    try:
+        placeholders = "(" + ", ".join(["%s"] * len(COLUMNS)) + ")"
+        for start in range(0, len(rows), INSERT_CHUNK):
+            chunk = rows[start:start + INSERT_CHUNK]
+            params = [value for row in chunk for value in row]
+            cursor.execute(
+                f"INSERT INTO brake_data ({', '.join(COLUMNS)}) VALUES "
+                + ", ".join([placeholders] * len(chunk)),
+                params
+            )
+        if events:
+            # Events are rare; QoS1 redeliveries hit the unique key
+            cursor.execute(EVENTS_TABLE_SQL)
+            placeholders = "(" + ", ".join(["%s"] * (len(EVENT_COLUMNS) - 1)) + ", %s::jsonb)"
+            cursor.execute(
+                f"INSERT INTO brake_events ({', '.join(EVENT_COLUMNS)}) VALUES "
+                + ", ".join([placeholders] * len(events))
+                + " ON CONFLICT (device_id, event_id) DO NOTHING",
+                [value for event in events for value in event]
+            )
         conn.commit()
+    except Exception:
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+        raise
+    finally:
         cursor.close()
-        conn.close()
-        return {"statusCode": 200, "body": json.dumps("Inserted into Supabase successfully!")}
+
+
+def lambda_handler(event, context):
+    # Parse incoming event (single JSON reading, JSON array, compact batch or brake event)
+    try:
+        readings = parse_event(event)
+        rows = [row_values(data) for data in readings]
+        events = [event_values(data) for data in readings if is_brake_event(data)]
+    except Exception as e:
+        return {"statusCode": 400, "body": f"Bad payload: {e}"}
+
+    if not rows:
+        return {"statusCode": 200, "body": json.dumps("Nothing to insert")}
+
+    try:
+        try:
+            insert_rows(get_connection(), rows, events)
+        except pg8000.InterfaceError:
+            # Connection dropped between the health check and the insert: retry once
+            _close()
+            insert_rows(get_connection(), rows, events)
+        return {"statusCode": 200, "body": json.dumps(f"Inserted {len(rows)} row(s) into Supabase successfully!")}
     except Exception as e:
+        _close()
         return {"statusCode": 500, "body": str(e)}
@@ -0,0 +1,212 @@
+import os
+import random
+import sqlite3
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import metrics
+
+# ---------------- LINK STATES ----------------
+GOOD = "good"
+DEGRADED = "degraded"      # slow: long PUBACK round trips or occasional resends
+POOR = "poor"              # lossy: frequent resends, disconnects or failed probes
+DOWN = "down"              # not connected
+STATES = (GOOD, DEGRADED, POOR, DOWN)
+
+# ---------------- THRESHOLDS ----------------
+RTT_DEGRADED = float(os.environ.get("LINK_RTT_DEGRADED", 1.0))     # seconds, smoothed PUBACK RTT
+RTT_POOR = float(os.environ.get("LINK_RTT_POOR", 4.0))
+FAILURE_DEGRADED = 0.05                  # resends + disconnects per publish
+FAILURE_POOR = 0.25
+PROBE_FAILURE_POOR = 0.5                 # share of network.py checks that failed
+PROBE_RTT_DEGRADED = float(os.environ.get("LINK_PROBE_RTT_DEGRADED", 1.5))  # seconds, mean network.py response
+PROBE_RTT_POOR = float(os.environ.get("LINK_PROBE_RTT_POOR", 3.5))
+
+DEFAULT_INTERVAL = 5.0                   # seconds between link re-evaluations
+DEFAULT_ALPHA = 0.3                      # EWMA weight of the newest interval
+PROBE_WINDOW = 60                        # seconds of network.py checks to consider
+PROBE_LIMIT = 12                         # at most this many checks (one per 10 s)
+
+# ---------------- PROFILES ----------------
+# How the uploader sends in each state. Long round trips are amortised with
+# bigger, compressed batches; on a lossy link batches shrink so a resend
+# costs less, fewer are in flight, and the outage backlog waits.
+LinkProfile = namedtuple(
+    "LinkProfile", "batch_scale bytes_scale window_scale compress max_wait_scale backlog_share"
+)
+
+PROFILES = {
+    GOOD: LinkProfile(1.0, 1.0, 1.0, False, 1.0, 1.0),
+    DEGRADED: LinkProfile(2.0, 1.0, 1.0, True, 2.0, 0.5),
+    POOR: LinkProfile(0.5, 0.5, 0.25, True, 4.0, 0.0),
+    DOWN: LinkProfile(0.5, 0.5, 0.25, True, 4.0, 0.0),
+}
+
+LINK_STATE = metrics.gauge("upload_link_state", "Link quality: 0 good, 1 degraded, 2 poor, 3 down")
+LINK_RTT = metrics.gauge("upload_link_rtt_seconds", "Smoothed PUBACK round trip")
+LINK_FAILURES = metrics.gauge("upload_link_failure_ratio", "Smoothed resends and disconnects per publish")
+LINK_THROUGHPUT = metrics.gauge("upload_link_throughput_bytes", "Smoothed acknowledged payload bytes per second")
+LINK_CHANGES = metrics.counter("upload_link_state_changes", "Link state transitions")
+
+
+# ---------------- NETWORK MONITOR PROBES ----------------
+def read_probes(path, window=PROBE_WINDOW, limit=PROBE_LIMIT):
+    """Recent device/network.py checks as ``(mean_response_time, failure_ratio, count)``.
+
+    Returns None if the database is missing, unreadable or has nothing
+    from the last ``window`` seconds (the monitor is not running).
+    """
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, timeout=1)
+        try:
+            rows = conn.execute(
+                "SELECT timestamp, response_time, error_message FROM network_log "
+                "ORDER BY id DESC LIMIT ?",
+                (limit,),
+            ).fetchall()
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return None
+
+    # network.py writes local wall-clock time
+    since = (datetime.now() - timedelta(seconds=window)).strftime("%Y-%m-%d %H:%M:%S")
+    recent = [row for row in rows if row[0] and row[0] >= since]
+    if not recent:
+        return None
+
+    times = [row[1] for row in recent if row[2] is None and row[1] is not None]
+    failures = len(recent) - len(times)
+    mean_time = sum(times) / len(times) if times else None
+    return mean_time, failures / len(recent), len(recent)
+
+
+# ---------------- LINK MONITOR ----------------
+class LinkMonitor:
+    """Link quality from the uploader's own publishes, plus network.py probes.
+
+    Every ``interval`` seconds ``update()`` takes the change in each
+    publisher's counters (acks, round-trip time, resends, acked bytes) and
+    folds it into smoothed RTT, failure ratio and throughput. Failed or
+    slow probes from ``probe_db`` count against the link too, which
+    matters while little is being published. Returns the link state.
+    """
+
+    def __init__(self, publishers, probe_db=None, interval=DEFAULT_INTERVAL,
+                 alpha=DEFAULT_ALPHA, clock=time.monotonic):
+        self.publishers = publishers
+        self.probe_db = probe_db
+        self.interval = interval
+        self.alpha = alpha
+        self.clock = clock
+
+        self.state = GOOD
+        self.rtt = None
+        self.failure_ratio = 0.0
+        self.throughput = 0.0
+        self.probe = None
+        self.connected = False
+
+        self._disconnects = 0
+        self._last = None
+        self._updated_at = None
+
+    @property
+    def profile(self):
+        return PROFILES[self.state]
+
+    def _totals(self):
+        totals = [0, 0, 0, 0.0, 0]
+        for publisher in self.publishers:
+            totals[0] += publisher.sent
+            totals[1] += publisher.acked
+            totals[2] += publisher.resent
+            totals[3] += publisher.rtt_sum
+            totals[4] += publisher.acked_bytes
+        return totals + [self._disconnects]
+
+    def _smooth(self, old, new):
+        return new if old is None else old + self.alpha * (new - old)
+
+    # ---------- events ----------
+    def set_connected(self, connected):
+        if self.connected and not connected:
+            self._disconnects += 1
+        self.connected = connected
+
+    # ---------- evaluation ----------
+    def update(self):
+        """Re-evaluate if ``interval`` has passed; return the (possibly new) state."""
+        now = self.clock()
+        if self._updated_at is not None and now - self._updated_at < self.interval:
+            return self.state
+
+        totals = self._totals()
+        if self._last is not None:
+            elapsed = now - self._updated_at
+            sent, acked, resent, rtt_sum, acked_bytes, disconnects = (
+                new - old for new, old in zip(totals, self._last)
+            )
+            if acked:
+                self.rtt = self._smooth(self.rtt, rtt_sum / acked)
+            if sent or resent or disconnects:
+                attempts = max(sent + resent, 1)
+                self.failure_ratio = self._smooth(
+                    self.failure_ratio, min(1.0, (resent + disconnects) / attempts)
+                )
+            self.throughput = self._smooth(self.throughput, acked_bytes / elapsed if elapsed > 0 else 0.0)
+        self._last = totals
+        self._updated_at = now
+        self.probe = read_probes(self.probe_db) if self.probe_db else None
+
+        self._set_state(self._classify())
+        return self.state
+
+    def _classify(self):
+        if not self.connected:
+            return DOWN
+        probe_rtt, probe_failures = self.probe[:2] if self.probe else (None, 0.0)
+        if self.failure_ratio >= FAILURE_POOR or probe_failures >= PROBE_FAILURE_POOR:
+            return POOR
+        if self.rtt is not None and self.rtt >= RTT_POOR:
+            return POOR
+        if probe_rtt is not None and probe_rtt >= PROBE_RTT_POOR:
+            return POOR
+        if self.failure_ratio >= FAILURE_DEGRADED or probe_failures > 0:
+            return DEGRADED
+        if self.rtt is not None and self.rtt >= RTT_DEGRADED:
+            return DEGRADED
+        if probe_rtt is not None and probe_rtt >= PROBE_RTT_DEGRADED:
+            return DEGRADED
+        return GOOD
+
+    def _set_state(self, state):
+        if state != self.state:
+            LINK_CHANGES.inc()
+        self.state = state
+        LINK_STATE.set(STATES.index(state))
+        LINK_RTT.set(self.rtt or 0.0)
+        LINK_FAILURES.set(self.failure_ratio)
+        LINK_THROUGHPUT.set(self.throughput)
+
+
+# ---------------- RECONNECT BACKOFF ----------------
+class Backoff:
+    """Exponential delay with jitter, reset after a success."""
+
+    def __init__(self, base=1.0, cap=120.0, rand=random.random):
+        self.base = base
+        self.cap = cap
+        self.rand = rand
+        self.failures = 0
+
+    def next_delay(self):
+        delay = min(self.cap, self.base * 2 ** min(self.failures, 30))
+        self.failures += 1
+        return delay * (0.5 + 0.5 * self.rand())
+
+    def reset(self):
+        self.failures = 0
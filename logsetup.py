@@ -0,0 +1,142 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+
+# ---------------- CONFIG ----------------
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "text")          # "text" or "json" (one object per line)
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", 10000))
+
+TEXT_FORMAT = "%(asctime)s %(levelname)-7s %(name)s | %(message)s"
+
+
+def every(seconds):
+    """``extra=`` for a message that should be logged at most once per ``seconds``.
+
+        log.debug("⏭ No significant change → Skipped insert", extra=every(60))
+    """
+    return {"every": seconds}
+
+
+# ---------------- HANDLERS ----------------
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Enqueue the record as-is; never block the caller.
+
+    The stock QueueHandler formats the message before enqueueing, which is
+    exactly the work we want off the hot loop. Records are formatted by the
+    listener thread instead, so callers must pass immutable arguments
+    (numbers, strings, tuples) as they all do here. When the queue is full
+    the record is dropped and counted rather than stalling capture.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class RateLimitFilter(logging.Filter):
+    """Pass a message tagged with ``every(seconds)`` once per interval.
+
+    Messages are keyed by logger and format string, so the arguments may
+    differ between calls. The next message let through reports how many
+    were suppressed in between.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        super().__init__()
+        self.clock = clock
+        self._state = {}       # (logger, msg) -> [next_allowed, suppressed]
+
+    def filter(self, record):
+        interval = getattr(record, "every", None)
+        if interval is None:
+            return True
+
+        key = (record.name, record.msg)
+        now = self.clock()
+        state = self._state.get(key)
+        if state is None:
+            self._state[key] = [now + interval, 0]
+            return True
+        if now < state[0]:
+            state[1] += 1
+            return False
+
+        record.suppressed = state[1]
+        state[0], state[1] = now + interval, 0
+        return True
+
+
+# ---------------- FORMATTERS ----------------
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        text = super().format(record)
+        suppressed = getattr(record, "suppressed", 0)
+        return f"{text} (+{suppressed} suppressed)" if suppressed else text
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "suppressed", 0):
+            entry["suppressed"] = record.suppressed
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+# ---------------- SETUP ----------------
+_listener = None
+
+
+def setup(name, level=LOG_LEVEL, fmt=LOG_FORMAT, stream=None):
+    """Route all logging through a queue to one background writer thread.
+
+    Safe to call more than once; only the first call installs handlers.
+    Returns ``logging.getLogger(name)``.
+    """
+    global _listener
+    if _listener is None:
+        output = logging.StreamHandler(stream or sys.stdout)
+        output.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter(TEXT_FORMAT))
+
+        log_queue = queue.Queue(LOG_QUEUE_SIZE)
+        handler = DeferredQueueHandler(log_queue)
+        handler.addFilter(RateLimitFilter())
+
+        root = logging.getLogger()
+        root.handlers[:] = [handler]
+        root.setLevel(level)
+
+        _listener = logging.handlers.QueueListener(log_queue, output)
+        _listener.start()
+        atexit.register(shutdown)
+
+    return logging.getLogger(name)
+
+
+def shutdown():
+    """Write out everything still queued (also run at exit)."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
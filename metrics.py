@@ -0,0 +1,238 @@
+import bisect
+import logging
+import math
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import logsetup
+
+# ---------------- CONFIG ----------------
+METRICS_ADDR = os.environ.get("METRICS_ADDR", "127.0.0.1")
+METRICS_FILE = os.environ.get("METRICS_FILE")                          # Prometheus textfile output (optional)
+METRICS_FILE_INTERVAL = float(os.environ.get("METRICS_FILE_INTERVAL", 15))
+
+# Seconds; covers an I2C conversion (~1 ms) up to a stalled MQTT round trip
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+log = logging.getLogger(__name__)
+
+
+# ---------------- METRIC TYPES ----------------
+# Updates are plain attribute writes with no lock: each metric is updated
+# from one thread, and a scrape seeing a value one update old is fine.
+class Counter:
+    kind = "counter"
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def samples(self, name, labels):
+        yield name + "_total", labels, self.value
+
+
+class Gauge:
+    kind = "gauge"
+
+    def __init__(self):
+        self.value = 0
+        self._function = None
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def set_function(self, function):
+        """Read the value from ``function()`` at scrape time instead."""
+        self._function = function
+
+    def samples(self, name, labels):
+        value = self.value
+        if self._function is not None:
+            try:
+                value = self._function()
+            except Exception:
+                value = math.nan
+        yield name, labels, value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)   # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def time(self):
+        return _Timer(self)
+
+    def samples(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), self.counts):
+            cumulative += count
+            le = "+Inf" if bound == math.inf else repr(float(bound))
+            yield name + "_bucket", labels + (("le", le),), cumulative
+        yield name + "_sum", labels, self.sum
+        yield name + "_count", labels, self.count
+
+
+class _Timer:
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+# ---------------- REGISTRY ----------------
+class Registry:
+    """Named metric families, rendered in the Prometheus text format.
+
+    Asking twice for the same name and labels returns the same metric, so
+    modules can declare what they update at import time.
+    """
+
+    def __init__(self):
+        self._families = {}        # name -> [cls, help, {labels: metric}]
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, help, labels, **kwargs):
+        key = tuple(sorted((labels or {}).items()))
+        with self._lock:
+            family = self._families.setdefault(name, [cls, help, {}])
+            if family[0] is not cls:
+                raise ValueError(f"metric {name!r} already registered as {family[0].kind}")
+            metric = family[2].get(key)
+            if metric is None:
+                metric = family[2][key] = cls(**kwargs)
+        return metric
+
+    def counter(self, name, help="", labels=None):
+        return self._get(Counter, name, help, labels)
+
+    def gauge(self, name, help="", labels=None):
+        return self._get(Gauge, name, help, labels)
+
+    def histogram(self, name, help="", labels=None, buckets=DEFAULT_BUCKETS):
+        return self._get(Histogram, name, help, labels, buckets=buckets)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            families = [(name, cls, help, dict(series))
+                        for name, (cls, help, series) in sorted(self._families.items())]
+
+        for name, cls, help, series in families:
+            if help:
+                lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {cls.kind}")
+            for labels, metric in series.items():
+                for sample, sample_labels, value in metric.samples(name, labels):
+                    lines.append(f"{sample}{_format_labels(sample_labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    # ---------- exposition ----------
+    def serve(self, port, addr=METRICS_ADDR):
+        """Serve /metrics on a daemon thread; returns the server."""
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((addr, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+        return server
+
+    def write_file(self, path):
+        # Atomic replace so node_exporter's textfile collector never reads half a file
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(self.render())
+        os.replace(tmp, path)
+
+    def start_file_writer(self, path, interval=METRICS_FILE_INTERVAL):
+        def loop():
+            while True:
+                try:
+                    self.write_file(path)
+                except OSError as e:
+                    log.warning("⚠️ Metrics file write failed: %s", e, extra=logsetup.every(300))
+                time.sleep(interval)
+
+        thread = threading.Thread(target=loop, name="metrics-file", daemon=True)
+        thread.start()
+        return thread
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        (k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in labels
+    )
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+def _format_value(value):
+    if value is None:
+        return "NaN"
+    if isinstance(value, float):
+        if math.isnan(value):
+            return "NaN"
+        if math.isinf(value):
+            return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if isinstance(value, float) else str(int(value))
+
+
+# ---------------- DEFAULT REGISTRY ----------------
+REGISTRY = Registry()
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+histogram = REGISTRY.histogram
+
+
+def start_exporter(default_port):
+    """Expose REGISTRY as configured by METRICS_PORT / METRICS_FILE.
+
+    ``default_port`` is per process so capture and upload can both listen;
+    METRICS_PORT=0 turns the HTTP endpoint off.
+    """
+    port = int(os.environ.get("METRICS_PORT", default_port))
+    if port:
+        try:
+            REGISTRY.serve(port)
+            log.info("📈 Metrics on http://%s:%d/metrics", METRICS_ADDR, port)
+        except OSError as e:
+            log.warning("⚠️ Metrics endpoint unavailable on port %d: %s", port, e)
+    if METRICS_FILE:
+        REGISTRY.start_file_writer(METRICS_FILE)
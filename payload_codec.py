@@ -0,0 +1,216 @@
+import calendar
+import struct
+import time
+import zlib
+
+# ---------------- FORMAT ----------------
+# Compact batch payload, version 1:
+#
+#   magic "BP" | version u8 | flags u8 | body (zlib-deflated if FLAG_ZLIB)
+#
+#   body := device_id | scale | n_channels | channel names | count | readings
+#   reading := Δid | Δts_ms | presence bitmask | Δvalue for each present channel
+#
+# Integers are LEB128 varints, signed ones zigzag-encoded. Values are sent as
+# round(value * scale) and delta-encoded per channel against the previous
+# present value, so slow-moving pressures cost one byte per channel.
+MAGIC = b"BP"
+VERSION = 1
+FLAG_ZLIB = 0x01
+
+_HEADER = struct.Struct(">2sBB")
+_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+# ---------------- VARINTS ----------------
+def _put_uvarint(out, n):
+    while n > 0x7F:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _put_svarint(out, n):
+    _put_uvarint(out, -2 * n - 1 if n < 0 else 2 * n)
+
+
+def _get_uvarint(buf, pos):
+    result = shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+
+def _get_svarint(buf, pos):
+    n, pos = _get_uvarint(buf, pos)
+    return (n >> 1) ^ -(n & 1), pos
+
+
+def _put_str(out, s):
+    data = s.encode("utf-8")
+    _put_uvarint(out, len(data))
+    out += data
+
+
+def _get_str(buf, pos):
+    n, pos = _get_uvarint(buf, pos)
+    return bytes(buf[pos:pos + n]).decode("utf-8"), pos + n
+
+
+# ---------------- TIMESTAMPS ----------------
+def timestamp_to_ms(value):
+    """DB timestamp ('YYYY-MM-DD HH:MM:SS', UTC) or epoch seconds -> epoch ms."""
+    if isinstance(value, (int, float)):
+        return int(round(value * 1000))
+    return calendar.timegm(time.strptime(str(value)[:19], _TIME_FORMAT)) * 1000
+
+
+def ms_to_timestamp(ms):
+    return time.strftime(_TIME_FORMAT, time.gmtime(ms / 1000))
+
+
+# ---------------- ENCODER ----------------
+def encode_batch(readings, channels, scale=1, device_id="", compress=False):
+    """Encode ``[(id, ts_ms, values), ...]`` into one compact payload.
+
+    ``values`` has one entry per name in ``channels``; ``None`` marks a
+    channel without a point in that reading.
+    """
+    n_channels = len(channels)
+    mask_bytes = (n_channels + 7) // 8
+
+    body = bytearray()
+    _put_str(body, device_id or "")
+    _put_uvarint(body, scale)
+    _put_uvarint(body, n_channels)
+    for name in channels:
+        _put_str(body, name)
+
+    readings = list(readings)
+    _put_uvarint(body, len(readings))
+
+    prev_id = 0
+    prev_ts = 0
+    prev_values = [0] * n_channels
+
+    for id_, ts_ms, values in readings:
+        _put_svarint(body, id_ - prev_id)
+        _put_svarint(body, ts_ms - prev_ts)
+        prev_id, prev_ts = id_, ts_ms
+
+        mask = 0
+        for i, v in enumerate(values):
+            if v is not None:
+                mask |= 1 << i
+        body += mask.to_bytes(mask_bytes, "little")
+
+        for i, v in enumerate(values):
+            if v is None:
+                continue
+            q = int(round(v * scale))
+            _put_svarint(body, q - prev_values[i])
+            prev_values[i] = q
+
+    flags = 0
+    if compress:
+        body = zlib.compress(bytes(body), 9)
+        flags |= FLAG_ZLIB
+
+    return _HEADER.pack(MAGIC, VERSION, flags) + bytes(body)
+
+
+# ---------------- DECODER ----------------
+def is_compact(data):
+    return isinstance(data, (bytes, bytearray)) and bytes(data[:2]) == MAGIC
+
+
+def decode_batch(data):
+    """Inverse of encode_batch().
+
+    Returns ``{"device_id", "channels", "readings"}`` where each reading is
+    a dict with ``id``, ``ts_ms`` and one key per channel.
+    """
+    magic, version, flags = _HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError("not a compact payload")
+    if version != VERSION:
+        raise ValueError(f"unsupported compact payload version {version}")
+
+    body = data[_HEADER.size:]
+    if flags & FLAG_ZLIB:
+        body = zlib.decompress(body)
+    body = memoryview(bytes(body))
+
+    pos = 0
+    device_id, pos = _get_str(body, pos)
+    scale, pos = _get_uvarint(body, pos)
+    n_channels, pos = _get_uvarint(body, pos)
+    channels = []
+    for _ in range(n_channels):
+        name, pos = _get_str(body, pos)
+        channels.append(name)
+    count, pos = _get_uvarint(body, pos)
+
+    mask_bytes = (n_channels + 7) // 8
+    prev_id = prev_ts = 0
+    prev_values = [0] * n_channels
+    readings = []
+
+    for _ in range(count):
+        delta, pos = _get_svarint(body, pos)
+        prev_id += delta
+        delta, pos = _get_svarint(body, pos)
+        prev_ts += delta
+
+        mask = int.from_bytes(body[pos:pos + mask_bytes], "little")
+        pos += mask_bytes
+
+        reading = {"id": prev_id, "ts_ms": prev_ts}
+        for i, name in enumerate(channels):
+            if mask >> i & 1:
+                delta, pos = _get_svarint(body, pos)
+                prev_values[i] += delta
+                reading[name] = prev_values[i] / scale if scale != 1 else prev_values[i]
+            else:
+                reading[name] = None
+        readings.append(reading)
+
+    return {"device_id": device_id, "channels": channels, "readings": readings}
+
+
+# ---------------- SELF CHECK ----------------
+if __name__ == "__main__":
+    import json
+    import random
+
+    random.seed(7)
+    channels = ("bp_pressure", "fp_pressure", "cr_pressure", "bc_pressure")
+    start_ms = timestamp_to_ms("2024-01-01 00:00:00")
+    values = [5.0, 5.0, 5.0, 0.0]
+    rows = []
+    for i in range(500):
+        values = [max(0.0, round(v + random.uniform(-0.3, 0.3), 2)) for v in values]
+        row_values = [v if random.random() > 0.2 else None for v in values]
+        rows.append((1000 + i, start_ms + i * 300 + random.randint(0, 20), row_values))
+
+    for compress in (False, True):
+        blob = encode_batch(rows, channels, scale=100, device_id="pressure01", compress=compress)
+        decoded = decode_batch(blob)
+        assert decoded["device_id"] == "pressure01"
+        for (id_, ts_ms, vals), got in zip(rows, decoded["readings"]):
+            assert got["id"] == id_ and got["ts_ms"] == ts_ms
+            assert [got[c] for c in channels] == vals, (vals, got)
+        label = "compact+zlib" if compress else "compact"
+        print(f"{label:>13}: {len(blob) / len(rows):6.1f} bytes/reading")
+
+    as_json = json.dumps([
+        {"id": id_, "bp": v[0], "fp": v[1], "cr": v[2], "bc": v[3],
+         "timestamp": ms_to_timestamp(ts)}
+        for id_, ts, v in rows
+    ])
+    print(f"{'json':>13}: {len(as_json) / len(rows):6.1f} bytes/reading")
+    print("✅ round trip ok")
@@ -0,0 +1,104 @@
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+# ---------------- CONSTANTS ----------------
+ADC_MAX = 32767
+ADC_CODES = 65536                      # every possible signed 16-bit ADS1115 code
+ADC_OFFSET = 32768                     # table index = raw + ADC_OFFSET
+
+# ADS1115 PGA gain -> full-scale voltage
+GAIN_FULL_SCALE = {
+    2 / 3: 6.144,
+    1: 4.096,
+    2: 2.048,
+    4: 1.024,
+    8: 0.512,
+    16: 0.256,
+}
+
+
+# ---------------- CALIBRATION ----------------
+class Calibration:
+    """4–20 mA transmitter read across a shunt resistor by the ADS1115."""
+
+    def __init__(self, gain=1, resistor=160.0, pressure_range=10.0, full_scale_voltage=None):
+        self.gain = gain
+        self.resistor = resistor
+        self.pressure_range = pressure_range
+        self.full_scale_voltage = full_scale_voltage or GAIN_FULL_SCALE[gain]
+
+    def __repr__(self):
+        return (
+            f"Calibration(gain={self.gain}, resistor={self.resistor}, "
+            f"pressure_range={self.pressure_range}, "
+            f"full_scale_voltage={self.full_scale_voltage})"
+        )
+
+
+def convert_scalar(raw, cal):
+    # Step 1: Raw -> Voltage
+    voltage = (raw / ADC_MAX) * cal.full_scale_voltage
+
+    # Step 2: Voltage -> Current (mA)
+    current_mA = (voltage / cal.resistor) * 1000
+
+    # Step 3: 4–20mA -> Pressure
+    pressure = ((current_mA - 4) / 16) * cal.pressure_range
+
+    # Clamp negative values
+    if pressure < 0:
+        pressure = 0
+
+    return round(pressure, 2)
+
+
+# ---------------- LOOKUP TABLES ----------------
+def build_table(cal):
+    # Built with the scalar function itself so every entry, including
+    # clamping and round(…, 2) behaviour, matches it exactly.
+    return [convert_scalar(raw, cal) for raw in range(-ADC_OFFSET, ADC_OFFSET)]
+
+
+class PressureConverter:
+    """Raw ADS1115 codes -> bar via one precomputed table per channel."""
+
+    def __init__(self, calibrations):
+        self.calibrations = tuple(calibrations)
+        self._tables = [build_table(cal) for cal in self.calibrations]
+        self._array = None
+        if NUMPY_AVAILABLE:
+            self._array = np.asarray(self._tables, dtype=np.float64)
+            self._channel_index = np.arange(len(self._tables))
+
+    @property
+    def channels(self):
+        return len(self.calibrations)
+
+    def convert_one(self, raw_values):
+        """Single frame, plain Python: ``(bp, fp, cr, bc)`` codes -> pressures."""
+        return tuple(
+            table[raw + ADC_OFFSET] for table, raw in zip(self._tables, raw_values)
+        )
+
+    def convert(self, frames):
+        """Whole array of frames, shape ``(n, channels)`` -> float64 bar."""
+        if not NUMPY_AVAILABLE:
+            raise RuntimeError("numpy is required for array conversion")
+
+        codes = np.asarray(frames)
+        if codes.ndim != 2 or codes.shape[1] != self.channels:
+            raise ValueError(f"expected frames of shape (n, {self.channels})")
+
+        index = np.clip(codes, -ADC_OFFSET, ADC_OFFSET - 1).astype(np.intp) + ADC_OFFSET
+        return self._array[self._channel_index, index]
+
+    def convert_channel(self, channel, raw):
+        """One channel's 1-D array of codes -> float64 bar."""
+        if not NUMPY_AVAILABLE:
+            raise RuntimeError("numpy is required for array conversion")
+
+        index = np.clip(np.asarray(raw), -ADC_OFFSET, ADC_OFFSET - 1).astype(np.intp) + ADC_OFFSET
+        return self._array[channel][index]
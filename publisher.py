@@ -0,0 +1,175 @@
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+
+# ---------------- DEFAULTS ----------------
+DEFAULT_WINDOW = 8            # QoS1 messages in flight
+DEFAULT_ACK_TIMEOUT = 30.0    # resend a message not acked within this many seconds
+
+# ---------------- METRICS ----------------
+PUBLISH_RTT = metrics.histogram("upload_publish_rtt_seconds", "Publish to PUBACK round trip")
+PUBLISHED = metrics.counter("upload_published_batches", "Batches published (first attempt)")
+RESENT = metrics.counter("upload_resent_batches", "Batches published again after reconnect or timeout")
+
+
+# ---------------- WINDOWED QoS1 PUBLISHER ----------------
+class WindowedPublisher:
+    """Pipelined QoS1 publishing with ack-driven, in-order commit.
+
+    ``publish_fn(payload)`` sends one message and returns its MQTT message
+    id. The client's PUBACK callback must call ``on_ack(mid)`` (it may run
+    on the network thread). The main loop calls ``collect_acked()`` and
+    advances the upload cursor to the returned id, which only moves past a
+    batch once it and every batch before it have been acknowledged.
+    """
+
+    def __init__(self, publish_fn, window=DEFAULT_WINDOW, ack_timeout=DEFAULT_ACK_TIMEOUT,
+                 clock=time.monotonic):
+        self.publish_fn = publish_fn
+        self.window = window
+        self.ack_timeout = ack_timeout
+        self.clock = clock
+
+        self._lock = threading.Lock()
+        self._inflight = OrderedDict()     # last_id -> entry, in send order
+        self._by_mid = {}                  # mid -> last_id
+        self._early_acks = set()           # PUBACKs that beat publish() returning
+        self.last_sent_id = None
+
+        self.sent = 0
+        self.acked = 0
+        self.resent = 0
+        self.rtt_sum = 0.0
+        self.acked_bytes = 0
+
+    def __len__(self):
+        return len(self._inflight)
+
+    def full(self):
+        return len(self._inflight) >= self.window
+
+    def _register(self, last_id, payload, mid):
+        entry = self._inflight.setdefault(last_id, {"payload": payload, "acked": False})
+        entry["mid"] = mid
+        entry["sent_at"] = self.clock()
+        self._by_mid[mid] = last_id
+        if mid in self._early_acks:
+            self._early_acks.discard(mid)
+            self._mark_acked(mid)
+
+    def send(self, payload, last_id):
+        """Publish one batch whose highest row id is ``last_id``."""
+        mid = self.publish_fn(payload)
+        with self._lock:
+            self._register(last_id, payload, mid)
+            self.last_sent_id = last_id
+            self.sent += 1
+        PUBLISHED.inc()
+
+    def _mark_acked(self, mid):
+        last_id = self._by_mid.pop(mid, None)
+        if last_id is None:
+            return False
+        entry = self._inflight.get(last_id)
+        if entry is None or entry["acked"]:
+            return False
+        entry["acked"] = True
+        rtt = self.clock() - entry["sent_at"]
+        self.acked += 1
+        self.acked_bytes += len(entry["payload"])
+        self.rtt_sum += rtt
+        PUBLISH_RTT.observe(rtt)
+        return True
+
+    def on_ack(self, mid):
+        with self._lock:
+            if not self._mark_acked(mid):
+                self._early_acks.add(mid)
+
+    def collect_acked(self):
+        """Pop the acked prefix of the window; return its highest id or None."""
+        committed = None
+        with self._lock:
+            while self._inflight:
+                last_id, entry = next(iter(self._inflight.items()))
+                if not entry["acked"]:
+                    break
+                self._inflight.popitem(last=False)
+                committed = last_id
+        return committed
+
+    def resend_unacked(self, only_expired=False):
+        """Publish unacked messages again (after a reconnect, or on timeout)."""
+        now = self.clock()
+        with self._lock:
+            pending = [
+                (last_id, entry) for last_id, entry in self._inflight.items()
+                if not entry["acked"]
+                and (not only_expired or now - entry["sent_at"] >= self.ack_timeout)
+            ]
+            for _, entry in pending:
+                self._by_mid.pop(entry.get("mid"), None)
+            # Acks for mids from before the reconnect can no longer be matched
+            self._early_acks.clear()
+
+        for last_id, entry in pending:
+            mid = self.publish_fn(entry["payload"])
+            with self._lock:
+                self._register(last_id, entry["payload"], mid)
+                self.resent += 1
+            RESENT.inc()
+        return len(pending)
+
+    def mean_rtt(self):
+        return self.rtt_sum / self.acked if self.acked else 0.0
+
+
+# ---------------- SHARED CLIENT ----------------
+class AckRouter:
+    """Hand PUBACKs to the right publisher when several share one client.
+
+    ``attach()`` wraps a publisher's ``publish_fn`` to note which mid it was
+    given; the client's PUBACK callback calls ``on_ack(mid)`` here. No lock
+    is held across a publish, since the PUBACK callback can run on the
+    network thread while the client holds its own locks. A PUBACK that
+    arrives before its publish call has returned is kept until it does.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._owners = {}          # mid -> publisher
+        self._early_acks = set()
+
+    def attach(self, publisher):
+        publish_fn = publisher.publish_fn
+
+        def publish(payload):
+            mid = publish_fn(payload)
+            with self._lock:
+                early = mid in self._early_acks
+                if early:
+                    self._early_acks.discard(mid)
+                else:
+                    self._owners[mid] = publisher
+            if early:
+                # Buffered by the publisher until send() registers the mid
+                publisher.on_ack(mid)
+            return mid
+
+        publisher.publish_fn = publish
+        return publisher
+
+    def on_ack(self, mid):
+        with self._lock:
+            publisher = self._owners.pop(mid, None)
+            if publisher is None:
+                self._early_acks.add(mid)
+        if publisher is not None:
+            publisher.on_ack(mid)
+
+    def reset(self):
+        """Forget unmatched acks (after a reconnect, like resend_unacked())."""
+        with self._lock:
+            self._early_acks.clear()
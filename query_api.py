@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""Read-only HTTP query service for dashboards on the device.
+
+    python3 query_api.py [--db db/project.db] [--port 9110]
+
+    GET /channels
+    GET /query?channel=bp_pressure&last=604800&points=2000
+    GET /query?channel=bp_pressure&start=2024-01-01 00:00:00&end=1704153600&method=minmax
+
+``start``/``end`` are UTC 'YYYY-MM-DD HH:MM:SS' or epoch seconds;
+``last`` is a window ending now. Ranges are read through
+rollups.query_range() (raw rows for short ranges, minute/hour rollups
+for longer ones) and downsampled to ``points`` with LTTB or min/max
+buckets. Responses are cached for QUERY_CACHE_TTL seconds; ``last``
+windows end on a multiple of the TTL so repeated dashboard refreshes
+hit the cache.
+"""
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import closing
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import metrics
+import storage
+from downsample import METHODS, downsample, finite
+from retention import archive_dir_for
+from rollups import MINUTE, query_range, to_epoch
+
+# ---------------- CONFIG ----------------
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_PATH = os.environ.get("QUERY_DB", os.path.join(BASE_DIR, "db", "project.db"))
+QUERY_ADDR = os.environ.get("QUERY_ADDR", "0.0.0.0")
+QUERY_PORT = int(os.environ.get("QUERY_PORT", 9110))
+CACHE_TTL = float(os.environ.get("QUERY_CACHE_TTL", 10))       # seconds
+CACHE_ENTRIES = int(os.environ.get("QUERY_CACHE_ENTRIES", 256))
+
+DEFAULT_POINTS = 1000
+MAX_POINTS = 20000
+
+QUERY_SECONDS = metrics.histogram("query_seconds", "Time to answer a /query request, cache misses")
+CACHE_HITS = metrics.counter("query_cache_hits", "Responses served from the cache")
+CACHE_MISSES = metrics.counter("query_cache_misses", "Responses computed")
+
+
+# ---------------- CACHE ----------------
+class TTLCache:
+    """Small LRU of encoded responses, each valid for ``ttl`` seconds."""
+
+    def __init__(self, ttl=CACHE_TTL, max_entries=CACHE_ENTRIES, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires <= self.clock():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._items[key] = (self.clock() + self.ttl, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+
+# ---------------- QUERIES ----------------
+class QueryService:
+    """Read-only queries on one database, one SQLite connection per request."""
+
+    def __init__(self, db_path=DB_PATH, layout="pressure", cache=None):
+        if not os.path.exists(db_path):
+            raise FileNotFoundError(db_path)
+        self.db_path = db_path
+        self.layout = layout
+        self.archive_dir = archive_dir_for(db_path)
+        self.cache = cache or TTLCache()
+
+    def _connect(self):
+        # ThreadingHTTPServer runs every request on a fresh thread, so a
+        # per-thread connection would never be reused or closed
+        conn = sqlite3.connect(
+            f"file:{self.db_path}?mode=ro", uri=True,
+            timeout=storage.BUSY_TIMEOUT_MS / 1000
+        )
+        conn.execute(f"PRAGMA cache_size = {-storage.CACHE_SIZE_KB}")
+        conn.execute(f"PRAGMA mmap_size = {storage.MMAP_SIZE}")
+        return conn
+
+    def channels(self):
+        names = list(storage.LAYOUTS[self.layout]["columns"])
+        try:
+            # Capture registers channels in wide mode too; only list the
+            # ones narrow storage actually holds (raw rows or rollups)
+            with closing(self._connect()) as conn:
+                names += [row[0] for row in conn.execute(
+                    f"""
+                    SELECT name FROM channel_registry r
+                    WHERE EXISTS (SELECT 1 FROM {storage.CHANNEL_TABLE} l WHERE l.channel_id = r.channel_id)
+                       OR EXISTS (SELECT 1 FROM pressure_rollup WHERE resolution = ? AND channel = r.name)
+                    ORDER BY channel_id
+                    """,
+                    (MINUTE,),
+                )]
+        except sqlite3.OperationalError:
+            pass     # database from before the channel registry
+        return {"channels": names}
+
+    def query(self, channel, start, end, points=DEFAULT_POINTS, method="lttb"):
+        """Downsampled ``[[ts, value], ...]`` of one channel in [start, end)."""
+        with closing(self._connect()) as conn:
+            source, rows = query_range(
+                conn, self.layout, channel, start, end,
+                archive_dir=self.archive_dir, points=points
+            )
+        if source == "raw":
+            series = finite(rows)
+        elif method == "minmax":
+            # Each rollup bucket already knows its extremes
+            series = finite([(ts, low) for ts, low, *_ in rows] + [(ts + 0.5, high) for ts, _, high, *_ in rows])
+            series.sort()
+        else:
+            series = finite([(ts, avg) for ts, _, _, avg, *_ in rows])
+
+        return {
+            "channel": channel,
+            "start": start,
+            "end": end,
+            "source": source,
+            "method": method,
+            "rows": len(rows),
+            "points": [list(point) for point in downsample(series, points, method)],
+        }
+
+    def handle(self, path, params):
+        """``(status, body_bytes, cache_state)`` for one GET request."""
+        if path == "/channels":
+            return 200, json.dumps(self.channels()).encode(), "none"
+        if path != "/query":
+            return 404, json.dumps({"error": "not found"}).encode(), "none"
+
+        try:
+            channel, start, end, points, method = self._parse(params)
+        except (KeyError, ValueError) as e:
+            return 400, json.dumps({"error": f"bad query: {e}"}).encode(), "none"
+
+        key = (channel, start, end, points, method)
+        body = self.cache.get(key)
+        if body is not None:
+            CACHE_HITS.inc()
+            return 200, body, "hit"
+
+        CACHE_MISSES.inc()
+        try:
+            with QUERY_SECONDS.time():
+                body = json.dumps(self.query(channel, start, end, points, method)).encode()
+        except ValueError as e:
+            return 400, json.dumps({"error": str(e)}).encode(), "none"
+        self.cache.put(key, body)
+        return 200, body, "miss"
+
+    def _parse(self, params):
+        channel = params["channel"][0]
+        method = params.get("method", ["lttb"])[0]
+        if method not in METHODS:
+            raise ValueError(f"method must be one of {sorted(METHODS)}")
+        points = min(int(params.get("points", [DEFAULT_POINTS])[0]), MAX_POINTS)
+        if points < 3:
+            raise ValueError("points must be at least 3")
+
+        # Open-ended windows end on the next multiple of the TTL, so the
+        # cache key stays the same until the cached answer expires
+        step = self.cache.ttl if self.cache.ttl > 0 else 1
+        now = (time.time() // step + 1) * step
+        if "last" in params:
+            end = now
+            start = end - float(params["last"][0])
+        else:
+            start = _epoch(params["start"][0])
+            end = _epoch(params["end"][0]) if "end" in params else now
+        if end <= start:
+            raise ValueError("end must be after start")
+        return channel, start, end, points, method
+
+
+def _epoch(value):
+    try:
+        return float(value)
+    except ValueError:
+        return to_epoch(value)
+
+
+# ---------------- HTTP ----------------
+def serve(service, port=QUERY_PORT, addr=QUERY_ADDR):
+    """Serve ``service`` until interrupted."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            status, body, cache_state = service.handle(url.path, parse_qs(url.query))
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Cache-Control", f"max-age={int(service.cache.ttl)}")
+            self.send_header("X-Cache", cache_state)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((addr, port), Handler)
+    server.daemon_threads = True
+    print(f"🔎 Query API on http://{addr}:{port}/query (db {service.db_path})", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Read-only query API for dashboards")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--layout", default="pressure", choices=sorted(storage.LAYOUTS))
+    parser.add_argument("--port", type=int, default=QUERY_PORT)
+    parser.add_argument("--addr", default=QUERY_ADDR)
+    args = parser.parse_args(argv)
+
+    serve(QueryService(args.db, args.layout), args.port, args.addr)
+
+
+if __name__ == "__main__":
+    main()
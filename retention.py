@@ -0,0 +1,332 @@
+import argparse
+import gzip
+import json
+import logging
+import os
+import sys
+import time
+
+import logsetup
+import storage
+from rollups import to_epoch
+from upload_cursor import READINGS_SINKS
+
+# ---------------- CONFIG ----------------
+RETENTION_DAYS = float(os.environ.get("RETENTION_DAYS", 30))          # keep acked rows this long
+MAX_DB_MB = float(os.environ.get("RETENTION_MAX_DB_MB", 512))         # hot database budget
+MAX_ARCHIVE_MB = float(os.environ.get("RETENTION_MAX_ARCHIVE_MB", 2048))
+ARCHIVE_CHUNK = 20000                                                  # rows per archive pass
+VACUUM_PAGES = 2000                                                    # pages freed per incremental_vacuum
+
+log = logging.getLogger(__name__)
+
+
+def archive_dir_for(db_path):
+    return os.path.join(os.path.dirname(os.path.abspath(db_path)), "archive")
+
+
+def channel_archive_dir(archive_dir):
+    # Narrow channel_log segments, same <day>/<first>-<last> naming
+    return os.path.join(archive_dir, storage.CHANNEL_TABLE)
+
+
+# ---------------- SIZE ----------------
+def used_bytes(conn):
+    """Bytes in pages holding data. Archiving shrinks this whether or not
+    the file gives its free pages back (see incremental_vacuum_enabled)."""
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    pages = conn.execute("PRAGMA page_count").fetchone()[0] - conn.execute("PRAGMA freelist_count").fetchone()[0]
+    return pages * page_size
+
+
+def db_bytes(db_path):
+    total = 0
+    for suffix in ("", "-wal"):
+        try:
+            total += os.path.getsize(db_path + suffix)
+        except OSError:
+            pass
+    return total
+
+
+def archive_segments(archive_dir):
+    """All segment paths, oldest day first."""
+    segments = []
+    if not os.path.isdir(archive_dir):
+        return segments
+    for day in sorted(os.listdir(archive_dir)):
+        day_dir = os.path.join(archive_dir, day)
+        if os.path.isdir(day_dir):
+            for name in sorted(os.listdir(day_dir)):
+                if name.endswith(".jsonl.gz"):
+                    segments.append(os.path.join(day_dir, name))
+    return segments
+
+
+def all_segments(archive_dir):
+    """Wide and narrow segments together, oldest day first."""
+    segments = archive_segments(archive_dir) + archive_segments(channel_archive_dir(archive_dir))
+    return sorted(segments, key=lambda path: os.path.basename(os.path.dirname(path)))
+
+
+def archive_bytes(archive_dir):
+    return sum(os.path.getsize(path) for path in all_segments(archive_dir))
+
+
+# ---------------- VACUUM ----------------
+def incremental_vacuum_enabled(conn):
+    return conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+
+
+def ensure_incremental_vacuum(conn):
+    """Convert a database created before storage.connect() enabled
+    incremental auto_vacuum. This is a full VACUUM holding an exclusive
+    lock for the whole rebuild: run it with capture and upload stopped."""
+    if not incremental_vacuum_enabled(conn):
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+
+
+def reclaim(conn):
+    # Without incremental auto_vacuum free pages are reused in place
+    if incremental_vacuum_enabled(conn):
+        while conn.execute("PRAGMA freelist_count").fetchone()[0] > 0:
+            conn.execute(f"PRAGMA incremental_vacuum({VACUUM_PAGES})")
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+# ---------------- ARCHIVE ----------------
+def acked_id(conn):
+    """Highest id every upload sink has acknowledged."""
+    row = conn.execute(f"SELECT MIN(last_id) FROM upload_cursor WHERE {READINGS_SINKS}").fetchone()
+    return row[0] or 0
+
+
+def _write_segments(archive_dir, columns, rows, day_of):
+    """Write rows into one gzip JSON-lines segment per UTC day (``day_of(row)``)."""
+    by_day = {}
+    for row in rows:
+        by_day.setdefault(day_of(row), []).append(row)
+
+    for day, day_rows in by_day.items():
+        day_dir = os.path.join(archive_dir, day)
+        os.makedirs(day_dir, exist_ok=True)
+        name = f"{day_rows[0][0]:012d}-{day_rows[-1][0]:012d}.jsonl.gz"
+        path = os.path.join(day_dir, name)
+        tmp = path + ".tmp"
+
+        with gzip.open(tmp, "wt", encoding="utf-8") as f:
+            for row in day_rows:
+                f.write(json.dumps(dict(zip(columns, row))) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        # Same id range -> same name, so a re-run after a crash overwrites
+        os.replace(tmp, path)
+
+
+def archive_rows(conn, layout, archive_dir, max_id, before=None, limit=ARCHIVE_CHUNK):
+    """Archive then delete up to ``limit`` of the oldest rows with id <= max_id."""
+    columns = ("id",) + storage.reading_columns(layout)
+    time_column = storage.LAYOUTS[layout]["time_column"]
+
+    sql = f"SELECT {', '.join(columns)} FROM {storage.TABLE} WHERE id <= ?"
+    params = [max_id]
+    if before is not None:
+        sql += f" AND {time_column} < ?"
+        params.append(before)
+    sql += " ORDER BY id LIMIT ?"
+    params.append(limit)
+
+    rows = conn.execute(sql, params).fetchall()
+    if not rows:
+        return 0
+
+    _write_segments(archive_dir, columns, rows, lambda row: str(row[-1])[:10])
+    with conn:
+        conn.executemany(
+            f"DELETE FROM {storage.TABLE} WHERE id = ?", [(row[0],) for row in rows]
+        )
+    return len(rows)
+
+
+def archive_channel_rows(conn, archive_dir, before_ms=None, limit=ARCHIVE_CHUNK):
+    """Archive then delete up to ``limit`` of the oldest narrow channel_log rows.
+
+    Nothing uploads channel_log, so there is no cursor to wait for; the
+    archive is the only copy once a row leaves the database.
+    """
+    columns = ("id",) + storage.NARROW_COLUMNS
+    rows = conn.execute(
+        f"SELECT {', '.join(columns)} FROM {storage.CHANNEL_TABLE} ORDER BY id LIMIT ?", (limit,)
+    ).fetchall()
+    if before_ms is not None:
+        # Rows are written in time order; stop at the first young one
+        # instead of scanning the whole table for ts < before_ms
+        for i, row in enumerate(rows):
+            if row[1] >= before_ms:
+                rows = rows[:i]
+                break
+    if not rows:
+        return 0
+
+    _write_segments(
+        channel_archive_dir(archive_dir), columns, rows,
+        lambda row: storage.utc_timestamp(row[1] / 1000)[:10]
+    )
+    with conn:
+        conn.executemany(
+            f"DELETE FROM {storage.CHANNEL_TABLE} WHERE id = ?", [(row[0],) for row in rows]
+        )
+    return len(rows)
+
+
+def prune_archive(archive_dir, max_bytes):
+    removed = 0
+    segments = all_segments(archive_dir)
+    total = sum(os.path.getsize(path) for path in segments)
+    for path in segments:
+        if total <= max_bytes:
+            break
+        total -= os.path.getsize(path)
+        os.remove(path)
+        removed += 1
+        day_dir = os.path.dirname(path)
+        if not os.listdir(day_dir):
+            os.rmdir(day_dir)
+    return removed
+
+
+def run_retention(db_path, layout, retention_days=RETENTION_DAYS,
+                  max_db_mb=MAX_DB_MB, max_archive_mb=MAX_ARCHIVE_MB):
+    conn = storage.connect(db_path, layout)
+    archive_dir = archive_dir_for(db_path)
+    if not incremental_vacuum_enabled(conn):
+        log.warning("⚠️ auto_vacuum is not incremental: the file will not shrink; "
+                    "run retention.py --incremental-vacuum with capture stopped")
+
+    stats = {"aged": 0, "budget": 0, "channel_aged": 0, "channel_budget": 0,
+             "unacked": 0, "segments_pruned": 0}
+    cutoff_epoch = time.time() - retention_days * 86400
+    cutoff = storage.utc_timestamp(cutoff_epoch)
+    safe_id = acked_id(conn)
+
+    # 1. Acknowledged rows older than the retention window, and narrow
+    #    channel_log rows older than it (never uploaded, see archive_channel_rows)
+    passes = (
+        ("aged", lambda: archive_rows(conn, layout, archive_dir, safe_id, before=cutoff)),
+        ("channel_aged", lambda: archive_channel_rows(conn, archive_dir, before_ms=storage.epoch_ms(cutoff_epoch))),
+    )
+    for key, archive in passes:
+        while True:
+            moved = archive()
+            stats[key] += moved
+            if not moved:
+                break
+    reclaim(conn)
+
+    # 2. Hard budget: oldest acknowledged rows regardless of age, then the
+    #    oldest channel_log rows, then, as a last resort, rows not uploaded
+    #    yet (they stay in the archive, and the backlog lane uploads them
+    #    from there, see catchup.py)
+    budget = max_db_mb * 1024 * 1024
+    passes = (
+        ("budget", lambda: archive_rows(conn, layout, archive_dir, safe_id)),
+        ("channel_budget", lambda: archive_channel_rows(conn, archive_dir)),
+        ("unacked", lambda: archive_rows(conn, layout, archive_dir, sys.maxsize)),
+    )
+    for key, archive in passes:
+        while used_bytes(conn) > budget:
+            moved = archive()
+            if not moved:
+                break
+            if key == "unacked":
+                log.warning("⚠️ Disk budget: archived %d rows that were not uploaded yet", moved)
+            stats[key] += moved
+            reclaim(conn)
+
+    stats["segments_pruned"] = prune_archive(archive_dir, max_archive_mb * 1024 * 1024)
+    stats["db_mb"] = round(db_bytes(db_path) / 1024 / 1024, 1)
+    stats["archive_mb"] = round(archive_bytes(archive_dir) / 1024 / 1024, 1)
+    conn.close()
+    return stats
+
+
+# ---------------- READ BACK ----------------
+def _read_segment(path):
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            yield json.loads(line)
+
+
+def _segment_ids(path):
+    # <first>-<last>.jsonl.gz
+    first, last = os.path.basename(path).split(".")[0].split("-")
+    return int(first), int(last)
+
+
+def iter_archive(archive_dir, layout, start=None, end=None, after_id=None, before_id=None):
+    """Archived rows as dicts in id order, optionally within [start, end) epoch s
+    and ``after_id < id < before_id``.
+
+    Segments hold disjoint id ranges, so they are read one at a time in id
+    order and only one file is open at once; rows repeated by an
+    interrupted run are skipped. Segments outside the id bounds are not opened.
+    """
+    time_column = storage.LAYOUTS[layout]["time_column"]
+    first_day = storage.utc_timestamp(start)[:10] if start is not None else None
+    last_day = storage.utc_timestamp(end)[:10] if end is not None else None
+
+    segments = []
+    for path in archive_segments(archive_dir):
+        day = os.path.basename(os.path.dirname(path))
+        if (first_day and day < first_day) or (last_day and day > last_day):
+            continue
+        first, last = _segment_ids(path)
+        if (after_id is not None and last <= after_id) or (before_id is not None and first >= before_id):
+            continue
+        segments.append((first, path))
+    segments.sort()
+
+    last_id = after_id
+    for _, path in segments:
+        for row in _read_segment(path):
+            if last_id is not None and row["id"] <= last_id:
+                continue
+            if before_id is not None and row["id"] >= before_id:
+                break
+            last_id = row["id"]
+            ts = to_epoch(row[time_column])
+            if (start is not None and ts < start) or (end is not None and ts >= end):
+                continue
+            yield row
+
+
+# ---------------- CLI ----------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Archive and prune uploaded rows")
+    parser.add_argument("db")
+    parser.add_argument("--layout", default="pressure", choices=sorted(storage.LAYOUTS))
+    parser.add_argument("--loop", type=float, default=0, help="repeat every N seconds")
+    parser.add_argument("--incremental-vacuum", action="store_true",
+                        help="convert an existing database to incremental auto_vacuum "
+                             "(full VACUUM; stop capture and upload first), then exit")
+    args = parser.parse_args(argv)
+    logsetup.setup("retention")
+
+    if args.incremental_vacuum:
+        conn = storage.connect(args.db, args.layout)
+        ensure_incremental_vacuum(conn)
+        conn.close()
+        log.info("✅ auto_vacuum = INCREMENTAL")
+        return 0
+
+    while True:
+        stats = run_retention(args.db, args.layout)
+        log.info("🗄 Retention | %s", stats)
+        if not args.loop:
+            break
+        time.sleep(args.loop)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,263 @@
+import argparse
+import sys
+from datetime import datetime, timezone
+
+import storage
+
+# ---------------- CONFIG ----------------
+MINUTE = 60
+HOUR = 3600
+RESOLUTIONS = (MINUTE, HOUR)
+
+# Range width (seconds) up to which each source is used by query_range()
+RAW_MAX_SPAN = 2 * HOUR
+MINUTE_MAX_SPAN = 3 * 24 * HOUR
+
+REBUILD_CHUNK = 5000
+
+UPSERT_SQL = """
+INSERT INTO pressure_rollup
+    (resolution, bucket, channel, count, min, max, sum, last, last_ts)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (resolution, channel, bucket) DO UPDATE SET
+    count = count + excluded.count,
+    min = MIN(min, excluded.min),
+    max = MAX(max, excluded.max),
+    sum = sum + excluded.sum,
+    last = CASE WHEN excluded.last_ts >= last_ts THEN excluded.last ELSE last END,
+    last_ts = MAX(last_ts, excluded.last_ts)
+"""
+
+
+def to_epoch(timestamp):
+    # DB timestamps are 'YYYY-MM-DD HH:MM:SS' in UTC (CURRENT_TIMESTAMP format)
+    if isinstance(timestamp, (int, float)):
+        return float(timestamp)
+    return datetime.fromisoformat(str(timestamp)).replace(tzinfo=timezone.utc).timestamp()
+
+
+def to_timestamp(epoch):
+    return datetime.fromtimestamp(epoch, timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+# ---------------- AGGREGATION ----------------
+def _fold(buckets, channel, ts, value):
+    for resolution in RESOLUTIONS:
+        key = (resolution, int(ts // resolution) * resolution, channel)
+        agg = buckets.get(key)
+        if agg is None:
+            buckets[key] = [1, value, value, value, value, ts]
+            continue
+        agg[0] += 1
+        if value < agg[1]:
+            agg[1] = value
+        if value > agg[2]:
+            agg[2] = value
+        agg[3] += value
+        if ts >= agg[5]:
+            agg[4], agg[5] = value, ts
+
+
+def aggregate(rows, channels):
+    """Fold ``(*values, timestamp, ...)`` rows into per-bucket partial rollups."""
+    buckets = {}
+    time_index = len(channels)
+    for row in rows:
+        ts = to_epoch(row[time_index])
+        for channel, value in zip(channels, row):
+            if value is not None:
+                _fold(buckets, channel, ts, value)
+    return buckets
+
+
+def aggregate_narrow(rows, names):
+    """Same for narrow ``(ts_ms, channel_id, value)`` rows; ``names`` maps id -> channel."""
+    buckets = {}
+    for ts_ms, channel_id, value in rows:
+        if value is not None:
+            _fold(buckets, names[channel_id], ts_ms / 1000, value)
+    return buckets
+
+
+def apply(conn, buckets):
+    conn.executemany(UPSERT_SQL, [key + tuple(agg) for key, agg in buckets.items()])
+
+
+class RollupHook:
+    """GroupCommitWriter hook: update rollups in the insert transaction."""
+
+    def __init__(self, layout):
+        self.channels = storage.LAYOUTS[layout]["columns"]
+
+    def __call__(self, conn, rows):
+        apply(conn, aggregate(rows, self.channels))
+
+
+class NarrowRollupHook:
+    """RollupHook for writers of the narrow channel table."""
+
+    def __init__(self, channel_ids):
+        self.names = {channel_id: name for name, channel_id in channel_ids.items()}
+
+    def __call__(self, conn, rows):
+        apply(conn, aggregate_narrow(rows, self.names))
+
+
+# ---------------- REBUILD ----------------
+def _rebuild_source(conn, channels, cursor, fold, oldest):
+    """Replace the rollups of ``channels`` from the rows ``cursor`` yields.
+
+    Retention archives the oldest rows, so the bucket holding the oldest
+    row still in the table (``oldest``, epoch s) may have lost rows: it and
+    everything before it are left as they are.
+    """
+    first = {resolution: (int(oldest // resolution) + 1) * resolution for resolution in RESOLUTIONS}
+    marks = ", ".join("?" * len(channels))
+    for resolution, bucket in first.items():
+        conn.execute(
+            f"DELETE FROM pressure_rollup WHERE resolution = ? AND bucket >= ? AND channel IN ({marks})",
+            (resolution, bucket, *channels),
+        )
+
+    total = 0
+    while True:
+        rows = cursor.fetchmany(REBUILD_CHUNK)
+        if not rows:
+            break
+        buckets = fold(rows)
+        apply(conn, {key: agg for key, agg in buckets.items() if key[1] >= first[key[0]]})
+        total += len(rows)
+    return total
+
+
+def rebuild(conn, layout):
+    """Regenerate rollups from the rows still in brake_pressure_log and channel_log.
+
+    Only the span those tables still hold is rebuilt; rollups of archived
+    rows are kept.
+    """
+    columns = storage.reading_columns(layout)
+    channels = storage.LAYOUTS[layout]["columns"]
+    time_column = storage.LAYOUTS[layout]["time_column"]
+
+    total = 0
+    with conn:
+        oldest = conn.execute(f"SELECT MIN({time_column}) FROM {storage.TABLE}").fetchone()[0]
+        if oldest is not None:
+            read = conn.cursor()
+            read.execute(f"SELECT {', '.join(columns)} FROM {storage.TABLE} ORDER BY id")
+            total += _rebuild_source(
+                conn, channels, read, lambda rows: aggregate(rows, channels), to_epoch(oldest)
+            )
+
+        names = dict(conn.execute("SELECT channel_id, name FROM channel_registry"))
+        oldest = conn.execute(f"SELECT MIN(ts) FROM {storage.CHANNEL_TABLE}").fetchone()[0]
+        if names and oldest is not None:
+            read = conn.cursor()
+            read.execute(f"SELECT {', '.join(storage.NARROW_COLUMNS)} FROM {storage.CHANNEL_TABLE} ORDER BY id")
+            total += _rebuild_source(
+                conn, list(names.values()), read, lambda rows: aggregate_narrow(rows, names), oldest / 1000
+            )
+    return total
+
+
+# ---------------- QUERIES ----------------
+def _narrow_channel_id(conn, channel):
+    row = conn.execute("SELECT channel_id FROM channel_registry WHERE name = ?", (channel,)).fetchone()
+    return row[0] if row else None
+
+
+def query_range(conn, layout, channel, start, end, archive_dir=None, points=None):
+    """Read one channel between two UTC epoch seconds.
+
+    Short ranges come from raw rows as ``(ts, value)``; longer ones from
+    the minute or hour rollups as ``(ts, min, max, avg, count, last)``.
+    Raw rows already moved out by retention are read from ``archive_dir``.
+    ``channel`` is a wide column or a channel_registry name (narrow rows).
+    With ``points``, minute rollups are used instead of hour ones when the
+    hour buckets would give fewer than that many points.
+    """
+    narrow_id = None
+    if channel not in storage.LAYOUTS[layout]["columns"]:
+        narrow_id = _narrow_channel_id(conn, channel)
+        if narrow_id is None:
+            raise ValueError(f"unknown channel {channel!r}")
+
+    span = end - start
+    if span <= RAW_MAX_SPAN and narrow_id is not None:
+        rows = storage.fetch_channel(conn, narrow_id, int(start * 1000), int(end * 1000))
+        return "raw", [(ts / 1000, value) for ts, value in rows]
+
+    if span <= RAW_MAX_SPAN:
+        time_column = storage.LAYOUTS[layout]["time_column"]
+        rows = conn.execute(
+            f"""
+            SELECT {time_column}, {channel} FROM {storage.TABLE}
+            WHERE {time_column} >= ? AND {time_column} < ? AND {channel} IS NOT NULL
+            ORDER BY id
+            """,
+            (to_timestamp(start), to_timestamp(end)),
+        ).fetchall()
+        points = [(to_epoch(ts), value) for ts, value in rows]
+
+        if archive_dir is not None:
+            from retention import iter_archive
+
+            archived = [
+                (to_epoch(row[time_column]), row[channel])
+                for row in iter_archive(archive_dir, layout, start, end)
+                if row[channel] is not None
+            ]
+            points = sorted(archived + points)
+        return "raw", points
+
+    resolution = MINUTE if span <= MINUTE_MAX_SPAN or (points and span / HOUR < points) else HOUR
+    rows = conn.execute(
+        """
+        SELECT bucket, min, max, sum / count, count, last FROM pressure_rollup
+        WHERE resolution = ? AND channel = ? AND bucket >= ? AND bucket < ?
+        ORDER BY bucket
+        """,
+        (resolution, channel, int(start // resolution) * resolution, end),
+    ).fetchall()
+    return resolution, rows
+
+
+# ---------------- CLI ----------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pressure rollup maintenance")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("rebuild", help="regenerate rollups from the rows still in the database")
+    p.add_argument("db")
+    p.add_argument("--layout", default="pressure", choices=sorted(storage.LAYOUTS))
+
+    p = sub.add_parser("query", help="print one channel over a time range")
+    p.add_argument("db")
+    p.add_argument("channel")
+    p.add_argument("start", help="UTC 'YYYY-MM-DD HH:MM:SS'")
+    p.add_argument("end", help="UTC 'YYYY-MM-DD HH:MM:SS'")
+    p.add_argument("--layout", default="pressure", choices=sorted(storage.LAYOUTS))
+
+    args = parser.parse_args(argv)
+    conn = storage.connect(args.db, args.layout)
+
+    if args.command == "rebuild":
+        total = rebuild(conn, args.layout)
+        print(f"✅ Rebuilt rollups from {total} rows")
+    else:
+        from retention import archive_dir_for
+
+        source, rows = query_range(
+            conn, args.layout, args.channel, to_epoch(args.start), to_epoch(args.end),
+            archive_dir=archive_dir_for(args.db)
+        )
+        print(f"source: {source}")
+        for row in rows:
+            print(to_timestamp(row[0]), *row[1:])
+
+    conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
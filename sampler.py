@@ -0,0 +1,344 @@
+import logging
+import threading
+import time
+from array import array
+
+import metrics
+
+# ---------------- CONFIG ----------------
+ADS_DATA_RATES = (8, 16, 32, 64, 128, 250, 475, 860)   # samples/s supported by the chip
+
+# Input multiplexer: single-ended inputs against GND, or differential pairs
+MUX_CODES = {"0-1": 0, "0-3": 1, "1-3": 2, "2-3": 3, "0": 4, "1": 5, "2": 6, "3": 7}
+DEFAULT_DATA_RATE = 860
+DEFAULT_RING_FRAMES = 4096
+
+# ADS1115 registers
+_REG_CONVERSION = 0x00
+_REG_CONFIG = 0x01
+_REG_LO_THRESH = 0x02          # LO/HI_THRESH turn ALRT/RDY into a conversion-ready pulse
+_REG_HI_THRESH = 0x03
+
+# Config register fields for a single-shot conversion
+_CONFIG_OS_SINGLE = 0x8000
+_CONFIG_MODE_SINGLE = 0x0100
+_CONFIG_COMP_DISABLE = 0x0003          # COMP_QUE=11: comparator off, ALRT/RDY idle
+_PGA_CODES = {2 / 3: 0, 1: 1, 2: 2, 4: 3, 8: 4, 16: 5}
+_READY_POLLS = 20              # config reads to wait for a late conversion
+
+log = logging.getLogger(__name__)
+
+# ---------------- METRICS ----------------
+I2C_READ_SECONDS = metrics.histogram("capture_i2c_read_seconds", "Time to read one frame over I2C")
+SAMPLER_MISSED = metrics.counter("capture_sampler_missed_frames", "Frames skipped by late deadlines")
+SAMPLER_ERRORS = metrics.counter("capture_sampler_errors", "Failed frame reads")
+
+
+# ---------------- RING BUFFER ----------------
+class FrameRing:
+    """Fixed-size, preallocated ring of timestamped N-channel frames.
+
+    One writer (the sampler thread) and any number of readers. Frames are
+    addressed by a monotonically increasing sequence number; when the
+    writer laps a slow reader the overwritten frames are counted as
+    dropped for that reader.
+    """
+
+    def __init__(self, capacity=DEFAULT_RING_FRAMES, channels=4):
+        self.capacity = capacity
+        self.channels = channels
+        self._times = array('d', [0.0]) * capacity
+        self._values = array('l', [0]) * (capacity * channels)
+        self._seq = 0                   # frames ever written
+        self._lock = threading.Lock()
+        self._readers = []
+
+    @property
+    def written(self):
+        return self._seq
+
+    def push(self, timestamp, values):
+        with self._lock:
+            slot = self._seq % self.capacity
+            self._times[slot] = timestamp
+            base = slot * self.channels
+            self._values[base:base + self.channels] = array('l', values)
+            self._seq += 1
+
+    def latest(self):
+        with self._lock:
+            if self._seq == 0:
+                return None
+            slot = (self._seq - 1) % self.capacity
+            base = slot * self.channels
+            return self._times[slot], tuple(self._values[base:base + self.channels])
+
+    def reader(self):
+        reader = RingReader(self)
+        self._readers.append(reader)
+        return reader
+
+    @property
+    def dropped(self):
+        return sum(reader.dropped for reader in self._readers)
+
+
+class RingReader:
+    def __init__(self, ring):
+        self.ring = ring
+        self.next_seq = ring.written
+        self.dropped = 0
+
+    def read(self, max_frames=None):
+        """Return ``[(timestamp, values), ...]`` written since the last call."""
+        ring = self.ring
+        with ring._lock:
+            end = ring._seq
+            oldest = max(0, end - ring.capacity)
+            if self.next_seq < oldest:
+                self.dropped += oldest - self.next_seq
+                self.next_seq = oldest
+
+            if max_frames is not None:
+                end = min(end, self.next_seq + max_frames)
+
+            frames = []
+            n = ring.channels
+            for seq in range(self.next_seq, end):
+                slot = seq % ring.capacity
+                base = slot * n
+                frames.append((ring._times[slot], tuple(ring._values[base:base + n])))
+
+            self.next_seq = end
+        return frames
+
+
+# ---------------- MULTI-ADC BANK ----------------
+def single_shot_config(mux, gain, data_rate):
+    """Config register value that starts one conversion of ``mux``."""
+    return (
+        _CONFIG_OS_SINGLE
+        | MUX_CODES[mux] << 12
+        | _PGA_CODES[gain] << 9
+        | _CONFIG_MODE_SINGLE
+        | ADS_DATA_RATES.index(data_rate) << 5
+        | _CONFIG_COMP_DISABLE
+    )
+
+
+def conversion_time(data_rate):
+    # Internal oscillator is within ±10%, plus ~25 µs power-up per shot
+    return 1.1 / data_rate + 0.0001
+
+
+def _signed(code):
+    return code - 0x10000 if code & 0x8000 else code
+
+
+def _poll_ready(ads):
+    # OS bit reads 1 once the conversion is done
+    for _ in range(_READY_POLLS):
+        if ads._read_register(_REG_CONFIG) & _CONFIG_OS_SINGLE:
+            return
+        time.sleep(0.0002)
+
+
+class ADCBank:
+    """Single-shot reads of every registry channel across several ADS1115s.
+
+    A frame is read in slots: slot *k* starts the *k*-th channel of every
+    chip, waits one conversion time, then collects the results. Chips on
+    different addresses convert at the same time, so sixteen channels on
+    four chips take four conversion times, not sixteen.
+    """
+
+    def __init__(self, adcs, channels):
+        per_chip = {}
+        for index, channel in enumerate(channels):
+            per_chip.setdefault(channel.address, []).append((
+                index,
+                single_shot_config(channel.mux, channel.gain, channel.data_rate),
+                conversion_time(channel.data_rate),
+            ))
+
+        self.adcs = adcs
+        self.size = len(channels)
+        self.slots = []
+        for k in range(max((len(queue) for queue in per_chip.values()), default=0)):
+            reads = [
+                (adcs[address], queue[k][0], queue[k][1])
+                for address, queue in per_chip.items() if k < len(queue)
+            ]
+            wait = max(queue[k][2] for queue in per_chip.values() if k < len(queue))
+            self.slots.append((reads, wait))
+
+    def read_frame(self):
+        values = [0] * self.size
+        for reads, wait in self.slots:
+            for ads, _, config in reads:
+                ads._write_register(_REG_CONFIG, config)
+            time.sleep(wait)
+            for ads, index, _ in reads:
+                _poll_ready(ads)
+                values[index] = _signed(ads._read_register(_REG_CONVERSION))
+        return values
+
+
+# ---------------- SAMPLER ----------------
+class ADS1115Sampler(threading.Thread):
+    """Single-shot ADS1115 reader running in its own thread.
+
+    Each frame starts one conversion per entry of ``channels`` (MUX_CODES
+    keys: ``"0"``..``"3"`` single-ended, ``"0-1"`` etc. differential), so
+    the frame rate is at most data_rate / len(channels). Every conversion
+    writes its own mux to the config register; continuous mode would keep
+    converting the previous input until the next write.
+    ``frame_rate`` paces frames on absolute deadlines; a frame that starts
+    more than one period late counts as dropped. If ``ready_pin`` (BCM
+    number wired to ALRT/RDY) is given, each conversion is awaited on that
+    pin instead of a fixed sleep.
+    """
+
+    def __init__(self, ads, channels=("0", "1", "2", "3"), data_rate=DEFAULT_DATA_RATE,
+                 frame_rate=None, ring=None, ready_pin=None, gain=None):
+        super().__init__(name="ads1115-sampler", daemon=True)
+        if data_rate not in ADS_DATA_RATES:
+            raise ValueError(f"ADS1115 data rate must be one of {ADS_DATA_RATES}")
+        channels = tuple(str(mux) for mux in channels)
+        for mux in channels:
+            if mux not in MUX_CODES:
+                raise ValueError(f"mux must be one of {sorted(MUX_CODES)}, got {mux!r}")
+
+        self.ads = ads
+        self.channels = channels
+        self.gain = gain
+        self.data_rate = data_rate
+        self.frame_rate = frame_rate
+        self.ring = ring or FrameRing(channels=len(self.channels))
+        self.ready_pin = ready_pin
+
+        self.frames = 0
+        self.missed = 0
+        self.errors = 0
+        self._started_at = None
+        self._window = (0.0, 0)         # (monotonic, frames) at last rate sample
+        self._rate = 0.0
+        self._stop_event = threading.Event()
+        self._wait_ready = None
+        self._configs = ()
+        self._wait = conversion_time(data_rate)
+
+    # ---------- hardware setup ----------
+    def _configure(self):
+        gain = self.ads.gain if self.gain is None else self.gain
+        configs = [single_shot_config(mux, gain, self.data_rate) for mux in self.channels]
+
+        if self.ready_pin is not None:
+            self._wait_ready = self._setup_ready_pin()
+        if self._wait_ready is not None:
+            # COMP_QUE=00 enables the comparator, asserting ALRT/RDY after each conversion
+            configs = [config & ~_CONFIG_COMP_DISABLE for config in configs]
+        self._configs = tuple(configs)
+
+    def _setup_ready_pin(self):
+        try:
+            import RPi.GPIO as GPIO
+
+            # Hi_thresh MSB=1 / Lo_thresh MSB=0 makes ALRT/RDY pulse once per conversion
+            # (only while the comparator is enabled, see _configure)
+            self.ads._write_register(_REG_HI_THRESH, 0x8000)
+            self.ads._write_register(_REG_LO_THRESH, 0x0000)
+
+            GPIO.setmode(GPIO.BCM)
+            GPIO.setup(self.ready_pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+            timeout_ms = max(2, int(2000 / self.data_rate))
+            return lambda: GPIO.wait_for_edge(self.ready_pin, GPIO.FALLING, timeout=timeout_ms)
+        except Exception as e:
+            log.warning("⚠️ ALRT/RDY pacing unavailable, using timed reads: %s", e)
+            return None
+
+    def _read_frame(self):
+        ads = self.ads
+        values = []
+        for config in self._configs:
+            ads._write_register(_REG_CONFIG, config)
+            if self._wait_ready is not None:
+                self._wait_ready()
+            else:
+                time.sleep(self._wait)
+            _poll_ready(ads)
+            values.append(_signed(ads._read_register(_REG_CONVERSION)))
+        return values
+
+    # ---------- thread ----------
+    def run(self):
+        self._configure()
+        period = 1.0 / self.frame_rate if self.frame_rate else 0.0
+        self._started_at = time.monotonic()
+        self._window = (self._started_at, 0)
+        deadline = self._started_at
+
+        while not self._stop_event.is_set():
+            if period:
+                now = time.monotonic()
+                if now < deadline:
+                    time.sleep(deadline - now)
+                elif now - deadline >= period:
+                    skipped = int((now - deadline) / period)
+                    self.missed += skipped
+                    SAMPLER_MISSED.inc(skipped)
+                    deadline += skipped * period
+                deadline += period
+
+            started = time.perf_counter()
+            try:
+                values = self._read_frame()
+            except Exception:
+                self.errors += 1
+                SAMPLER_ERRORS.inc()
+                time.sleep(0.01)
+                continue
+            I2C_READ_SECONDS.observe(time.perf_counter() - started)
+
+            self.ring.push(time.time(), values)
+            self.frames += 1
+
+    def stop(self, timeout=1.0):
+        self._stop_event.set()
+        self.join(timeout)
+
+    # ---------- reporting ----------
+    def achieved_rate(self):
+        """Frames per second since the previous call."""
+        now = time.monotonic()
+        then, frames = self._window
+        if now > then:
+            self._rate = (self.frames - frames) / (now - then)
+            self._window = (now, self.frames)
+        return self._rate
+
+    def stats(self):
+        return {
+            "frames": self.frames,
+            "rate_hz": round(self.achieved_rate(), 1),
+            "dropped": self.missed + self.ring.dropped,
+            "errors": self.errors,
+        }
+
+
+class MultiADCSampler(ADS1115Sampler):
+    """The same paced sampler thread over an ADCBank (up to 16 channels)."""
+
+    def __init__(self, bank, frame_rate=None, ring=None):
+        super().__init__(
+            None, channels=range(bank.size), frame_rate=frame_rate,
+            ring=ring or FrameRing(channels=bank.size)
+        )
+        self.name = "adc-bank-sampler"
+        self.bank = bank
+
+    def _configure(self):
+        pass   # every read configures its own single-shot conversion
+
+    def _read_frame(self):
+        return self.bank.read_frame()
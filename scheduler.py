@@ -0,0 +1,120 @@
+import time
+from collections import deque
+
+import metrics
+
+# ---------------- POLICIES ----------------
+SKIP = "skip"            # drop ticks that are already past; stay on the original grid
+CATCH_UP = "catch_up"    # run missed ticks back to back (up to max_catch_up), then resume
+POLICIES = (SKIP, CATCH_UP)
+
+JITTER_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)
+JITTER_WINDOW = 1024     # recent wake-ups kept for stats() percentiles
+
+TICK_JITTER = "scheduler_tick_jitter_seconds"
+OVERRUNS = "scheduler_overruns"
+MISSED_TICKS = "scheduler_missed_ticks"
+RATE = "scheduler_rate_hz"
+
+
+# ---------------- SCHEDULER ----------------
+class Scheduler:
+    """Fixed-rate loop pacing on absolute ``time.monotonic()`` deadlines.
+
+    Call ``wait()`` at the top of each iteration. Tick *n* is due at
+    ``start + n * interval`` however long the work took, so the period does
+    not drift. An iteration that runs past the next deadline is an overrun;
+    ticks that are entirely past are either skipped (``SKIP``) or run late
+    back to back (``CATCH_UP``). Wake-up lateness is recorded as jitter.
+    """
+
+    def __init__(self, interval, policy=SKIP, max_catch_up=10, name="loop",
+                 clock=time.monotonic, sleep=time.sleep):
+        if interval <= 0:
+            raise ValueError("interval must be positive")
+        if policy not in POLICIES:
+            raise ValueError(f"policy must be one of {POLICIES}")
+
+        self.interval = interval
+        self.policy = policy
+        self.max_catch_up = max_catch_up
+        self.clock = clock
+        self.sleep = sleep
+
+        self.ticks = 0
+        self.overruns = 0
+        self.missed = 0
+        self._started_at = None
+        self._deadline = None
+        self._behind = False
+        self._jitter = deque(maxlen=JITTER_WINDOW)
+
+        labels = {"loop": name}
+        self._jitter_metric = metrics.histogram(
+            TICK_JITTER, "Wake-up lateness against the tick deadline", labels, JITTER_BUCKETS
+        )
+        self._overrun_metric = metrics.counter(
+            OVERRUNS, "Iterations that ran past the next tick deadline", labels
+        )
+        self._missed_metric = metrics.counter(
+            MISSED_TICKS, "Ticks skipped because they were already past", labels
+        )
+        metrics.gauge(RATE, "Achieved ticks per second", labels).set_function(self.achieved_rate)
+
+    def wait(self):
+        """Block until the next tick is due; return its deadline."""
+        now = self.clock()
+        if self._deadline is None:
+            self._started_at = self._deadline = now
+        else:
+            self._deadline += self.interval
+            late = now - self._deadline
+            if late > 0:
+                # A catch-up tick starts late already; only count new lateness
+                if not self._behind:
+                    self.overruns += 1
+                    self._overrun_metric.inc()
+                self._drop(int(late // self.interval))
+            else:
+                self.sleep(-late)
+
+        jitter = self.clock() - self._deadline
+        self._behind = jitter >= self.interval
+        self._jitter.append(jitter)
+        self._jitter_metric.observe(max(jitter, 0.0))
+        self.ticks += 1
+        return self._deadline
+
+    def _drop(self, behind):
+        # ``behind`` whole ticks are already past, beyond the one due now
+        if self.policy == CATCH_UP:
+            behind = max(0, behind - self.max_catch_up)
+        if behind:
+            self.missed += behind
+            self._missed_metric.inc(behind)
+            self._deadline += behind * self.interval
+
+    # ---------- reporting ----------
+    def achieved_rate(self):
+        """Ticks per second since the first wait()."""
+        if self._started_at is None:
+            return 0.0
+        elapsed = self.clock() - self._started_at
+        return self.ticks / elapsed if elapsed > 0 else 0.0
+
+    def stats(self):
+        jitter = sorted(self._jitter)
+
+        def pct(p):
+            return round(jitter[min(len(jitter) - 1, int(p / 100 * len(jitter)))] * 1000, 2) if jitter else None
+
+        return {
+            "ticks": self.ticks,
+            "rate_hz": round(self.achieved_rate(), 3),
+            "target_hz": round(1 / self.interval, 3),
+            "overruns": self.overruns,
+            "missed": self.missed,
+            "jitter_p50_ms": pct(50),
+            "jitter_p99_ms": pct(99),
+            "jitter_max_ms": round(jitter[-1] * 1000, 2) if jitter else None,
+        }
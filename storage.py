@@ -0,0 +1,315 @@
+import os
+import sqlite3
+import time
+
+from upload_cursor import CURSOR_TABLE_SQL, RANGES_TABLE_SQL
+
+# ---------------- CONFIG ----------------
+TABLE = "brake_pressure_log"
+
+BUSY_TIMEOUT_MS = 5000                 # wait for a lock instead of failing
+CACHE_SIZE_KB = 8 * 1024               # page cache per connection
+MMAP_SIZE = 64 * 1024 * 1024           # memory-mapped reads
+
+# WAL lets the uploader read while capture writes; NORMAL only fsyncs at
+# checkpoints, which is safe in WAL mode (a power cut loses the last
+# commits, never corrupts the file).
+PRAGMAS = (
+    ("journal_mode", "WAL"),
+    ("synchronous", "NORMAL"),
+    ("busy_timeout", BUSY_TIMEOUT_MS),
+    ("cache_size", -CACHE_SIZE_KB),
+    ("mmap_size", MMAP_SIZE),
+    ("temp_store", "MEMORY"),
+)
+
+# ---------------- SCHEMA ----------------
+# Two table layouts are in use: the root scripts store converted pressures,
+# the rpi4 device stores raw ADC counts in its own column order.
+LAYOUTS = {
+    "pressure": {
+        "columns": ("bp_pressure", "fp_pressure", "cr_pressure", "bc_pressure"),
+        "time_column": "created_at",
+        "ddl": f"""
+            CREATE TABLE IF NOT EXISTS {TABLE} (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                bp_pressure REAL,
+                fp_pressure REAL,
+                cr_pressure REAL,
+                bc_pressure REAL,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                uploaded INTEGER DEFAULT 0
+            )
+        """,
+    },
+    "raw": {
+        "columns": ("BP_raw", "BC_raw", "FP_raw", "CR_raw"),
+        "time_column": "timestamp",
+        "ddl": f"""
+            CREATE TABLE IF NOT EXISTS {TABLE} (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                BP_raw INTEGER,
+                BC_raw INTEGER,
+                FP_raw INTEGER,
+                CR_raw INTEGER
+            )
+        """,
+    },
+}
+
+
+# Per-channel min/max/sum/count/last per time bucket (see rollups.py).
+# bucket is the UTC epoch second the bucket starts at; resolution is its width.
+ROLLUP_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS pressure_rollup (
+    resolution INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    channel TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    min REAL,
+    max REAL,
+    sum REAL,
+    last REAL,
+    last_ts REAL,
+    PRIMARY KEY (resolution, channel, bucket)
+) WITHOUT ROWID
+"""
+
+
+# Narrow storage for any number of channels: one row per stored point,
+# keyed by a small channel id, so adding ADCs needs no ALTER TABLE and
+# channels a compressed row did not need take no space at all. ts is UTC
+# epoch milliseconds; value keeps raw counts as integers.
+CHANNEL_TABLE = "channel_log"
+NARROW_COLUMNS = ("ts", "channel_id", "value")
+
+CHANNEL_REGISTRY_SQL = """
+CREATE TABLE IF NOT EXISTS channel_registry (
+    channel_id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    config TEXT,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+CHANNEL_LOG_SQL = f"""
+CREATE TABLE IF NOT EXISTS {CHANNEL_TABLE} (
+    id INTEGER PRIMARY KEY,
+    ts INTEGER NOT NULL,
+    channel_id INTEGER NOT NULL,
+    value NUMERIC
+)
+"""
+
+
+# Brake events found on the device (see brake_events.py). The columns match
+# brake_data; record is the whole event JSON, windows included, as uploaded.
+# Upload progress is an upload_cursor row like the readings' (table_sink).
+EVENT_TABLE = "brake_events"
+
+EVENT_TABLE_SQL = f"""
+CREATE TABLE IF NOT EXISTS {EVENT_TABLE} (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at DATETIME NOT NULL,
+    event_trigger TEXT NOT NULL,
+    brake_status TEXT,
+    brake_fault TEXT,
+    duration REAL,
+    record TEXT NOT NULL
+)
+"""
+
+
+# ---------------- MIGRATIONS ----------------
+# Each entry upgrades the schema by one version (tracked in PRAGMA user_version).
+# All statements are idempotent so databases created before versioning
+# existed migrate cleanly.
+def _create_log_table(conn, layout):
+    conn.execute(LAYOUTS[layout]["ddl"])
+
+
+def _create_cursor_table(conn, layout):
+    conn.execute(CURSOR_TABLE_SQL)
+
+
+def _create_rollup_table(conn, layout):
+    conn.execute(ROLLUP_TABLE_SQL)
+
+
+def _index_log_time(conn, layout):
+    # Short time-range reads go to raw rows; keep them off a full scan
+    time_column = LAYOUTS[layout]["time_column"]
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_log_time ON {TABLE} ({time_column})")
+
+
+def _create_ranges_table(conn, layout):
+    conn.execute(RANGES_TABLE_SQL)
+
+
+def _create_channel_tables(conn, layout):
+    conn.execute(CHANNEL_REGISTRY_SQL)
+    conn.execute(CHANNEL_LOG_SQL)
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_channel_log_time ON {CHANNEL_TABLE} (channel_id, ts)")
+
+
+def _create_event_table(conn, layout):
+    conn.execute(EVENT_TABLE_SQL)
+
+
+MIGRATIONS = [
+    _create_log_table,
+    _create_cursor_table,
+    _create_rollup_table,
+    _index_log_time,
+    _create_ranges_table,
+    _create_channel_tables,
+    _create_event_table,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def migrate(conn, layout):
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version >= SCHEMA_VERSION:
+        return version
+
+    with conn:
+        for step in MIGRATIONS[version:]:
+            step(conn, layout)
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    return SCHEMA_VERSION
+
+
+# ---------------- CONNECTION ----------------
+def connect(path, layout="pressure"):
+    """Open ``path`` with the shared pragmas and an up-to-date schema."""
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+    if conn.execute("PRAGMA page_count").fetchone()[0] == 0:
+        # New file: auto_vacuum can only be chosen before the first table.
+        # Existing databases convert offline (retention.py --incremental-vacuum).
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    for name, value in PRAGMAS:
+        conn.execute(f"PRAGMA {name} = {value}")
+
+    migrate(conn, layout)
+    return conn
+
+
+# ---------------- QUERY HELPERS ----------------
+def utc_timestamp(epoch=None):
+    # Same format and zone as SQLite's CURRENT_TIMESTAMP default
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(epoch))
+
+
+def reading_columns(layout):
+    spec = LAYOUTS[layout]
+    return spec["columns"] + (spec["time_column"],)
+
+
+def insert_sql(layout):
+    columns = reading_columns(layout)
+    return (
+        f"INSERT INTO {TABLE} ({', '.join(columns)}) "
+        f"VALUES ({', '.join('?' for _ in columns)})"
+    )
+
+
+def insert_readings(conn, layout, rows):
+    with conn:
+        conn.executemany(insert_sql(layout), rows)
+
+
+def fetch_pending(conn, layout, after_id, limit, before_id=None):
+    # Primary-key range scan: id > cursor (and below the next acked range)
+    columns = ", ".join(("id",) + reading_columns(layout))
+    if before_id is None:
+        return conn.execute(
+            f"SELECT {columns} FROM {TABLE} WHERE id > ? ORDER BY id ASC LIMIT ?",
+            (after_id, limit),
+        ).fetchall()
+    return conn.execute(
+        f"SELECT {columns} FROM {TABLE} WHERE id > ? AND id < ? ORDER BY id ASC LIMIT ?",
+        (after_id, before_id, limit),
+    ).fetchall()
+
+
+def latest_reading(conn, layout):
+    columns = ", ".join(LAYOUTS[layout]["columns"])
+    row = conn.execute(
+        f"SELECT {columns} FROM {TABLE} ORDER BY id DESC LIMIT 1"
+    ).fetchone()
+    return tuple(row) if row else None
+
+
+# ---------------- NARROW STORAGE ----------------
+def epoch_ms(epoch=None):
+    return int(round((time.time() if epoch is None else epoch) * 1000))
+
+
+def register_channels(conn, channels):
+    """Record ``(name, config_json)`` pairs; return ``{name: channel_id}``.
+
+    Ids are assigned once per name and never reused, so rows already
+    stored keep their meaning when channels are added or reconfigured.
+    """
+    with conn:
+        conn.executemany(
+            """
+            INSERT INTO channel_registry (name, config) VALUES (?, ?)
+            ON CONFLICT (name) DO UPDATE SET
+                config = excluded.config, updated_at = CURRENT_TIMESTAMP
+            WHERE config IS NOT excluded.config
+            """,
+            channels,
+        )
+    return dict(conn.execute("SELECT name, channel_id FROM channel_registry"))
+
+
+def narrow_rows(epoch, values, channel_ids):
+    """One ``(ts, channel_id, value)`` row per value that is not None."""
+    ts = epoch_ms(epoch)
+    return [
+        (ts, channel_id, value)
+        for channel_id, value in zip(channel_ids, values) if value is not None
+    ]
+
+
+def fetch_channel(conn, channel_id, start_ms, end_ms):
+    """``(ts, value)`` points of one channel, ``start_ms <= ts < end_ms``."""
+    return conn.execute(
+        f"""
+        SELECT ts, value FROM {CHANNEL_TABLE}
+        WHERE channel_id = ? AND ts >= ? AND ts < ?
+        ORDER BY ts
+        """,
+        (channel_id, start_ms, end_ms),
+    ).fetchall()
+
+
+# ---------------- BRAKE EVENTS ----------------
+def insert_event(conn, event, record):
+    """Store one brake_events.BrakeEventDetector event; ``record`` is its JSON."""
+    with conn:
+        return conn.execute(
+            f"""
+            INSERT INTO {EVENT_TABLE}
+                (created_at, event_trigger, brake_status, brake_fault, duration, record)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            (event["created_at"], event["event_trigger"], event["brake_status"],
+             event["brake_fault"], event["duration"], record),
+        ).lastrowid
+
+
+def fetch_events(conn, after_id, limit):
+    """``(id, record)`` of events above ``after_id`` (an upload cursor), oldest first."""
+    return conn.execute(
+        f"SELECT id, record FROM {EVENT_TABLE} WHERE id > ? ORDER BY id LIMIT ?",
+        (after_id, limit),
+    ).fetchall()
@@ -1,105 +1,258 @@
 import time
 import sys
-import sqlite3
 import os
+import logging
+
+import logsetup
+import metrics
+import storage
+import channels
+import filters
+import brake_events
+from group_writer import GroupCommitWriter
+from rollups import RollupHook, NarrowRollupHook
+from sampler import ADS1115Sampler, MultiADCSampler, FrameRing, I2C_READ_SECONDS
+from compression import StreamCompressor
+from scheduler import Scheduler
 
 # ---------------- ENCODING ----------------
 sys.stdout.reconfigure(encoding='utf-8')
 
 # ---------------- CONFIG ----------------
-RAW_THRESHOLD = 1638                 # ~0.5 bar equivalent
+COMPRESSION_DEVIATION = float(os.environ.get("COMPRESSION_DEVIATION", 819))     # max rebuild error, raw counts
+COMPRESSION_MAX_INTERVAL = float(os.environ.get("COMPRESSION_MAX_INTERVAL", 60)) # force a point at least this often (s)
 READ_INTERVAL = 0.3                   # seconds
+READ_POLICY = os.environ.get("READ_POLICY", "skip")                 # missed ticks: "skip" or "catch_up"
+WRITE_MAX_ROWS = int(os.environ.get("WRITE_MAX_ROWS", 50))          # rows per commit
+WRITE_MAX_DELAY = float(os.environ.get("WRITE_MAX_DELAY", 5))       # durability window (s)
+SAMPLER_DATA_RATE = int(os.environ.get("SAMPLER_DATA_RATE", 860))   # ADS1115 SPS, 0 = read in the main loop instead
+SAMPLER_FRAME_RATE = float(os.environ.get("SAMPLER_FRAME_RATE", 0)) # frames/s (all channels), 0 = as fast as possible
+SAMPLER_READY_PIN = os.environ.get("SAMPLER_READY_PIN")             # BCM pin wired to ALRT/RDY (optional, one ADC only)
+STORAGE_SCHEMA = os.environ.get("STORAGE_SCHEMA", "wide")           # "wide", or "narrow" (local only: not uploaded or exported)
+SAMPLER_RING_FRAMES = int(os.environ.get("SAMPLER_RING_FRAMES", 4096))
+FILTER_CHAIN = os.environ.get("FILTER_CHAIN", "")                   # e.g. "median:5,ema:0.2", for channels without their own
+FILTER_DECIMATE = int(os.environ.get("FILTER_DECIMATE", 1))         # keep one filtered frame in N
+FILTER_COMPARE = os.environ.get("FILTER_COMPARE", "1") == "1"       # also count what the unfiltered path would store
+BRAKE_EVENTS = os.environ.get("BRAKE_EVENTS", "1") == "1"           # detect brake events (needs bp, fp, cr, bc channels)
+METRICS_PORT = 9101                                                 # default, overridden by METRICS_PORT env
+STATUS_INTERVAL = 60                                                # seconds between INFO status lines
+
+log = logsetup.setup("capture")
 
 # ---------------- DATABASE PATH ----------------
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DB_PATH = os.path.join(BASE_DIR, "db", "project.db")
 
-# ---------------- DATABASE ----------------
-conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-cursor = conn.cursor()
-
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS brake_pressure_log (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    bp_pressure REAL,
-    fp_pressure REAL,
-    cr_pressure REAL,
-    bc_pressure REAL,
-    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-    uploaded INTEGER DEFAULT 0
-)
-""")
-conn.commit()
+# ---------------- CHANNELS ----------------
+# Every ADC input to capture, in frame order (CHANNELS_CONFIG, or bp/fp/cr/bc on 0x48)
+registry = channels.load_registry(layout="pressure")
+wide_order = registry.wide_order(storage.LAYOUTS["pressure"]["columns"])
+if STORAGE_SCHEMA not in ("wide", "narrow"):
+    raise ValueError(f"❌ STORAGE_SCHEMA must be 'wide' or 'narrow', not {STORAGE_SCHEMA!r}")
+NARROW = STORAGE_SCHEMA == "narrow"
+if not NARROW and wide_order is None:
+    raise ValueError(
+        "❌ Channels do not match the wide table's columns; STORAGE_SCHEMA=narrow "
+        "stores them, but only locally (not uploaded or exported)"
+    )
 
-# ---------------- ADS1115 SENSOR ----------------
-ADS_AVAILABLE = True
+# ---------------- DATABASE ----------------
+conn = storage.connect(DB_PATH, "pressure")
+channel_ids = storage.register_channels(conn, registry.config_rows())
+frame_ids = [channel_ids[name] for name in registry.names]
 
-try:
-    import board
-    import busio
-    import adafruit_ads1x15.ads1115 as ADS
-    from adafruit_ads1x15.analog_in import AnalogIn
+# per-minute / per-hour rollups, same transaction
+if NARROW:
+    writer = GroupCommitWriter(
+        conn, storage.CHANNEL_TABLE, storage.NARROW_COLUMNS,
+        max_rows=WRITE_MAX_ROWS * len(registry), max_delay=WRITE_MAX_DELAY,
+        hooks=[NarrowRollupHook(channel_ids)]
+    )
+else:
+    writer = GroupCommitWriter(
+        conn, storage.TABLE, storage.reading_columns("pressure"),
+        max_rows=WRITE_MAX_ROWS, max_delay=WRITE_MAX_DELAY,
+        hooks=[RollupHook("pressure")]
+    )
+writer.install_signal_handlers()
+log.info("%d channel(s) on %d ADC(s), %s storage", len(registry), len(registry.addresses), "narrow" if NARROW else "wide")
+if NARROW:
+    log.warning("⚠️ Narrow storage is local only: %s rows are not uploaded or exported", storage.CHANNEL_TABLE)
 
-    i2c = busio.I2C(board.SCL, board.SDA)
-    ads = ADS.ADS1115(i2c)
-    ads.gain = 1
+# ---------------- METRICS ----------------
+LOOP_SECONDS = metrics.histogram("capture_loop_seconds", "Main loop iteration time, sleep excluded")
+STORED_POINTS = metrics.counter("capture_stored_points", "Compressed points queued for the DB")
+metrics.gauge("capture_buffered_rows", "Readings waiting for the next group commit").set_function(lambda: len(writer))
+metrics.start_exporter(METRICS_PORT)
 
-    bp_channel = AnalogIn(ads, 0)
-    fp_channel = AnalogIn(ads, 1)
-    cr_channel = AnalogIn(ads, 2)
-    bc_channel = AnalogIn(ads, 3)
+# ---------------- ADS1115 SENSORS ----------------
+bank = None
 
-except Exception:
-    ADS_AVAILABLE = False
+try:
+    bank = channels.open_bank(registry)
+except Exception as e:
+    log.warning("⚠️ ADS1115 not available, storing zeros: %s", e)
 
 # ---------------- SENSOR READ FUNCTION ----------------
 def read_raw_values():
-    if ADS_AVAILABLE:
-        return (
-            bp_channel.value,
-            fp_channel.value,
-            cr_channel.value,
-            bc_channel.value
+    if bank is not None:
+        with I2C_READ_SECONDS.time():
+            return bank.read_frame()
+    return [0] * len(registry)
+
+# ---------------- SAMPLER ----------------
+sampler = None
+frame_reader = None
+
+if bank is not None and SAMPLER_DATA_RATE:
+    ring = FrameRing(SAMPLER_RING_FRAMES, channels=len(registry))
+    gains = {channel.gain for channel in registry}
+    if SAMPLER_READY_PIN and len(registry.addresses) == 1 and len(gains) == 1:
+        # Single-shot conversions paced by ALRT/RDY; needs all inputs on one chip at one gain
+        sampler = ADS1115Sampler(
+            bank.adcs[registry.addresses[0]],
+            channels=[channel.mux for channel in registry],
+            gain=gains.pop(),
+            data_rate=SAMPLER_DATA_RATE,
+            frame_rate=SAMPLER_FRAME_RATE or None,
+            ring=ring,
+            ready_pin=int(SAMPLER_READY_PIN)
         )
-    return (0, 0, 0, 0)
+    else:
+        sampler = MultiADCSampler(bank, frame_rate=SAMPLER_FRAME_RATE or None, ring=ring)
+    frame_reader = sampler.ring.reader()
+    sampler.start()
 
-# ---------------- MAIN LOOP ----------------
-print("System started...\n", flush=True)
+def read_frames():
+    if frame_reader is not None:
+        return frame_reader.read()
+    return [(time.time(), read_raw_values())]
 
-last_raw = None
+# ---------------- FILTERING ----------------
+# Per-channel chains (channel "filters", else FILTER_CHAIN) over each block
+# of frames, then decimation, before the compressor sees them
+pipeline = filters.build_pipeline(registry, FILTER_CHAIN, FILTER_DECIMATE)
 
-while True:
-    current_raw = read_raw_values()
-    timestamp = time.strftime('%Y-%m-%d %H:%M:%S')
+# ---------------- COMPRESSION ----------------
+# Per-channel swinging door: only points needed to rebuild each channel
+# within COMPRESSION_DEVIATION are stored; other channels in a row are NULL.
+compressor = StreamCompressor(
+    [COMPRESSION_DEVIATION] * len(registry),
+    max_interval=COMPRESSION_MAX_INTERVAL,
+    decimals=0
+)
+metrics.gauge("capture_compression_ratio", "Readings in per point stored").set_function(lambda: compressor.ratio)
 
-    print(
-        f"RAW VALUES | "
-        f"BP:{current_raw[0]} | FP:{current_raw[1]} "
-        f"CR:{current_raw[2]} | BC:{current_raw[3]} | "
-        f"timestamp : {timestamp}",
-        flush=True
+# Shadow compressor on the unfiltered frames: its output is only counted
+raw_compressor = None
+if pipeline.active and FILTER_COMPARE:
+    raw_compressor = StreamCompressor(
+        [COMPRESSION_DEVIATION] * len(registry),
+        max_interval=COMPRESSION_MAX_INTERVAL,
+        decimals=0
+    )
+    RAW_PATH_ROWS = metrics.counter("capture_raw_path_rows", "Rows the capture would store without filtering")
+    metrics.gauge("capture_filter_row_reduction", "Rows stored without filtering per row stored with it").set_function(
+        lambda: RAW_PATH_ROWS.value / STORED_POINTS.value if STORED_POINTS.value else 0.0
     )
 
-    upload = False
+# ---------------- BRAKE EVENTS ----------------
+# Every filtered frame, converted to bar, goes through the detector;
+# finished events are stored in brake_events for the uploader
+detector = None
+if BRAKE_EVENTS and set(brake_events.CHANNELS) <= set(registry.names):
+    brake_index = [registry.names.index(name) for name in brake_events.CHANNELS]
+    brake_converter = registry.converter(brake_index)
+    detector = brake_events.BrakeEventDetector()
+    BRAKE_EVENT_COUNT = metrics.counter("capture_brake_events", "Brake events stored")
+elif BRAKE_EVENTS:
+    log.warning("⚠️ Brake event detection needs channels named %s", ", ".join(brake_events.CHANNELS))
 
-    if last_raw is None:
-        upload = True
-    else:
-        diffs = [abs(current_raw[i] - last_raw[i]) for i in range(4)]
-        if any(diff >= RAW_THRESHOLD for diff in diffs):
-            upload = True
-
-    if upload:
-        cursor.execute("""
-            INSERT INTO brake_pressure_log
-            (bp_pressure, fp_pressure, cr_pressure, bc_pressure)
-            VALUES (?, ?, ?, ?)
-        """, (*current_raw,))
-        conn.commit()
-        last_raw = current_raw
-        print(f"✅ Data inserted into DB at {timestamp}", flush=True)
-    else:
-        print("⏭ No significant change → Skipped insert", flush=True)
+def store_events(events):
+    for event in events:
+        storage.insert_event(conn, event, brake_events.to_json(event))
+        BRAKE_EVENT_COUNT.inc()
+        log.info(
+            "🛑 %s | status:%s fault:%s duration:%s",
+            event["event_trigger"], event["brake_status"], event["brake_fault"], event["duration"]
+        )
+
+def detect(frames):
+    for frame_time, values in frames:
+        pressures = brake_converter.convert_one([int(round(values[i])) for i in brake_index])
+        store_events(detector.add(frame_time, *pressures))
+
+def store(rows):
+    for frame_time, values in rows:
+        if NARROW:
+            for row in storage.narrow_rows(frame_time, values, frame_ids):
+                writer.add(row)
+        else:
+            writer.add((*[values[i] for i in wide_order], storage.utc_timestamp(frame_time)))
+    STORED_POINTS.inc(len(rows))
+    return len(rows)
+
+# ---------------- MAIN LOOP ----------------
+log.info("System started...")
+scheduler = Scheduler(READ_INTERVAL, policy=READ_POLICY, name="capture")
+status_at = time.monotonic() + STATUS_INTERVAL
+
+try:
+    while True:
+        scheduler.wait()
+        loop_started = time.perf_counter()
+        raw_frames = read_frames()
+        inserted = 0
+
+        if raw_compressor is not None:
+            for frame_time, current_raw in raw_frames:
+                RAW_PATH_ROWS.inc(len(raw_compressor.add(frame_time, current_raw)))
+
+        frames = pipeline.process(raw_frames)
+        if detector is not None:
+            detect(frames)
+        for frame_time, current_raw in frames:
+            inserted += store(compressor.add(frame_time, current_raw))
+
+        if frames and log.isEnabledFor(logging.DEBUG):
+            log.debug("RAW VALUES | %s", " | ".join(
+                f"{name.upper()}:{value}" for name, value in zip(registry.names, frames[-1][1])
+            ))
+
+        if inserted:
+            log.debug("✅ %d point(s) queued for DB (%d buffered)", inserted, len(writer))
+        else:
+            writer.maybe_flush()
+            log.debug("⏭ No significant change → Skipped insert", extra=logsetup.every(STATUS_INTERVAL))
+
+        if time.monotonic() >= status_at:
+            status_at += STATUS_INTERVAL
+            if sampler is not None:
+                stats = sampler.stats()
+                log.info(
+                    "SAMPLER | rate:%s Hz dropped:%d errors:%d",
+                    stats["rate_hz"], stats["dropped"], stats["errors"]
+                )
+            log.info(
+                "STATUS | %d stored, %d buffered, compression %.1fx",
+                writer.flushed_rows, len(writer), compressor.ratio
+            )
+            if raw_compressor is not None and STORED_POINTS.value:
+                log.info(
+                    "FILTER | %d of %d frames kept, %d rows stored vs %d unfiltered (%.1fx fewer)",
+                    pipeline.frames_out, pipeline.frames_in, STORED_POINTS.value,
+                    RAW_PATH_ROWS.value, RAW_PATH_ROWS.value / STORED_POINTS.value
+                )
+            log.info("SCHEDULE | %s", scheduler.stats())
+
+        LOOP_SECONDS.observe(time.perf_counter() - loop_started)
 
-    print("---------------------------------------------\n", flush=True)
-    time.sleep(READ_INTERVAL)
+finally:
+    if sampler is not None:
+        sampler.stop()
+    store(compressor.flush())
+    if detector is not None:
+        store_events(detector.flush())
+    writer.close()
+    conn.close()
+    log.info("🔻 Buffered readings flushed, shutting down")
@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+"""Capture and upload in one process (optional alternative to running
+system_capture.py and system_upload.py side by side).
+
+Readings go to SQLite through the group-commit writer as usual *and* to an
+in-memory queue that the uploader thread publishes from directly, so a
+healthy link sees sample-to-publish latency of tens of milliseconds. If
+the link drops or the queue overflows, the uploader reads the missing
+rows back from SQLite and returns to the queue once caught up. The
+upload cursor and QoS1 ack handling are the same as system_upload.py.
+"""
+import os
+import sys
+import ssl
+import time
+import logging
+import threading
+import paho.mqtt.client as mqtt
+
+import logsetup
+import metrics
+import storage
+import channels
+import filters
+from compression import StreamCompressor
+from fastpath import BatchSource, LiveFeed, first_free_id
+from group_writer import GroupCommitWriter
+from linkquality import Backoff
+from payload_codec import timestamp_to_ms
+from publisher import WindowedPublisher
+from rollups import RollupHook
+from sampler import ADS1115Sampler, MultiADCSampler, FrameRing, I2C_READ_SECONDS
+from scheduler import Scheduler
+from upload_batch import build_batch, build_compact_batch
+from upload_cursor import init_cursor, advance_cursor, pending_count
+
+# ---------------- ENCODING ----------------
+sys.stdout.reconfigure(encoding='utf-8')
+
+# ---------------- CONFIG ----------------
+LAYOUT = "pressure"
+COMPRESSION_DEVIATION = float(os.environ.get("COMPRESSION_DEVIATION", 819))     # max rebuild error, raw counts
+COMPRESSION_MAX_INTERVAL = float(os.environ.get("COMPRESSION_MAX_INTERVAL", 60)) # force a point at least this often (s)
+READ_INTERVAL = float(os.environ.get("READ_INTERVAL", 0.05))        # drain the sampler this often (s)
+READ_POLICY = os.environ.get("READ_POLICY", "skip")                 # missed ticks: "skip" or "catch_up"
+WRITE_MAX_ROWS = int(os.environ.get("WRITE_MAX_ROWS", 50))          # rows per commit
+WRITE_MAX_DELAY = float(os.environ.get("WRITE_MAX_DELAY", 5))       # durability window (s)
+SAMPLER_DATA_RATE = int(os.environ.get("SAMPLER_DATA_RATE", 860))   # ADS1115 SPS, 0 = read in the main loop instead
+SAMPLER_FRAME_RATE = float(os.environ.get("SAMPLER_FRAME_RATE", 0)) # frames/s (all channels), 0 = as fast as possible
+SAMPLER_READY_PIN = os.environ.get("SAMPLER_READY_PIN")             # BCM pin wired to ALRT/RDY (optional, one ADC only)
+SAMPLER_RING_FRAMES = int(os.environ.get("SAMPLER_RING_FRAMES", 4096))
+FILTER_CHAIN = os.environ.get("FILTER_CHAIN", "")                   # e.g. "median:5,ema:0.2", for channels without their own
+FILTER_DECIMATE = int(os.environ.get("FILTER_DECIMATE", 1))         # keep one filtered frame in N
+FILTER_COMPARE = os.environ.get("FILTER_COMPARE", "1") == "1"       # also count what the unfiltered path would store
+
+LIVE_QUEUE_ROWS = int(os.environ.get("LIVE_QUEUE_ROWS", 5000))      # in-memory readings before spilling
+BATCH_SIZE = int(os.environ.get("UPLOAD_BATCH_SIZE", 50))           # rows per publish
+BATCH_MAX_BYTES = int(os.environ.get("UPLOAD_BATCH_MAX_BYTES", 64 * 1024))
+UPLOAD_FORMAT = os.environ.get("UPLOAD_FORMAT", "json")               # "json" or "compact" (payload_codec)
+UPLOAD_COMPRESS = os.environ.get("UPLOAD_COMPRESS", "0") == "1"       # zlib the compact body
+UPLOAD_WINDOW = int(os.environ.get("UPLOAD_WINDOW", 8))               # QoS1 batches in flight
+UPLOAD_ACK_TIMEOUT = float(os.environ.get("UPLOAD_ACK_TIMEOUT", 30))  # resend if no PUBACK (s)
+BACKLOG_INTERVAL = 10                                                 # seconds between backlog refreshes
+STATUS_INTERVAL = 60                                                  # seconds between INFO status lines
+METRICS_PORT = 9103                                                   # default, overridden by METRICS_PORT env
+
+# ---------------- PATHS ----------------
+BASE_PATH = "/home/pi_123/data/src/pressure_project"
+DB_PATH = os.path.join(BASE_PATH, "db/project.db")
+RASPI_PATH = os.path.join(BASE_PATH, "raspi")
+
+CA_PATH = os.path.join(RASPI_PATH, "AmazonRootCA1 (4).pem")
+CERT_PATH = os.path.join(RASPI_PATH, "3e866ef4c18b7534f9052110a7eb36cdede25434a3cc08e3df2305a14aba5175-certificate.pem.crt")
+KEY_PATH = os.path.join(RASPI_PATH, "3e866ef4c18b7534f9052110a7eb36cdede25434a3cc08e3df2305a14aba5175-private.pem.key")
+
+ENDPOINT = "amu2pa1jg3r4s-ats.iot.ap-south-1.amazonaws.com"
+TOPIC = "brake/pressure"
+SINK = "aws_iot"
+
+log = logsetup.setup("combined")
+
+# ---------------- CHANNELS ----------------
+# Live rows are published as wide rows, so the registry must map onto the
+# table's columns (system_capture.py with STORAGE_SCHEMA=narrow stores other
+# channel sets, local only)
+registry = channels.load_registry(layout=LAYOUT)
+wide_order = registry.wide_order(storage.LAYOUTS[LAYOUT]["columns"])
+if wide_order is None:
+    raise ValueError("❌ Channels do not match the wide table's columns")
+
+# ---------------- DATABASE ----------------
+conn = storage.connect(DB_PATH, LAYOUT)
+storage.register_channels(conn, registry.config_rows())
+last_uploaded_id = init_cursor(conn, SINK)
+next_id = first_free_id(conn)
+
+# Ids are assigned here rather than by SQLite so a reading can be published
+# from memory before its group commit; the rollup hook reads the leading
+# (*values, timestamp) columns and ignores the trailing id.
+writer = GroupCommitWriter(
+    conn, storage.TABLE, storage.reading_columns(LAYOUT) + ("id",),
+    max_rows=WRITE_MAX_ROWS, max_delay=WRITE_MAX_DELAY,
+    hooks=[RollupHook(LAYOUT)]
+)
+writer.install_signal_handlers()
+feed = LiveFeed(LIVE_QUEUE_ROWS)
+
+log.info("Upload cursor [%s] at id=%d, next id=%d", SINK, last_uploaded_id, next_id)
+
+# ---------------- METRICS ----------------
+BACKLOG = metrics.gauge("upload_backlog_rows", "Rows not yet acknowledged by AWS IoT")
+CURSOR = metrics.gauge("upload_cursor_id", "Highest acknowledged row id")
+CONNECTS = metrics.counter("upload_mqtt_connects", "Successful MQTT (re)connects")
+STORED_POINTS = metrics.counter("capture_stored_points", "Compressed points queued for the DB")
+metrics.gauge("combined_live_queue_rows", "Readings waiting in the live queue").set_function(lambda: len(feed))
+metrics.start_exporter(METRICS_PORT)
+
+# ---------------- ADS1115 SENSORS ----------------
+bank = None
+
+try:
+    bank = channels.open_bank(registry)
+except Exception as e:
+    log.warning("⚠️ ADS1115 not available, storing zeros: %s", e)
+
+def read_raw_values():
+    if bank is not None:
+        with I2C_READ_SECONDS.time():
+            return bank.read_frame()
+    return [0] * len(registry)
+
+sampler = None
+frame_reader = None
+
+if bank is not None and SAMPLER_DATA_RATE:
+    ring = FrameRing(SAMPLER_RING_FRAMES, channels=len(registry))
+    gains = {channel.gain for channel in registry}
+    if SAMPLER_READY_PIN and len(registry.addresses) == 1 and len(gains) == 1:
+        sampler = ADS1115Sampler(
+            bank.adcs[registry.addresses[0]],
+            channels=[channel.mux for channel in registry],
+            gain=gains.pop(),
+            data_rate=SAMPLER_DATA_RATE,
+            frame_rate=SAMPLER_FRAME_RATE or None,
+            ring=ring,
+            ready_pin=int(SAMPLER_READY_PIN)
+        )
+    else:
+        sampler = MultiADCSampler(bank, frame_rate=SAMPLER_FRAME_RATE or None, ring=ring)
+    frame_reader = sampler.ring.reader()
+    sampler.start()
+
+# Per-channel filter chains and decimation (see filters.py)
+pipeline = filters.build_pipeline(registry, FILTER_CHAIN, FILTER_DECIMATE)
+
+compressor = StreamCompressor(
+    [COMPRESSION_DEVIATION] * len(registry),
+    max_interval=COMPRESSION_MAX_INTERVAL,
+    decimals=0
+)
+
+# Shadow compressor on the unfiltered frames: its output is only counted
+raw_compressor = None
+if pipeline.active and FILTER_COMPARE:
+    raw_compressor = StreamCompressor(
+        [COMPRESSION_DEVIATION] * len(registry),
+        max_interval=COMPRESSION_MAX_INTERVAL,
+        decimals=0
+    )
+    RAW_PATH_ROWS = metrics.counter("capture_raw_path_rows", "Rows the capture would store without filtering")
+    metrics.gauge("capture_filter_row_reduction", "Rows stored without filtering per row stored with it").set_function(
+        lambda: RAW_PATH_ROWS.value / STORED_POINTS.value if STORED_POINTS.value else 0.0
+    )
+
+def read_frames():
+    if frame_reader is not None:
+        frames = frame_reader.read()
+    else:
+        frames = [(time.time(), read_raw_values())]
+    if raw_compressor is not None:
+        for frame_time, values in frames:
+            RAW_PATH_ROWS.inc(len(raw_compressor.add(frame_time, values)))
+    # Frames come in registry order; rows use the table's column order
+    return [(frame_time, tuple(values[i] for i in wide_order)) for frame_time, values in pipeline.process(frames)]
+
+def store(rows):
+    global next_id
+    STORED_POINTS.inc(len(rows))
+    for frame_time, values in rows:
+        timestamp = storage.utc_timestamp(frame_time)
+        writer.add((*values, timestamp, next_id))
+        feed.put(next_id, (next_id, *values, timestamp), frame_time)
+        next_id += 1
+    return len(rows)
+
+# ---------------- MQTT ----------------
+running = threading.Event()
+running.set()
+connected = threading.Event()
+resend_pending = threading.Event()
+
+def on_connect(client, userdata, flags, rc, properties=None):
+    if rc == 0:
+        connected.set()
+        resend_pending.set()
+        CONNECTS.inc()
+        log.info("✅ Connected to AWS IoT Core")
+    else:
+        log.error("❌ MQTT connection failed, RC: %s", rc)
+
+def on_disconnect(client, userdata, rc, properties=None):
+    connected.clear()
+    log.warning("⚠️ MQTT disconnected, reason: %s", rc)
+
+def on_publish(client, userdata, mid, *args):
+    publisher.on_ack(mid)
+
+client = mqtt.Client(client_id="Raspberry_pi", protocol=mqtt.MQTTv311)
+client.on_connect = on_connect
+client.on_disconnect = on_disconnect
+client.on_publish = on_publish
+client.max_inflight_messages_set(max(20, UPLOAD_WINDOW))
+client.tls_set(ca_certs=CA_PATH, certfile=CERT_PATH, keyfile=KEY_PATH, tls_version=ssl.PROTOCOL_TLSv1_2)
+client.reconnect_delay_set(min_delay=2, max_delay=60)
+
+def publish_payload(payload):
+    return client.publish(TOPIC, payload, qos=1).mid
+
+publisher = WindowedPublisher(publish_payload, window=UPLOAD_WINDOW, ack_timeout=UPLOAD_ACK_TIMEOUT)
+
+# ---------------- PAYLOAD ----------------
+def row_to_payload(row):
+    id_, bp, fp, cr, bc, created_at = row
+    return {"id": id_, "bp": bp, "fp": fp, "cr": cr, "bc": bc, "timestamp": str(created_at)}
+
+def row_to_reading(row):
+    id_, bp, fp, cr, bc, created_at = row
+    return id_, timestamp_to_ms(created_at), (bp, fp, cr, bc)
+
+def build_payload(rows):
+    if UPLOAD_FORMAT == "compact":
+        return build_compact_batch(
+            rows, row_to_reading, storage.LAYOUTS[LAYOUT]["columns"],
+            BATCH_SIZE, BATCH_MAX_BYTES, scale=100, compress=UPLOAD_COMPRESS
+        )
+    return build_batch(rows, row_to_payload, BATCH_SIZE, BATCH_MAX_BYTES)
+
+# ---------------- UPLOAD THREAD ----------------
+def upload_loop():
+    global last_uploaded_id
+    # Own connection: the capture thread commits on the other one
+    upload_conn = storage.connect(DB_PATH, LAYOUT)
+    source = BatchSource(feed, upload_conn, LAYOUT, BATCH_SIZE)
+    backlog_checked_at = 0.0
+    error_backoff = Backoff(base=1, cap=30)
+    CURSOR.set(last_uploaded_id)
+
+    while running.is_set():
+        try:
+            if not connected.is_set():
+                source.link_down()
+                time.sleep(0.5)
+                continue
+
+            if resend_pending.is_set():
+                resend_pending.clear()
+                resent = publisher.resend_unacked()
+                if resent:
+                    log.info("🔁 Resent %d unacked batch(es) after reconnect", resent)
+            else:
+                publisher.resend_unacked(only_expired=True)
+
+            acked_id = publisher.collect_acked()
+            if acked_id is not None:
+                last_uploaded_id = acked_id
+                advance_cursor(upload_conn, SINK, last_uploaded_id)
+                CURSOR.set(last_uploaded_id)
+
+            if time.monotonic() - backlog_checked_at >= BACKLOG_INTERVAL:
+                BACKLOG.set(pending_count(upload_conn, SINK))
+                backlog_checked_at = time.monotonic()
+
+            if publisher.full():
+                time.sleep(0.005)
+                continue
+
+            after_id = publisher.last_sent_id if publisher.last_sent_id is not None else last_uploaded_id
+            rows = source.next_batch(after_id)
+            error_backoff.reset()
+            if not rows:
+                continue
+
+            payload, batch = build_payload(rows)
+            publisher.send(payload, batch[-1][0])
+            log.debug(
+                "📤 Sent %d rows (%s) | id=%d..%d bytes=%d",
+                len(batch), source.mode, batch[0][0], batch[-1][0], len(payload)
+            )
+        except Exception as e:
+            # on_disconnect owns `connected`; a failed step is just retried
+            delay = error_backoff.next_delay()
+            log.error("❌ Upload error: %s | retrying in %.1f seconds", e, delay, extra=logsetup.every(60))
+            time.sleep(delay)
+
+    upload_conn.close()
+
+def connect_mqtt():
+    while running.is_set():
+        try:
+            client.connect(ENDPOINT, 8883, keepalive=60)
+            client.loop_start()   # paho reconnects by itself from here on
+            return
+        except Exception as e:
+            log.error("❌ MQTT connect failed: %s", e, extra=logsetup.every(60))
+            time.sleep(2)
+
+threading.Thread(target=connect_mqtt, name="mqtt-connect", daemon=True).start()
+uploader = threading.Thread(target=upload_loop, name="uploader", daemon=True)
+uploader.start()
+
+# ---------------- CAPTURE LOOP ----------------
+log.info("Combined capture + upload started...")
+scheduler = Scheduler(READ_INTERVAL, policy=READ_POLICY, name="combined")
+status_at = time.monotonic() + STATUS_INTERVAL
+
+try:
+    while True:
+        scheduler.wait()
+        frames = read_frames()
+        for frame_time, current_raw in frames:
+            store(compressor.add(frame_time, current_raw))
+        writer.maybe_flush()
+
+        if frames and log.isEnabledFor(logging.DEBUG):
+            log.debug("RAW VALUES | BP:%s | FP:%s | CR:%s | BC:%s", *frames[-1][1])
+
+        if time.monotonic() >= status_at:
+            status_at += STATUS_INTERVAL
+            log.info(
+                "STATUS | next id %d, acked %d, queue %d, overflows %d, in flight %d, "
+                "rtt %.3fs, compression %.1fx",
+                next_id, last_uploaded_id, len(feed), feed.overflows, len(publisher),
+                publisher.mean_rtt(), compressor.ratio
+            )
+            if raw_compressor is not None and STORED_POINTS.value:
+                log.info(
+                    "FILTER | %d of %d frames kept, %d rows stored vs %d unfiltered (%.1fx fewer)",
+                    pipeline.frames_out, pipeline.frames_in, STORED_POINTS.value,
+                    RAW_PATH_ROWS.value, RAW_PATH_ROWS.value / STORED_POINTS.value
+                )
+
+finally:
+    if sampler is not None:
+        sampler.stop()
+    store(compressor.flush())
+    writer.close()
+    running.clear()
+    uploader.join(timeout=5)
+    try:
+        client.loop_stop()
+        client.disconnect()
+    except Exception:
+        pass
+    conn.close()
+    log.info("🔻 Buffered readings flushed, shutting down")
@@ -1,8 +1,14 @@
-import sqlite3
 import time
 import os
 import sys
 
+import storage
+import channels
+from group_writer import GroupCommitWriter
+from rollups import RollupHook
+from compression import StreamCompressor
+from scheduler import Scheduler
+
 # ---------------- ENCODING ----------------
 sys.stdout.reconfigure(encoding='utf-8')
 
@@ -13,119 +19,99 @@ DB_PATH = os.path.join(DB_FOLDER, "project.db")
 
 os.makedirs(DB_FOLDER, exist_ok=True)
 
+# ---------------- WRITE CONFIG ----------------
+WRITE_MAX_ROWS = int(os.environ.get("WRITE_MAX_ROWS", 50))          # rows per commit
+WRITE_MAX_DELAY = float(os.environ.get("WRITE_MAX_DELAY", 60))      # durability window (s)
+COMPRESSION_DEVIATION = float(os.environ.get("COMPRESSION_DEVIATION", 0.25))     # max rebuild error, bar
+COMPRESSION_MAX_INTERVAL = float(os.environ.get("COMPRESSION_MAX_INTERVAL", 600)) # force a point at least this often (s)
+READ_INTERVAL = 10                                                  # seconds
+READ_POLICY = os.environ.get("READ_POLICY", "skip")                 # missed ticks: "skip" or "catch_up"
+
 print(f"Database file: {DB_PATH}", flush=True)
 
 # ---------------- DATABASE SETUP ----------------
-conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-conn.row_factory = sqlite3.Row
-cursor = conn.cursor()
-
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS brake_pressure_log (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    bp_pressure REAL,
-    fp_pressure REAL,
-    cr_pressure REAL,
-    bc_pressure REAL,
-    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-    uploaded INTEGER DEFAULT 0
+conn = storage.connect(DB_PATH, "pressure")
+
+writer = GroupCommitWriter(
+    conn, storage.TABLE, storage.reading_columns("pressure"),
+    max_rows=WRITE_MAX_ROWS, max_delay=WRITE_MAX_DELAY,
+    hooks=[RollupHook("pressure")]  # per-minute / per-hour rollups, same transaction
 )
-""")
-conn.commit()
+writer.install_signal_handlers()
+
+# ---------------- CHANNELS ----------------
+# Converted pressures go to the wide table, so the registry must map onto
+# its BP, FP, CR, BC columns. Calibration is per channel (default: gain 1,
+# 160 Ω shunt, 0–10 bar on every channel).
+registry = channels.load_registry(layout="pressure")
+wide_order = registry.wide_order(storage.LAYOUTS["pressure"]["columns"])
+if wide_order is None:
+    raise ValueError("❌ Channels do not match the pressure table's columns")
+storage.register_channels(conn, registry.config_rows())
+converter = registry.converter(wide_order)
 
 # ---------------- ADS1115 SETUP ----------------
-ADS_AVAILABLE = True
+bank = None
 
 try:
-    import board
-    import busio
-    import adafruit_ads1x15.ads1115 as ADS
-    from adafruit_ads1x15.analog_in import AnalogIn
-
-    i2c = busio.I2C(board.SCL, board.SDA)
-    ads = ADS.ADS1115(i2c)
-    ads.gain = 1   # ±4.096V
-
-    bp_channel = AnalogIn(ads, 0)
-    fp_channel = AnalogIn(ads, 1)
-    cr_channel = AnalogIn(ads, 2)
-    bc_channel = AnalogIn(ads, 3)
-
+    bank = channels.open_bank(registry)
 except Exception as e:
     print("⚠️ ADS1115 not detected. Using dummy values.", flush=True)
-    ADS_AVAILABLE = False
-
-# ---------------- CONSTANTS ----------------
-FULL_SCALE_VOLTAGE = 4.096
-ADC_MAX = 32767
-RESISTOR = 160.0
-PRESSURE_RANGE = 10.0   # 0–10 bar
 
 # ---------------- SENSOR FUNCTIONS ----------------
 def read_raw_values():
-    if ADS_AVAILABLE:
-        return (
-            bp_channel.value,
-            fp_channel.value,
-            cr_channel.value,
-            bc_channel.value
-        )
+    if bank is not None:
+        frame = bank.read_frame()
+        return tuple(frame[i] for i in wide_order)
     else:
         return (0, 0, 0, 0)
 
-def convert_to_pressure(raw):
-    # Step 1: Raw -> Voltage
-    voltage = (raw / ADC_MAX) * FULL_SCALE_VOLTAGE
-
-    # Step 2: Voltage -> Current (mA)
-    current_mA = (voltage / RESISTOR) * 1000
-
-    # Step 3: 4–20mA -> Pressure
-    pressure = ((current_mA - 4) / 16) * PRESSURE_RANGE
-
-    # Clamp negative values
-    if pressure < 0:
-        pressure = 0
-
-    return round(pressure, 2)
-
 def get_pressures():
     raw_values = read_raw_values()
-    pressures = tuple(convert_to_pressure(r) for r in raw_values)
+    pressures = converter.convert_one(raw_values)
     return raw_values, pressures
 
 # ---------------- MAIN LOOP ----------------
 print("\nSystem started... Logging every 10 seconds\n", flush=True)
 
-while True:
-    raw_values, pressures = get_pressures()
-
-    cursor.execute("""
-        SELECT bp_pressure, fp_pressure, cr_pressure, bc_pressure
-        FROM brake_pressure_log
-        ORDER BY id DESC
-        LIMIT 1
-    """)
-    last = cursor.fetchone()
-
-    if not last or any(abs(n - l) >= 0.5 for n, l in zip(pressures, last)):
-        cursor.execute("""
-            INSERT INTO brake_pressure_log
-            (bp_pressure, fp_pressure, cr_pressure, bc_pressure)
-            VALUES (?, ?, ?, ?)
-        """, pressures)
-        conn.commit()
-
-    print(
-        f"RAW VALUES\n"
-        f"BP:{raw_values[0]} | FP:{raw_values[1]} | "
-        f"CR:{raw_values[2]} | BC:{raw_values[3]}\n"
-        f"PRESSURE VALUES\n"
-        f"BP:{pressures[0]} bar | FP:{pressures[1]} bar | "
-        f"CR:{pressures[2]} bar | BC:{pressures[3]} bar\n"
-        f"Time: {time.strftime('%Y-%m-%d %H:%M:%S')}\n"
-        "---------------------------------------------",
-        flush=True
-    )
-
-    time.sleep(10)
+# Per-channel swinging door kept in memory instead of re-reading the last row
+compressor = StreamCompressor(
+    [COMPRESSION_DEVIATION] * 4,
+    max_interval=COMPRESSION_MAX_INTERVAL,
+    decimals=2
+)
+
+def store(rows):
+    for sample_time, values in rows:
+        writer.add((*values, storage.utc_timestamp(sample_time)))
+    return len(rows)
+
+scheduler = Scheduler(READ_INTERVAL, policy=READ_POLICY, name="convert")
+
+try:
+    while True:
+        scheduler.wait()
+        raw_values, pressures = get_pressures()
+
+        if not store(compressor.add(time.time(), pressures)):
+            writer.maybe_flush()
+
+        print(
+            f"RAW VALUES\n"
+            f"BP:{raw_values[0]} | FP:{raw_values[1]} | "
+            f"CR:{raw_values[2]} | BC:{raw_values[3]}\n"
+            f"PRESSURE VALUES\n"
+            f"BP:{pressures[0]} bar | FP:{pressures[1]} bar | "
+            f"CR:{pressures[2]} bar | BC:{pressures[3]} bar\n"
+            f"Time: {time.strftime('%Y-%m-%d %H:%M:%S')} | "
+            f"Compression: {compressor.ratio:.1f}x | "
+            f"Rate: {scheduler.achieved_rate():.3f} Hz, overruns {scheduler.overruns}\n"
+            "---------------------------------------------",
+            flush=True
+        )
+
+finally:
+    store(compressor.flush())
+    writer.close()
+    conn.close()
+    print("🔻 Buffered readings flushed, shutting down", flush=True)
@@ -4,10 +4,19 @@ import json
 import time
 import ssl
 import signal
-import sqlite3
-import socket
 import paho.mqtt.client as mqtt
 
+import logsetup
+import metrics
+import storage
+from upload_batch import build_batch, build_compact_batch
+from payload_codec import timestamp_to_ms
+from publisher import WindowedPublisher, AckRouter
+from upload_cursor import advance_cursor, init_cursor, pending_count, record_acked, table_sink
+from catchup import CatchUpUploader
+from retention import archive_dir_for
+from linkquality import LinkMonitor, Backoff
+
 # ================= PATH CONFIG =================
 BASE_PATH = "/home/pi_123/data/src/pressure_project"
 DB_PATH = os.path.join(BASE_PATH, "db/project.db")
@@ -19,58 +28,90 @@ KEY_PATH = os.path.join(RASPI_PATH, "3e866ef4c18b7534f9052110a7eb36cdede25434a3c
 
 ENDPOINT = "amu2pa1jg3r4s-ats.iot.ap-south-1.amazonaws.com"
 TOPIC = "brake/pressure"
+SINK = "aws_iot"
+EVENTS_SINK = table_sink(storage.EVENT_TABLE, SINK)
+
+# ================= BATCH CONFIG =================
+BATCH_SIZE = int(os.environ.get("UPLOAD_BATCH_SIZE", 50))            # rows per publish
+BATCH_MAX_WAIT = float(os.environ.get("UPLOAD_BATCH_MAX_WAIT", 5))   # seconds to wait for a full batch
+BATCH_MAX_BYTES = int(os.environ.get("UPLOAD_BATCH_MAX_BYTES", 64 * 1024))
+UPLOAD_FORMAT = os.environ.get("UPLOAD_FORMAT", "json")                # "json" or "compact" (payload_codec)
+UPLOAD_COMPRESS = os.environ.get("UPLOAD_COMPRESS", "auto")            # zlib the compact body: "1", "0" or "auto" (by link)
+UPLOAD_WINDOW = int(os.environ.get("UPLOAD_WINDOW", 8))                # QoS1 batches in flight
+UPLOAD_ACK_TIMEOUT = float(os.environ.get("UPLOAD_ACK_TIMEOUT", 30))   # resend if no PUBACK (s)
+
+# Outage backlog: drained behind the live readings (see catchup.py)
+BACKLOG_BATCH_SIZE = int(os.environ.get("UPLOAD_BACKLOG_BATCH_SIZE", 500))
+BACKLOG_RATE = int(os.environ.get("UPLOAD_BACKLOG_RATE", 16 * 1024))     # bytes/s, 0 = uncapped
+BACKLOG_WINDOW = int(os.environ.get("UPLOAD_BACKLOG_WINDOW", 2))         # backlog batches in flight
+LIVE_JUMP_ROWS = int(os.environ.get("UPLOAD_LIVE_JUMP_ROWS", 1000))      # live lane skips ahead past this
+
+# Brake events (see brake_events.py), one JSON object per publish
+UPLOAD_RAW = os.environ.get("UPLOAD_RAW", "1") == "1"                    # "0": events only, raw rows stay on the device (and its archive)
+EVENTS_WINDOW = int(os.environ.get("UPLOAD_EVENTS_WINDOW", 4))           # event messages in flight
+
+# ================= LINK CONFIG =================
+NETWORK_DB = os.environ.get("NETWORK_DB", os.path.join(BASE_PATH, "db/network_monitor.db"))  # device/network.py probes
+RECONNECT_MAX_DELAY = int(os.environ.get("UPLOAD_RECONNECT_MAX_DELAY", 120))                # seconds
+
+log = logsetup.setup("upload")
+
+# ================= METRICS =================
+METRICS_PORT = 9102                       # default, overridden by METRICS_PORT env
+BACKLOG_INTERVAL = 10                     # seconds between COUNT(*) backlog refreshes
+
+CONNECTS = metrics.counter("upload_mqtt_connects", "Successful MQTT (re)connects")
+DISCONNECTS = metrics.counter("upload_mqtt_disconnects", "MQTT disconnects")
+CONNECTED_GAUGE = metrics.gauge("upload_mqtt_connected", "1 while connected to AWS IoT")
+BACKLOG = metrics.gauge("upload_backlog_rows", "Rows not yet acknowledged by AWS IoT")
+EVENTS_UPLOADED = metrics.gauge("upload_events_acked_id", "Highest brake event id acknowledged by AWS IoT")
+CURSOR = metrics.gauge("upload_cursor_id", "Highest acknowledged row id")
+metrics.start_exporter(METRICS_PORT)
 
 RUNNING = True
 CONNECTED = False
+RESEND_PENDING = False
 
 # ================= SIGNAL HANDLING =================
 def shutdown_handler(signum, frame):
     global RUNNING
-    print("🛑 Shutdown signal received")
+    log.info("🛑 Shutdown signal received")
     RUNNING = False
 
 signal.signal(signal.SIGTERM, shutdown_handler)
 signal.signal(signal.SIGINT, shutdown_handler)
 
 # ================= FILE CHECK =================
-print("=== DEBUG START ===")
-print("DB exists:", os.path.exists(DB_PATH))
-print("CA exists:", os.path.exists(CA_PATH))
-print("CERT exists:", os.path.exists(CERT_PATH))
-print("KEY exists:", os.path.exists(KEY_PATH))
-print("=== DEBUG END ===")
+for name, path in (("DB", DB_PATH), ("CA", CA_PATH), ("CERT", CERT_PATH), ("KEY", KEY_PATH)):
+    log.debug("%s exists: %s", name, os.path.exists(path))
 
 for f in [DB_PATH, CA_PATH, CERT_PATH, KEY_PATH]:
     if not os.path.exists(f):
         raise FileNotFoundError(f"❌ Missing file: {f}")
 
-# ================= NETWORK CHECK =================
-def wait_for_network(host="8.8.8.8", port=53, timeout=3):
-    while True:
-        try:
-            socket.setdefaulttimeout(timeout)
-            socket.socket(socket.AF_INET, socket.SOCK_STREAM).connect((host, port))
-            return True
-        except Exception:
-            print("⚠️ Network not ready, waiting 5s...")
-            time.sleep(5)
-
-wait_for_network()
-
 # ================= MQTT CALLBACKS =================
 def on_connect(client, userdata, flags, rc, properties=None):
-    global CONNECTED
+    global CONNECTED, RESEND_PENDING
     if rc == 0:
         CONNECTED = True
-        print("✅ Connected to AWS IoT Core")
+        RESEND_PENDING = True
+        CONNECTS.inc()
+        CONNECTED_GAUGE.set(1)
+        log.info("✅ Connected to AWS IoT Core")
     else:
         CONNECTED = False
-        print("❌ MQTT connection failed, RC:", rc)
+        log.error("❌ MQTT connection failed, RC: %s", rc)
 
 def on_disconnect(client, userdata, rc, properties=None):
     global CONNECTED
     CONNECTED = False
-    print("⚠️ MQTT disconnected, reason:", rc)
+    DISCONNECTS.inc()
+    CONNECTED_GAUGE.set(0)
+    log.warning("⚠️ MQTT disconnected, reason: %s", rc)
+
+def on_publish(client, userdata, mid, *args):
+    # PUBACK received (runs on the paho network thread)
+    ack_router.on_ack(mid)
 
 # ================= MQTT CLIENT =================
 CLIENT_ID = f"Raspberry_pi"
@@ -78,6 +119,8 @@ CLIENT_ID = f"Raspberry_pi"
 client = mqtt.Client(client_id=CLIENT_ID, protocol=mqtt.MQTTv311)
 client.on_connect = on_connect
 client.on_disconnect = on_disconnect
+client.on_publish = on_publish
+client.max_inflight_messages_set(max(20, UPLOAD_WINDOW + BACKLOG_WINDOW))
 
 client.tls_set(
     ca_certs=CA_PATH,
@@ -86,81 +129,193 @@ client.tls_set(
     tls_version=ssl.PROTOCOL_TLSv1_2
 )
 client.tls_insecure_set(False)
-client.reconnect_delay_set(min_delay=2, max_delay=60)
+client.reconnect_delay_set(min_delay=2, max_delay=RECONNECT_MAX_DELAY)
+
+def publish_payload(payload):
+    return client.publish(TOPIC, payload, qos=1).mid
+
+# Live and backlog lanes publish over the one client; PUBACKs are routed by mid
+ack_router = AckRouter()
+live_publisher = ack_router.attach(
+    WindowedPublisher(publish_payload, window=UPLOAD_WINDOW, ack_timeout=UPLOAD_ACK_TIMEOUT)
+)
+backlog_publisher = ack_router.attach(
+    WindowedPublisher(publish_payload, window=BACKLOG_WINDOW, ack_timeout=UPLOAD_ACK_TIMEOUT)
+)
+event_publisher = ack_router.attach(
+    WindowedPublisher(publish_payload, window=EVENTS_WINDOW, ack_timeout=UPLOAD_ACK_TIMEOUT)
+)
+
+# Link quality from our own PUBACKs plus device/network.py probes
+link = LinkMonitor([live_publisher, backlog_publisher], probe_db=NETWORK_DB)
+error_backoff = Backoff(base=1, cap=30)
 
 # ================= CONNECT =================
 def connect_mqtt():
-    global client
-    while RUNNING and not CONNECTED:
+    # First connection only: from then on the paho network thread reconnects
+    # by itself, backing off up to RECONNECT_MAX_DELAY
+    connect_backoff = Backoff(base=2, cap=RECONNECT_MAX_DELAY)
+    while RUNNING:
         try:
             client.connect(ENDPOINT, 8883, keepalive=60)
             client.loop_start()
-            time.sleep(2)
+            return
         except Exception as e:
-            print("❌ MQTT connect failed:", e)
-            time.sleep(0.5)
+            delay = connect_backoff.next_delay()
+            log.error("❌ MQTT connect failed: %s | retrying in %.0fs", e, delay, extra=logsetup.every(60))
+            time.sleep(delay)
 
 connect_mqtt()
 
 # ================= DATABASE =================
-conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-cursor = conn.cursor()
+conn = storage.connect(DB_PATH, "pressure")
+last_uploaded_id = init_cursor(conn, SINK)
+log.info("Upload cursor [%s] at id=%d", SINK, last_uploaded_id)
+CURSOR.set(last_uploaded_id)
+backlog_checked_at = 0.0
+
+# ================= PAYLOAD =================
+def row_to_payload(row):
+    id_, bp, fp, cr, bc, created_at = row
+    return {
+        "id": id_,
+        "bp": bp,
+        "fp": fp,
+        "cr": cr,
+        "bc": bc,
+        "timestamp": str(created_at)
+    }
+
+def row_to_reading(row):
+    id_, bp, fp, cr, bc, created_at = row
+    return id_, timestamp_to_ms(created_at), (bp, fp, cr, bc)
+
+def build_payload(rows, max_rows, max_bytes):
+    if UPLOAD_FORMAT == "compact":
+        compress = link.profile.compress if UPLOAD_COMPRESS == "auto" else UPLOAD_COMPRESS == "1"
+        return build_compact_batch(
+            rows, row_to_reading, storage.LAYOUTS["pressure"]["columns"],
+            max_rows, max_bytes, scale=100, compress=compress
+        )
+    return build_batch(rows, row_to_payload, max_rows, max_bytes)
+
+uploader = CatchUpUploader(
+    conn, SINK, "pressure", build_payload, live_publisher, backlog_publisher,
+    BATCH_SIZE, BATCH_MAX_BYTES, BATCH_MAX_WAIT,
+    backlog_batch_size=BACKLOG_BATCH_SIZE, backlog_rate=BACKLOG_RATE, jump_rows=LIVE_JUMP_ROWS,
+    archive_dir=archive_dir_for(DB_PATH)
+)
+metrics.gauge("upload_inflight_batches", "Published batches awaiting PUBACK").set_function(lambda: len(uploader))
+log.info("Live lane after id=%d, backlog lane after id=%d", uploader.live.after_id, uploader.backlog.after_id)
+if not UPLOAD_RAW:
+    log.info("UPLOAD_RAW=0: only brake events are uploaded")
+
+def skip_raw():
+    """UPLOAD_RAW=0: count stored rows as delivered so retention archives them."""
+    global last_uploaded_id
+    max_id = conn.execute(f"SELECT MAX(id) FROM {storage.TABLE}").fetchone()[0] or 0
+    if max_id > last_uploaded_id:
+        last_uploaded_id = record_acked(conn, SINK, last_uploaded_id + 1, max_id)
+        CURSOR.set(last_uploaded_id)
+
+# ================= BRAKE EVENTS =================
+# Own cursor: event ids are brake_events ids, not reading ids
+events_after_id = init_cursor(conn, EVENTS_SINK, table=storage.EVENT_TABLE)
+EVENTS_UPLOADED.set(events_after_id)
+log.info("Event cursor [%s] at id=%d", EVENTS_SINK, events_after_id)
+
+def event_payload(event_id, record):
+    # Lambda keeps the whole record in brake_events, deduplicated on (device_id, event_id)
+    return json.dumps(
+        {**json.loads(record), "event_id": event_id, "device_id": CLIENT_ID},
+        separators=(",", ":")
+    )
+
+def step_events():
+    """Ack and send brake events; return the number sent."""
+    global events_after_id
+    acked_id = event_publisher.collect_acked()
+    if acked_id is not None:
+        advance_cursor(conn, EVENTS_SINK, acked_id)
+        EVENTS_UPLOADED.set(acked_id)
+
+    sent = 0
+    if not event_publisher.full():
+        for event_id, record in storage.fetch_events(conn, events_after_id, EVENTS_WINDOW - len(event_publisher)):
+            event_publisher.send(event_payload(event_id, record), event_id)
+            events_after_id = event_id
+            sent += 1
+    return sent
 
 # ================= MAIN LOOP =================
 try:
     while RUNNING:
+        link.set_connected(CONNECTED)
+        link_state = link.state
+        if link.update() != link_state:
+            uploader.adapt(link.profile)
+            log.info(
+                "📶 Link %s → %s | rtt=%.2fs failures=%.0f%% throughput=%.0f B/s",
+                link_state, link.state, link.rtt or 0.0, link.failure_ratio * 100, link.throughput
+            )
+
         if not CONNECTED:
-            print("⚠️ Not connected to MQTT, retrying...")
-            connect_mqtt()
-            time.sleep(0.5)
+            # paho is reconnecting in the background with its own backoff
+            log.warning("⚠️ Not connected to MQTT, waiting for reconnect...", extra=logsetup.every(60))
+            time.sleep(1)
             continue
 
-        cursor.execute("""
-            SELECT id, bp_pressure, fp_pressure, cr_pressure, bc_pressure, created_at
-            FROM brake_pressure_log
-            WHERE uploaded = 0
-            ORDER BY id ASC
-            LIMIT 1
-        """)
-        row = cursor.fetchone()
-
-        if not row:
-            time.sleep(0.5)
-            continue
+        try:
+            if RESEND_PENDING:
+                RESEND_PENDING = False
+                ack_router.reset()
+                resent = uploader.resend_unacked() + event_publisher.resend_unacked()
+                if resent:
+                    log.info("🔁 Resent %d unacked batch(es) after reconnect", resent)
+            else:
+                uploader.resend_unacked(only_expired=True)
+                event_publisher.resend_unacked(only_expired=True)
 
-        id_, bp, fp, cr, bc, created_at = row
+            # Acked batches become acked id ranges; the cursor follows the contiguous prefix
+            acked_id = uploader.collect_acked()
+            if acked_id is not None:
+                last_uploaded_id = acked_id
+                CURSOR.set(last_uploaded_id)
+                log.info(
+                    "✅ Acked through id=%d | live after id=%d backlog after id=%d | in flight=%d rtt=%.3fs",
+                    last_uploaded_id, uploader.live.after_id, uploader.backlog.after_id,
+                    len(uploader), live_publisher.mean_rtt(),
+                    extra=logsetup.every(60)
+                )
 
-        payload = {
-            "id": id_,
-            "bp": bp,
-            "fp": fp,
-            "cr": cr,
-            "bc": bc,
-            "timestamp": str(created_at)
-        }
+            if time.monotonic() - backlog_checked_at >= BACKLOG_INTERVAL:
+                if not UPLOAD_RAW:
+                    skip_raw()
+                BACKLOG.set(pending_count(conn, SINK))
+                backlog_checked_at = time.monotonic()
 
-        try:
-            result = client.publish(TOPIC, json.dumps(payload), qos=1)
-            result.wait_for_publish()
-            if result.rc == mqtt.MQTT_ERR_SUCCESS:
-                cursor.execute("UPDATE brake_pressure_log SET uploaded = 1 WHERE id = ?", (id_,))
-                conn.commit()
-                print(f'✅ Uploaded | id={id_} BP={bp} FP={fp} CR={cr} BC={bc} timestamp="{created_at}"')
-                print(f'📤 AWS IoT Sent {payload}')
-            else:
-                print("❌ Publish failed, rc =", result.rc)
+            sent = step_events()
+            if UPLOAD_RAW:
+                sent += uploader.step()
+            error_backoff.reset()
+            if sent:
+                log.debug(
+                    "📤 Sent %d rows | live after id=%d backlog after id=%d",
+                    sent, uploader.live.after_id, uploader.backlog.after_id
+                )
+                continue
+            time.sleep(0.05 if len(uploader) else 0.5)
         except Exception as e:
-            print("❌ Error publishing:", e)
-            CONNECTED = False  # Force reconnect
-
-        time.sleep(1)
+            delay = error_backoff.next_delay()
+            log.error("❌ Error publishing: %s | retrying in %.1fs", e, delay, extra=logsetup.every(60))
+            time.sleep(delay)
 
 finally:
-    print("🔻 Shutting down cleanly...")
+    log.info("🔻 Shutting down cleanly...")
     try:
         client.loop_stop()
         client.disconnect()
     except Exception:
         pass
     conn.close()
-    print("✅ Shutdown complete")
+    log.info("✅ Shutdown complete")
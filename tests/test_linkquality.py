@@ -0,0 +1,35 @@
+import pytest
+
+from linkquality import DEGRADED, DOWN, GOOD, POOR, PROBE_RTT_DEGRADED, PROBE_RTT_POOR, LinkMonitor
+
+
+def _monitor(rtt=None, failure_ratio=0.0, probe=None):
+    monitor = LinkMonitor([])
+    monitor.set_connected(True)
+    monitor.rtt = rtt
+    monitor.failure_ratio = failure_ratio
+    monitor.probe = probe
+    return monitor
+
+
+def test_disconnected_is_down():
+    monitor = _monitor()
+    monitor.set_connected(False)
+    assert monitor._classify() == DOWN
+
+
+@pytest.mark.parametrize("rtt, state", [(0.2, GOOD), (1.5, DEGRADED), (5.0, POOR)])
+def test_puback_rtt(rtt, state):
+    assert _monitor(rtt=rtt)._classify() == state
+
+
+@pytest.mark.parametrize("probe_rtt, state", [
+    (0.3, GOOD), (PROBE_RTT_DEGRADED, DEGRADED), (PROBE_RTT_POOR, POOR), (None, GOOD),
+])
+def test_slow_lossless_probes(probe_rtt, state):
+    assert _monitor(probe=(probe_rtt, 0.0, 6))._classify() == state
+
+
+def test_probe_failures():
+    assert _monitor(probe=(0.3, 1 / 6, 6))._classify() == DEGRADED
+    assert _monitor(probe=(None, 1.0, 6))._classify() == POOR
@@ -0,0 +1,139 @@
+import base64
+import json
+import sys
+import types
+
+import pytest
+
+from payload_codec import (
+    FLAG_ZLIB, _get_svarint, _get_uvarint, _put_svarint, _put_uvarint,
+    decode_batch, encode_batch, is_compact, ms_to_timestamp, timestamp_to_ms,
+)
+
+try:
+    import pg8000  # noqa: F401
+except ImportError:
+    # parse_event never touches the database driver
+    sys.modules["pg8000"] = types.ModuleType("pg8000")
+import lambda_function
+
+CHANNELS = ("bp_pressure", "fp_pressure", "cr_pressure", "bc_pressure")
+START_MS = timestamp_to_ms("2024-01-01 00:00:00")
+
+
+@pytest.mark.parametrize("n", [0, 1, 127, 128, 300, 16383, 16384, 2 ** 35])
+def test_uvarint_round_trip(n):
+    out = bytearray()
+    _put_uvarint(out, n)
+    assert _get_uvarint(out, 0) == (n, len(out))
+
+
+def test_uvarint_sizes():
+    for n, size in ((0, 1), (127, 1), (128, 2), (16383, 2), (16384, 3)):
+        out = bytearray()
+        _put_uvarint(out, n)
+        assert len(out) == size
+
+
+@pytest.mark.parametrize("n", [0, 1, -1, 63, -64, 64, -65, 10 ** 9, -(10 ** 9)])
+def test_svarint_round_trip(n):
+    out = bytearray()
+    _put_svarint(out, n)
+    assert _get_svarint(out, 0) == (n, len(out))
+
+
+def test_svarint_small_magnitudes_take_one_byte():
+    for n in range(-64, 64):
+        out = bytearray()
+        _put_svarint(out, n)
+        assert len(out) == 1
+
+
+def _rows():
+    # Rising and falling values (negative deltas), id gaps, out-of-order
+    # timestamps and NULL channels
+    return [
+        (1000, START_MS, [5.0, 5.0, 5.0, 0.0]),
+        (1001, START_MS + 300, [3.25, None, 5.0, 2.5]),
+        (1005, START_MS + 250, [None, None, None, None]),
+        (1006, START_MS + 900, [5.12, 4.99, None, 0.0]),
+        (990, START_MS + 1200, [-1.5, 0.01, 4.98, None]),
+    ]
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_round_trip(compress):
+    blob = encode_batch(_rows(), CHANNELS, scale=100, device_id="pressure01", compress=compress)
+    assert is_compact(blob)
+    assert bool(blob[3] & FLAG_ZLIB) == compress
+
+    decoded = decode_batch(blob)
+    assert decoded["device_id"] == "pressure01"
+    assert decoded["channels"] == list(CHANNELS)
+    assert len(decoded["readings"]) == len(_rows())
+    for (id_, ts_ms, values), got in zip(_rows(), decoded["readings"]):
+        assert got["id"] == id_
+        assert got["ts_ms"] == ts_ms
+        assert [got[name] for name in CHANNELS] == values
+
+
+def test_round_trip_without_scale_keeps_integers():
+    rows = [(1, START_MS, [12000, -3]), (2, START_MS + 5, [11990, None])]
+    decoded = decode_batch(encode_batch(rows, ("a", "b")))
+    assert [(r["a"], r["b"]) for r in decoded["readings"]] == [(12000, -3), (11990, None)]
+    assert isinstance(decoded["readings"][0]["a"], int)
+
+
+def test_more_than_eight_channels():
+    names = [f"ch{i}" for i in range(11)]
+    values = [i if i % 3 else None for i in range(11)]
+    decoded = decode_batch(encode_batch([(7, START_MS, values)], names))
+    assert [decoded["readings"][0][name] for name in names] == values
+
+
+def test_empty_batch():
+    decoded = decode_batch(encode_batch([], CHANNELS, device_id="d"))
+    assert decoded == {"device_id": "d", "channels": list(CHANNELS), "readings": []}
+
+
+def test_bad_header():
+    blob = bytearray(encode_batch(_rows(), CHANNELS))
+    blob[2] = 99
+    with pytest.raises(ValueError):
+        decode_batch(bytes(blob))
+    assert not is_compact(b'{"bp_pressure": 1}')
+
+
+def test_timestamps():
+    assert ms_to_timestamp(timestamp_to_ms("2024-02-29 23:59:59")) == "2024-02-29 23:59:59"
+    assert timestamp_to_ms(1.5) == 1500
+
+
+# ---------------- LAMBDA ----------------
+@pytest.mark.parametrize("wrap", ["bytes", "base64"])
+def test_lambda_parse_event(wrap):
+    blob = encode_batch(_rows(), CHANNELS, scale=100, device_id="pressure01", compress=True)
+    event = blob if wrap == "bytes" else {"data": base64.b64encode(blob).decode()}
+
+    readings = lambda_function.parse_event(event)
+    assert len(readings) == len(_rows())
+    first = readings[1]
+    assert first["bp_pressure"] == 3.25 and first["fp_pressure"] is None
+    assert first["created_at"] == ms_to_timestamp(START_MS + 300)
+    assert first["id"] == 1001 and first["device_id"] == "pressure01"
+
+    row = lambda_function.row_values(first)
+    assert row[:5] == (first["created_at"], 3.25, None, 5.0, 2.5)
+
+
+def test_lambda_parse_event_json():
+    reading = {"bp_pressure": 4.2, "created_at": "2024-01-01 00:00:00"}
+    assert lambda_function.parse_event(json.dumps(reading)) == [reading]
+    assert lambda_function.parse_event([reading, reading]) == [reading, reading]
+
+
+def test_lambda_rejects_unknown_channels():
+    blob = encode_batch([(1, START_MS, [12000, 8000, 9000, 400])], ("BP_raw", "BC_raw", "FP_raw", "CR_raw"))
+    with pytest.raises(ValueError, match="unknown channel"):
+        lambda_function.parse_event(blob)
+    assert lambda_function.lambda_handler(blob, None)["statusCode"] == 400
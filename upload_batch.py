@@ -0,0 +1,115 @@
+import json
+import time
+
+from payload_codec import encode_batch
+
+# ---------------- CONFIG ----------------
+AWS_IOT_MAX_PAYLOAD = 128 * 1024      # AWS IoT Core message size limit (bytes)
+PAYLOAD_HEADROOM = 1024               # keep clear of the hard limit
+
+
+# ---------------- BATCH BUILDER ----------------
+def build_batch(rows, to_dict, max_rows, max_bytes=AWS_IOT_MAX_PAYLOAD - PAYLOAD_HEADROOM):
+    """Pack rows into one JSON array payload.
+
+    Rows are taken in order until either ``max_rows`` or ``max_bytes`` is
+    reached. Returns ``(payload_json, rows_included)``; the first row is
+    always included so an oversized single reading cannot stall the queue.
+    """
+    items = []
+    included = []
+    size = 2  # "[]"
+
+    for row in rows[:max_rows]:
+        item = json.dumps(to_dict(row))
+        extra = len(item) + (1 if items else 0)  # "," separator
+
+        if items and size + extra > max_bytes:
+            break
+
+        items.append(item)
+        included.append(row)
+        size += extra
+
+    return "[" + ",".join(items) + "]", included
+
+
+def build_compact_batch(rows, to_reading, channels, max_rows,
+                        max_bytes=AWS_IOT_MAX_PAYLOAD - PAYLOAD_HEADROOM,
+                        scale=1, device_id="", compress=False):
+    """Like build_batch() but encodes with payload_codec.
+
+    ``to_reading`` maps a row to ``(id, ts_ms, values)``. The batch is
+    halved until it fits ``max_bytes``.
+    """
+    rows = rows[:max_rows]
+    while True:
+        payload = encode_batch(
+            [to_reading(row) for row in rows], channels,
+            scale=scale, device_id=device_id, compress=compress
+        )
+        if len(payload) <= max_bytes or len(rows) <= 1:
+            return payload, rows
+        rows = rows[:len(rows) // 2]
+
+
+# ---------------- BATCH TIMER ----------------
+class BatchTimer:
+    """Decide when a partially filled batch has waited long enough."""
+
+    def __init__(self, batch_size, max_wait):
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self._pending_since = None
+
+    def ready(self, pending, now):
+        if pending == 0:
+            self._pending_since = None
+            return False
+
+        if pending >= self.batch_size:
+            return True
+
+        if self._pending_since is None:
+            self._pending_since = now
+
+        return now - self._pending_since >= self.max_wait
+
+    def reset(self):
+        self._pending_since = None
+
+
+# ---------------- BANDWIDTH CAP ----------------
+class TokenBucket:
+    """Average byte-rate limit for background traffic.
+
+    Holds up to ``burst`` bytes of credit, refilled at ``rate`` bytes per
+    second. A payload larger than ``burst`` may go once the bucket is full
+    and leaves it in debt, so the long-run rate still holds. ``rate <= 0``
+    disables the cap.
+    """
+
+    def __init__(self, rate, burst=None, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(rate, 0)
+        self.clock = clock
+        self._tokens = self.burst
+        self._updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self, nbytes):
+        """Seconds until ``nbytes`` may be sent (0 if now)."""
+        if self.rate <= 0:
+            return 0.0
+        self._refill()
+        missing = min(nbytes, self.burst) - self._tokens
+        return missing / self.rate if missing > 0 else 0.0
+
+    def consume(self, nbytes):
+        if self.rate > 0:
+            self._refill()
+            self._tokens -= nbytes
@@ -0,0 +1,195 @@
+# ---------------- SCHEMA ----------------
+# One row per upload destination. last_id is the highest brake_pressure_log id
+# the sink has acknowledged; everything above it is still pending. Cursors
+# over other tables are named "<table>:<sink>" (see table_sink) and are
+# left out wherever reading ids are meant (READINGS_SINKS).
+CURSOR_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS upload_cursor (
+    sink TEXT PRIMARY KEY,
+    last_id INTEGER NOT NULL DEFAULT 0,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+# Id ranges above the cursor that a sink has already acknowledged. Batches
+# can be acked out of id order (live readings go out ahead of an outage
+# backlog); once the gap below a range is filled the cursor moves through
+# it and the range is deleted. Ranges are disjoint and never adjacent.
+RANGES_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS upload_ranges (
+    sink TEXT NOT NULL,
+    first_id INTEGER NOT NULL,
+    last_id INTEGER NOT NULL,
+    PRIMARY KEY (sink, first_id)
+)
+"""
+
+
+READINGS_SINKS = "sink NOT LIKE '%:%'"
+
+
+def table_sink(table, sink):
+    return f"{table}:{sink}"
+
+
+# ---------------- MIGRATION ----------------
+def _legacy_position(conn, table):
+    columns = [col[1] for col in conn.execute(f"PRAGMA table_info({table})")]
+    if not columns:
+        return 0
+
+    max_id = conn.execute(f"SELECT MAX(id) FROM {table}").fetchone()[0] or 0
+    if "uploaded" not in columns:
+        return 0
+
+    # Everything below the oldest row still flagged 0 counts as delivered.
+    # Rows flagged 1 above that point are sent again (at-least-once).
+    first_pending = conn.execute(
+        f"SELECT MIN(id) FROM {table} WHERE uploaded = 0 OR uploaded IS NULL"
+    ).fetchone()[0]
+
+    if first_pending is None:
+        return max_id
+    return first_pending - 1
+
+
+def init_cursor(conn, sink, table="brake_pressure_log"):
+    """Create the cursor for ``sink`` if needed and return its last_id.
+
+    The first time a sink is seen its position is migrated from the old
+    per-row ``uploaded`` flag, so existing devices do not resend history.
+    """
+    conn.execute(CURSOR_TABLE_SQL)
+    conn.execute(RANGES_TABLE_SQL)
+
+    row = conn.execute(
+        "SELECT last_id FROM upload_cursor WHERE sink = ?", (sink,)
+    ).fetchone()
+    if row is not None:
+        conn.commit()
+        return row[0]
+
+    last_id = _legacy_position(conn, table)
+    conn.execute(
+        "INSERT INTO upload_cursor (sink, last_id) VALUES (?, ?)", (sink, last_id)
+    )
+    conn.commit()
+    return last_id
+
+
+# ---------------- CURSOR ACCESS ----------------
+def get_cursor(conn, sink):
+    row = conn.execute(
+        "SELECT last_id FROM upload_cursor WHERE sink = ?", (sink,)
+    ).fetchone()
+    return row[0] if row else 0
+
+
+def advance_cursor(conn, sink, last_id):
+    """Move the sink's cursor forward to ``last_id`` (never backwards)."""
+    conn.execute(
+        """
+        UPDATE upload_cursor
+        SET last_id = ?, updated_at = CURRENT_TIMESTAMP
+        WHERE sink = ? AND last_id < ?
+        """,
+        (last_id, sink, last_id),
+    )
+    conn.commit()
+
+
+def record_acked(conn, sink, first_id, last_id):
+    """Mark ids ``first_id..last_id`` delivered to ``sink``; return the cursor.
+
+    The range is merged with any acknowledged range it touches. If nothing
+    is pending below it the cursor moves up through it instead, so in the
+    common in-order case this is still a single-row update.
+    """
+    with conn:
+        touching = conn.execute(
+            """
+            SELECT first_id, last_id FROM upload_ranges
+            WHERE sink = ? AND first_id <= ? AND last_id >= ?
+            """,
+            (sink, last_id + 1, first_id - 1),
+        ).fetchall()
+        for lo, hi in touching:
+            first_id, last_id = min(first_id, lo), max(last_id, hi)
+        conn.executemany(
+            "DELETE FROM upload_ranges WHERE sink = ? AND first_id = ?",
+            [(sink, lo) for lo, _ in touching],
+        )
+
+        cursor = get_cursor(conn, sink)
+        if first_id > cursor + 1:
+            conn.execute(
+                "INSERT INTO upload_ranges (sink, first_id, last_id) VALUES (?, ?, ?)",
+                (sink, first_id, last_id),
+            )
+        elif last_id > cursor:
+            cursor = last_id
+            conn.execute(
+                """
+                UPDATE upload_cursor
+                SET last_id = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE sink = ?
+                """,
+                (cursor, sink),
+            )
+            conn.execute(
+                "DELETE FROM upload_ranges WHERE sink = ? AND last_id <= ?",
+                (sink, cursor),
+            )
+    return cursor
+
+
+def acked_ranges(conn, sink):
+    """Acknowledged ``(first_id, last_id)`` ranges above the cursor, in order."""
+    return conn.execute(
+        "SELECT first_id, last_id FROM upload_ranges WHERE sink = ? ORDER BY first_id",
+        (sink,),
+    ).fetchall()
+
+
+def highest_acked(conn, sink):
+    """Highest id the sink has acknowledged, in the cursor or in a range."""
+    row = conn.execute(
+        "SELECT MAX(last_id) FROM upload_ranges WHERE sink = ?", (sink,)
+    ).fetchone()
+    return max(get_cursor(conn, sink), row[0] or 0)
+
+
+def next_gap(conn, sink, after_id=0):
+    """First run of unacknowledged ids above ``after_id``.
+
+    Returns ``(after, before)``: ids with ``after < id < before`` are
+    pending. ``before`` is None when the gap is open-ended.
+    """
+    position = max(after_id, get_cursor(conn, sink))
+    for first_id, last_id in conn.execute(
+        """
+        SELECT first_id, last_id FROM upload_ranges
+        WHERE sink = ? AND last_id > ?
+        ORDER BY first_id
+        """,
+        (sink, position),
+    ):
+        if first_id > position + 1:
+            return position, first_id
+        position = last_id
+    return position, None
+
+
+def pending_count(conn, sink, table="brake_pressure_log"):
+    last_id = get_cursor(conn, sink)
+    # Rows above the cursor, less those inside acked ranges (one rowid
+    # range scan per range, so still cheap during a long backlog)
+    return conn.execute(
+        f"""
+        SELECT (SELECT COUNT(*) FROM {table} WHERE id > ?)
+             - (SELECT COUNT(*) FROM upload_ranges AS r
+                JOIN {table} AS log ON log.id BETWEEN r.first_id AND r.last_id
+                WHERE r.sink = ?)
+        """,
+        (last_id, sink),
+    ).fetchone()[0]